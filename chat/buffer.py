@@ -0,0 +1,101 @@
+import asyncio
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import DataError, IntegrityError
+
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+
+@database_sync_to_async
+def save_messages(messages):
+    ChatMessage.objects.bulk_create(messages)
+
+
+class MessageBuffer:
+    """Collects chat messages in memory and writes them with one bulk_create every `size` messages or `interval` seconds.
+
+    Messages received while a batch is being written wait for the next one, so only one write runs at a time however
+    fast they arrive. A failed write keeps its batch for the next attempt, up to `max_pending` messages in all; past
+    that the oldest messages are dropped so a database outage cannot exhaust memory. A batch the database rejects
+    for its data is split until only the offending messages are left, and those are dropped instead of retried.
+    """
+
+    def __init__(self, size=None, interval=None, max_pending=None):
+        self.size = size or settings.CHAT_FLUSH_SIZE
+        self.interval = interval if interval is not None else settings.CHAT_FLUSH_INTERVAL_MS / 1000
+        self.max_pending = max_pending or settings.CHAT_MAX_PENDING_MESSAGES
+        self.pending = []
+        self.flusher = None
+        self.wakeup = None
+        self.lock = None
+
+    def add(self, message):
+        """Queues an unsaved ChatMessage, starting the flushing task on the running event loop if needed."""
+        self.pending.append(message)
+        if len(self.pending) > self.max_pending:
+            dropped = len(self.pending) - self.max_pending
+            del self.pending[:dropped]
+            logger.warning("Chat message buffer full, dropped %s unsaved messages", dropped)
+        if self.flusher is None or self.flusher.done():
+            self.wakeup = asyncio.Event()
+            self.lock = asyncio.Lock()
+            self.flusher = asyncio.get_running_loop().create_task(self.run())
+        if len(self.pending) >= self.size:
+            self.wakeup.set()
+
+    async def run(self):
+        """Flushes until the buffer is empty, then exits; the next add() starts it again."""
+        while self.pending:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Writes every pending message, `size` at a time, after any write already running."""
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            await self.write_pending()
+
+    async def write_pending(self):
+        while self.pending:
+            batch, self.pending = self.pending[:self.size], self.pending[self.size:]
+            if not await self.save(batch):
+                return
+
+    async def save(self, batch):
+        """Saves a batch, halving it on data errors; on any other error puts what is unsaved back and returns False."""
+        parts = [batch]
+        while parts:
+            part = parts.pop()
+            try:
+                await save_messages(part)
+            except (DataError, IntegrityError):
+                if len(part) == 1:
+                    logger.exception("Dropped a chat message in room %.100r that the database rejected", part[0].room)
+                    continue
+                middle = len(part) // 2
+                parts += [part[middle:], part[:middle]]
+            except Exception:
+                unsaved = [message for part in [part, *reversed(parts)] for message in part]
+                logger.exception("Could not save %s chat messages, retrying with the next batch", len(unsaved))
+                self.pending[:0] = unsaved
+                return False
+        return True
+
+message_buffer = None
+
+
+def get_message_buffer():
+    """The process-wide buffer, created on first use so it reads the settings in effect at that time."""
+    global message_buffer
+    if message_buffer is None:
+        message_buffer = MessageBuffer()
+    return message_buffer
@@ -1,41 +1,145 @@
-import json
+import asyncio
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from .buffer import get_message_buffer
+from .history import get_history
+from .membership import can_join
+from .presence import get_presence, member_of, schedule_broadcast, usernames
+from .protocol import DECODE_ERRORS, decode, encode, encode_event, event_payload, join_payloads, negotiate
+from .models import ChatMessage
+
+
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_name = self.scope['url_route']['kwargs']['room_name']
         self.room_group_name = 'chat_%s' % self.room_name
+        # With a window, messages are sent in one JSON array frame per window instead of one frame each.
+        self.batch_window = settings.CHAT_BATCH_WINDOW_MS / 1000
+        self.pending_frames = []
+        self.batch_task = None
+        self.presence_member = None
+        self.heartbeat_task = None
+        # msgpack binary frames when the client asks for that subprotocol, JSON text frames otherwise.
+        self.protocol = negotiate(self.scope.get('subprotocols', []))
+
+        if not await can_join(self.scope.get('user'), self.room_name):
+            await self.close()
+            return
         
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
         
-        await self.accept()
+        await self.accept(subprotocol=self.protocol)
+
+        # The room's recent messages in one frame, read from the history backend rather than the database.
+        backlog = await get_history().recent(self.room_name)
+        if backlog:
+            await self.send_payload(encode({'history': backlog}, self.protocol))
+
+        await self.join_presence()
 
     
     async def disconnect(self, close_code):
+        if self.batch_task is not None:
+            self.batch_task.cancel()
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+        if self.presence_member is not None:
+            await get_presence().leave(self.room_name, self.presence_member)
+            schedule_broadcast(self.channel_layer, self.room_group_name, self.room_name)
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
         
     
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message = text_data_json['message']
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            text_data_json = decode(text_data, bytes_data)
+        except DECODE_ERRORS:
+            return
+        message = text_data_json.get('message') if isinstance(text_data_json, dict) else None
+        # msgpack frames can carry bytes, numbers or maps; only text is saved and relayed.
+        if not isinstance(message, str):
+            return
+
+        # Saved in the background with the next batch, so a busy room never waits on the database.
+        user = self.scope.get('user')
+        get_message_buffer().add(ChatMessage(
+            room=self.room_name,
+            user_id=user.id if user is not None and user.is_authenticated else None,
+            message=message,
+        ))
+        await get_history().append(self.room_name, {'message': message})
         
         await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'chat_message',
-                'message' : message
+                # Encoded once here and sent as it is by every member, however many there are.
+                **encode_event({'message': message}),
             }
         )
     
     async def chat_message(self, event):
-        message = event['message']
+        if 'payload' in event:
+            payload = event_payload(event, self.protocol)
+        else:
+            # Events sent with a plain message, as from code outside this consumer.
+            payload = encode({'message': event['message']}, self.protocol)
+        if not self.batch_window:
+            await self.send_payload(payload)
+            return
+
+        self.pending_frames.append(payload)
+        if len(self.pending_frames) >= settings.CHAT_BATCH_MAX_MESSAGES:
+            if self.batch_task is not None:
+                self.batch_task.cancel()
+                self.batch_task = None
+            await self.send_pending_frames()
+        elif self.batch_task is None:
+            self.batch_task = asyncio.get_running_loop().create_task(self.send_after_window())
+
+    async def send_after_window(self):
+        await asyncio.sleep(self.batch_window)
+        self.batch_task = None
+        await self.send_pending_frames()
+
+    async def send_pending_frames(self):
+        """Sends the messages collected in this window as one array frame, joining their encoded payloads as they are."""
+        frames, self.pending_frames = self.pending_frames, []
+        if frames:
+            await self.send_payload(join_payloads(frames, self.protocol))
+
+    async def send_payload(self, payload):
+        if isinstance(payload, bytes):
+            await self.send(bytes_data=payload)
+        else:
+            await self.send(text_data=payload)
+
+    async def join_presence(self):
+        """Marks the user online in the room and sends this connection who else is."""
+        user = self.scope.get('user')
+        backend = get_presence()
+        if user is not None and user.is_authenticated:
+            self.presence_member = member_of(user.username, self.channel_name)
+            await backend.heartbeat(self.room_name, self.presence_member)
+            self.heartbeat_task = asyncio.get_running_loop().create_task(self.send_heartbeats())
+            # The rest of the room hears about it in the next throttled presence event.
+            schedule_broadcast(self.channel_layer, self.room_group_name, self.room_name)
+        try:
+            online = usernames(await backend.members(self.room_name))
+        except Exception:
+            return
+        await self.send_payload(encode({'presence': {'count': len(online), 'online': online}}, self.protocol))
 
-        await self.send(text_data = json.dumps({
-            'message' : message
-        }))
+    async def send_heartbeats(self):
+        while True:
+            await asyncio.sleep(settings.CHAT_PRESENCE_HEARTBEAT_SECONDS)
+            await get_presence().heartbeat(self.room_name, self.presence_member)
 
+    async def presence(self, event):
+        await self.send_payload(event_payload(event, self.protocol))
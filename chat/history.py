@@ -0,0 +1,84 @@
+import json
+import logging
+from collections import defaultdict, deque
+
+import redis.asyncio
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryHistory:
+    """Keeps the last `size` messages of each room in this process; for tests and single-process development."""
+
+    def __init__(self, size, **options):
+        self.rooms = defaultdict(lambda: deque(maxlen=size))
+
+    async def append(self, room, entry):
+        self.rooms[room].append(entry)
+
+    async def recent(self, room):
+        return list(self.rooms.get(room, ()))
+
+    async def clear(self, room):
+        self.rooms.pop(room, None)
+
+
+class RedisHistory:
+    """Keeps the last `size` messages of each room in a capped Redis list shared by every worker.
+
+    A Redis error only costs the backlog: appends are dropped and new connections get an empty history.
+    """
+
+    def __init__(self, size, location, timeout=None, **options):
+        self.size = size
+        self.location = location
+        self.timeout = timeout
+        self.client = None
+
+    def key(self, room):
+        return f"chat:history:{room}"
+
+    def get_client(self):
+        if self.client is None:
+            self.client = redis.asyncio.Redis.from_url(self.location)
+        return self.client
+
+    async def append(self, room, entry):
+        key = self.key(room)
+        try:
+            async with self.get_client().pipeline(transaction=False) as pipe:
+                pipe.rpush(key, json.dumps(entry))
+                pipe.ltrim(key, -self.size, -1)
+                if self.timeout:
+                    pipe.expire(key, self.timeout)
+                await pipe.execute()
+        except Exception:
+            logger.warning("Could not add a message to the history of chat room %s", room, exc_info=True)
+
+    async def recent(self, room):
+        try:
+            entries = await self.get_client().lrange(self.key(room), 0, -1)
+        except Exception:
+            logger.warning("Could not read the history of chat room %s", room, exc_info=True)
+            return []
+        return [json.loads(entry) for entry in entries]
+
+    async def clear(self, room):
+        try:
+            await self.get_client().delete(self.key(room))
+        except Exception:
+            logger.warning("Could not clear the history of chat room %s", room, exc_info=True)
+
+
+history = None
+
+
+def get_history():
+    """The backend configured by settings.CHAT_HISTORY, created on first use."""
+    global history
+    if history is None:
+        options = {key.lower(): value for key, value in settings.CHAT_HISTORY.items()}
+        history = import_string(options.pop('backend'))(**options)
+    return history
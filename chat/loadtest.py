@@ -0,0 +1,226 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from autobahn.asyncio.websocket import WebSocketClientFactory, WebSocketClientProtocol
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.test import override_settings
+
+from learningapp.benchmarking import summarize
+from . import buffer, history, presence
+from .protocol import decode, encode
+
+# Load-test messages are "loadtest <sender> <sequence> <perf_counter when sent>", so receivers can time them.
+MARKER = 'loadtest'
+
+
+def rss_bytes(pid=None):
+    """Resident memory of a process (this one by default) in bytes, or None where /proc is not available."""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+class CommunicatorClient:
+    """A simulated client driving the consumer in this process through channels' WebsocketCommunicator."""
+
+    def __init__(self, application, path, protocol=None):
+        self.communicator = WebsocketCommunicator(application, path, subprotocols=[protocol] if protocol else None)
+        self.protocol = protocol
+
+    async def connect(self, timeout):
+        connected, _ = await self.communicator.connect(timeout)
+        if not connected:
+            raise ConnectionError('the consumer rejected the connection')
+
+    async def send(self, data):
+        payload = encode(data, self.protocol)
+        if isinstance(payload, bytes):
+            await self.communicator.send_to(bytes_data=payload)
+        else:
+            await self.communicator.send_to(text_data=payload)
+
+    async def receive(self, timeout):
+        # Read the queue directly: the communicator's own receive cancels the consumer when it times out.
+        output = await asyncio.wait_for(self.communicator.output_queue.get(), timeout)
+        if output['type'] != 'websocket.send':
+            raise ConnectionError('the consumer closed the connection')
+        return decode(output.get('text'), output.get('bytes'))
+
+    async def close(self):
+        await self.communicator.disconnect()
+
+
+class FrameQueueProtocol(WebSocketClientProtocol):
+    def __init__(self):
+        super().__init__()
+        self.frames = asyncio.Queue()
+
+    def onMessage(self, payload, isBinary):
+        self.frames.put_nowait(decode(bytes_data=payload) if isBinary else decode(text_data=payload))
+
+
+class WebSocketClient:
+    """A simulated client connecting to a running server over a real socket."""
+
+    def __init__(self, host, port, path, protocol=None):
+        self.host, self.port = host, port
+        self.factory = WebSocketClientFactory(f"ws://{host}:{port}{path}", protocols=[protocol] if protocol else None)
+        self.factory.protocol = FrameQueueProtocol
+        self.protocol = protocol
+        self.connection = None
+
+    async def connect(self, timeout):
+        _, self.connection = await asyncio.wait_for(
+            asyncio.get_running_loop().create_connection(self.factory, self.host, self.port), timeout,
+        )
+        await asyncio.wait_for(self.connection.is_open, timeout)
+
+    async def send(self, data):
+        payload = encode(data, self.protocol)
+        self.connection.sendMessage(payload if isinstance(payload, bytes) else payload.encode(), isBinary=isinstance(payload, bytes))
+
+    async def receive(self, timeout):
+        return await asyncio.wait_for(self.connection.frames.get(), timeout)
+
+    async def close(self):
+        self.connection.sendClose()
+        await asyncio.wait_for(self.connection.is_closed, 5)
+
+
+def free_port(host):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def daphne_server(application='learningweb.routing:application', host='127.0.0.1', settings_module=None, timeout=30):
+    """Runs a single daphne worker serving `application` on a free port, yielding (host, port, process id)."""
+    port = free_port(host)
+    env = dict(os.environ)
+    if settings_module:
+        env['DJANGO_SETTINGS_MODULE'] = settings_module
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'daphne', '-b', host, '-p', str(port), application],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"daphne exited with {process.returncode}: {process.stderr.read().decode()[-2000:]}")
+            try:
+                socket.create_connection((host, port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"daphne did not listen on {host}:{port} within {timeout}s")
+                time.sleep(0.1)
+        yield host, port, process.pid
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def run_load(make_client, clients, senders, messages, rate=0, connect_concurrency=100, timeout=30,
+                   memory=rss_bytes):
+    """Connects `clients` simulated clients, has the first `senders` send `messages` each, and times every delivery.
+
+    `make_client` builds an unconnected client; `memory` reads the resident memory of the process serving them.
+    Each message goes to every client in the room, the senders included. Returns the measurements as a dict.
+    """
+    connections = [make_client() for _ in range(clients)]
+    semaphore = asyncio.Semaphore(connect_concurrency)
+
+    async def connect(client):
+        async with semaphore:
+            await client.connect(timeout)
+
+    memory_before = memory()
+    started = time.perf_counter()
+    await asyncio.gather(*(connect(client) for client in connections))
+    connect_seconds = time.perf_counter() - started
+    memory_after = memory()
+
+    expected = senders * messages
+    latencies = []
+    deliveries = 0
+
+    async def read(client):
+        nonlocal deliveries
+        received = 0
+        deadline = time.perf_counter() + timeout
+        while received < expected:
+            try:
+                frame = await client.receive(max(deadline - time.perf_counter(), 0))
+            except asyncio.TimeoutError:
+                break
+            # Batched rooms send arrays of messages; history and presence frames carry no message.
+            for item in frame if isinstance(frame, list) else [frame]:
+                message = item.get('message') if isinstance(item, dict) else None
+                if isinstance(message, str) and message.startswith(MARKER):
+                    latencies.append(time.perf_counter() - float(message.rsplit(' ', 1)[1]))
+                    received += 1
+        deliveries += received
+
+    async def send(client, number):
+        for sequence in range(messages):
+            await client.send({'message': f"{MARKER} {number} {sequence} {time.perf_counter():.9f}"})
+            if rate:
+                await asyncio.sleep(1 / rate)
+            else:
+                # Let the consumers run between messages, as they would between network reads.
+                await asyncio.sleep(0)
+
+    loop = asyncio.get_running_loop()
+    readers = [loop.create_task(read(client)) for client in connections]
+    sending_started = time.perf_counter()
+    await asyncio.gather(*(send(client, number) for number, client in enumerate(connections[:senders])))
+    sending_seconds = time.perf_counter() - sending_started
+    await asyncio.gather(*readers)
+    elapsed = time.perf_counter() - sending_started
+    await asyncio.gather(*(client.close() for client in connections), return_exceptions=True)
+
+    result = {
+        'clients': clients,
+        'connect_seconds': round(connect_seconds, 3),
+        'connects_per_second': round(clients / connect_seconds, 1),
+        'messages_sent': expected,
+        'sent_per_second': round(expected / sending_seconds, 1),
+        'deliveries': deliveries,
+        'expected_deliveries': expected * clients,
+        'deliveries_per_second': round(deliveries / elapsed, 1),
+        'memory_per_connection_bytes': (
+            round((memory_after - memory_before) / clients) if memory_before is not None and memory_after is not None else None
+        ),
+    }
+    if latencies:
+        result.update(summarize(latencies))
+    return result
+
+
+@contextmanager
+def in_memory_backends(capacity=10_000):
+    """Serves chat from this process alone: in-memory channel layer, history and presence, and a fresh message buffer."""
+    saved = history.history, presence.presence, buffer.message_buffer
+    history.history = presence.presence = buffer.message_buffer = None
+    try:
+        with override_settings(
+            CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer', 'CONFIG': {'capacity': capacity}}},
+            CHAT_HISTORY={'BACKEND': 'chat.history.MemoryHistory', 'SIZE': settings.CHAT_HISTORY['SIZE']},
+            CHAT_PRESENCE={'BACKEND': 'chat.presence.MemoryPresence', 'TIMEOUT': settings.CHAT_PRESENCE['TIMEOUT']},
+        ):
+            yield
+    finally:
+        history.history, presence.presence, buffer.message_buffer = saved
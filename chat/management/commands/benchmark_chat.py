@@ -0,0 +1,116 @@
+import json
+import time
+import uuid
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.buffer import get_message_buffer
+from chat.history import get_history
+from chat.loadtest import CommunicatorClient, WebSocketClient, daphne_server, in_memory_backends, rss_bytes, run_load
+from chat.models import ChatMessage
+from chat.presence import get_presence
+from learningapp.benchmarking import isolated_database
+
+
+def parse_list(value):
+    return [item for item in value.split(',') if item]
+
+
+class Command(BaseCommand):
+    help = ('Load-test the chat consumer with simulated WebSocket clients, in-process through WebsocketCommunicator '
+            'and against a local daphne worker')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', type=parse_list, default=['inprocess'], help='inprocess, daphne or both')
+        parser.add_argument('--clients', type=int, default=1000, help='Simulated clients in the room')
+        parser.add_argument('--senders', type=int, default=10, help='Clients that send messages')
+        parser.add_argument('--messages', type=int, default=20, help='Messages sent by each sender')
+        parser.add_argument('--rate', type=float, default=0, help='Messages per second per sender; 0 sends as fast as possible')
+        parser.add_argument('--protocol', choices=['json', 'msgpack'], default='json')
+        parser.add_argument('--connect-concurrency', type=int, default=100, help='Connections opened at the same time')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds to wait for connections and deliveries')
+        parser.add_argument('--room', default='loadtest',
+                            help='Prefix of the room name; each run uses a new room so it never mixes with real chat')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        if options['senders'] > options['clients']:
+            raise CommandError('--senders cannot exceed --clients')
+        unknown = set(options['modes']) - {'inprocess', 'daphne'}
+        if unknown:
+            raise CommandError(f"Unknown mode(s): {', '.join(sorted(unknown))}")
+
+        results = []
+        if 'inprocess' in options['modes']:
+            results.append(self.run_inprocess(options))
+        if 'daphne' in options['modes']:
+            results.append(self.run_daphne(options))
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({'meta': {**{key: options[key] for key in ['clients', 'senders', 'messages', 'rate', 'protocol']},
+                                    'created': time.time()}, 'results': results}, file, indent=2)
+
+    def room(self, options):
+        return f"{options['room']}{uuid.uuid4().hex[:12]}"
+
+    def run_inprocess(self, options):
+        """Serves the consumer in this process on in-memory backends, saving messages to a throwaway database."""
+        from learningweb.routing import application
+
+        path = f"/ws/{self.room(options)}/"
+
+        async def load():
+            result = await run_load(
+                lambda: CommunicatorClient(application, path, options['protocol']), **self.load_options(options),
+            )
+            await get_message_buffer().flush()
+            return result
+
+        with isolated_database(), in_memory_backends():
+            result = async_to_sync(load)()
+        # The simulated clients run in this process too, so its memory growth is theirs and the server's together.
+        return self.record('inprocess', {**result, 'memory_measures': 'clients and server'})
+
+    def run_daphne(self, options):
+        """Serves the project, as its settings configure it, from one daphne worker in a separate process."""
+        room = self.room(options)
+        with daphne_server() as (host, port, pid):
+            result = async_to_sync(run_load)(
+                lambda: WebSocketClient(host, port, f"/ws/{room}/", options['protocol']),
+                memory=lambda: rss_bytes(pid), **self.load_options(options),
+            )
+        # The server saved the load-test messages and the room's history and presence to the configured database and
+        # backends; the room exists only for this run.
+        ChatMessage.objects.filter(room=room).delete()
+        async_to_sync(self.clear_room)(room)
+        return self.record('daphne', {**result, 'memory_measures': 'server'})
+
+    async def clear_room(self, room):
+        await get_history().clear(room)
+        await get_presence().clear(room)
+
+    def load_options(self, options):
+        return {
+            'clients': options['clients'], 'senders': options['senders'], 'messages': options['messages'],
+            'rate': options['rate'], 'connect_concurrency': options['connect_concurrency'], 'timeout': options['timeout'],
+        }
+
+    def record(self, mode, result):
+        entry = {'mode': mode, **result}
+        latency = (
+            f"p50 {entry['p50_ms']:>8}ms  p95 {entry['p95_ms']:>8}ms  p99 {entry['p99_ms']:>8}ms" if 'p50_ms' in entry
+            else 'no deliveries'
+        )
+        memory = entry['memory_per_connection_bytes']
+        self.stdout.write(
+            f"{mode:<10} {entry['clients']:>6} clients  {entry['connects_per_second']:>8} connects/s  {latency}  "
+            f"{entry['deliveries_per_second']:>9} deliveries/s  {entry['deliveries']}/{entry['expected_deliveries']} delivered  "
+            f"{memory if memory is not None else '-'} bytes/connection ({entry['memory_measures']})"
+        )
+        if entry['deliveries'] < entry['expected_deliveries']:
+            self.stdout.write(self.style.WARNING(
+                f"{mode}: {entry['expected_deliveries'] - entry['deliveries']} deliveries missing before the timeout"
+            ))
+        return entry
@@ -0,0 +1,41 @@
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Q
+
+from learningapp.models import Course, CourseStudents
+
+
+def course_id_of(room_name):
+    """Course pages name their chat room after the course id; any other room name is not a course room.
+
+    isdigit() alone also accepts characters such as '²' that int() rejects, so only ASCII decimal names count.
+    """
+    return int(room_name) if room_name.isascii() and room_name.isdecimal() else None
+
+
+@database_sync_to_async
+def is_course_member(course_id, user_id):
+    """Whether the user teaches or is enrolled on the course, in one query on the (course, student) index."""
+    return Course.objects.filter(pk=course_id).filter(
+        Q(teacher_id=user_id) | Exists(CourseStudents.objects.filter(course_id=OuterRef('pk'), student__user_id=user_id))
+    ).exists()
+
+
+async def can_join(user, room_name):
+    """Whether the user may join the chat room: course rooms are for the course's teacher and students only.
+
+    Answers are cached for CHAT_MEMBERSHIP_CACHE_TIMEOUT seconds per user and room, so a reconnecting class costs
+    one query per student rather than one per connection; enrolment changes take up to that long to apply.
+    """
+    course_id = course_id_of(room_name)
+    if course_id is None:
+        return True
+    if user is None or not user.is_authenticated:
+        return False
+    key = f"chat:member:{course_id}:{user.id}"
+    allowed = await cache.aget(key)
+    if allowed is None:
+        allowed = await is_course_member(course_id, user.id)
+        await cache.aset(key, allowed, settings.CHAT_MEMBERSHIP_CACHE_TIMEOUT)
+    return allowed
@@ -0,0 +1,20 @@
+from django.contrib.auth.models import User
+from django.db import models
+from django.utils import timezone
+
+
+class ChatMessage(models.Model):
+    """A message sent to a chat room; course pages name their room after the course id."""
+    room = models.CharField(max_length=100)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="chat_messages")
+    message = models.TextField()
+    # Set when the consumer receives the message, not when its buffered batch is written.
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['room', 'created_at', 'id'], name='chatmessage_room_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.room}: {self.message[:50]}"
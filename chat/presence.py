@@ -0,0 +1,177 @@
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+
+import redis.asyncio
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .protocol import encode_event
+
+logger = logging.getLogger(__name__)
+
+# Members are "username|channel name", so a user with two tabs open stays online until both close.
+SEPARATOR = '|'
+
+
+def member_of(username, channel_name):
+    return f"{username}{SEPARATOR}{channel_name}"
+
+
+def usernames(members):
+    return sorted({member.split(SEPARATOR, 1)[0] for member in members})
+
+
+class MemoryPresence:
+    """Tracks the connections in each room in this process; for tests and single-process development."""
+
+    def __init__(self, timeout, **options):
+        self.timeout = timeout
+        self.rooms = defaultdict(dict)
+        self.claims = {}
+        self.snapshots = {}
+
+    async def heartbeat(self, room, member):
+        self.rooms[room][member] = time.time()
+
+    async def leave(self, room, member):
+        self.rooms[room].pop(member, None)
+
+    async def members(self, room):
+        cutoff = time.time() - self.timeout
+        members = self.rooms[room]
+        for member in [member for member, seen in members.items() if seen < cutoff]:
+            del members[member]
+        return list(members)
+
+    async def claim_broadcast(self, room, interval):
+        now = time.monotonic()
+        if self.claims.get(room, 0) > now:
+            return False
+        self.claims[room] = now + interval
+        return True
+
+    async def swap_snapshot(self, room, online):
+        previous, self.snapshots[room] = self.snapshots.get(room, []), online
+        return previous
+
+    async def clear(self, room):
+        for rooms in [self.rooms, self.claims, self.snapshots]:
+            rooms.pop(room, None)
+
+
+class RedisPresence:
+    """Tracks the connections in each room in a Redis sorted set scored by their last heartbeat.
+
+    Connections whose heartbeat is older than `timeout` seconds (a crashed worker never says goodbye) are dropped on
+    the next read. The usernames last broadcast for a room are kept next to it, so whichever worker broadcasts next
+    reports the change since then, and a short-lived claim key allows one broadcast per room and interval across all
+    workers. A Redis error only costs presence, never the chat.
+    """
+
+    def __init__(self, location, timeout, **options):
+        self.location = location
+        self.timeout = timeout
+        self.client = None
+
+    def key(self, room, suffix=''):
+        return f"chat:presence:{room}{suffix}"
+
+    def get_client(self):
+        if self.client is None:
+            self.client = redis.asyncio.Redis.from_url(self.location, decode_responses=True)
+        return self.client
+
+    async def heartbeat(self, room, member):
+        try:
+            async with self.get_client().pipeline(transaction=False) as pipe:
+                pipe.zadd(self.key(room), {member: time.time()})
+                pipe.expire(self.key(room), self.timeout)
+                await pipe.execute()
+        except Exception:
+            logger.warning("Could not record a heartbeat in chat room %s", room, exc_info=True)
+
+    async def leave(self, room, member):
+        try:
+            await self.get_client().zrem(self.key(room), member)
+        except Exception:
+            logger.warning("Could not record a connection leaving chat room %s", room, exc_info=True)
+
+    async def members(self, room):
+        async with self.get_client().pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(self.key(room), '-inf', time.time() - self.timeout)
+            pipe.zrange(self.key(room), 0, -1)
+            _, members = await pipe.execute()
+        return members
+
+    async def claim_broadcast(self, room, interval):
+        return bool(await self.get_client().set(self.key(room, ':claim'), 1, nx=True, px=int(interval * 1000)))
+
+    async def swap_snapshot(self, room, online):
+        previous = await self.get_client().set(
+            self.key(room, ':broadcast'), json.dumps(online), get=True, ex=self.timeout * 2,
+        )
+        return json.loads(previous) if previous else []
+
+    async def clear(self, room):
+        try:
+            await self.get_client().delete(self.key(room), self.key(room, ':claim'), self.key(room, ':broadcast'))
+        except Exception:
+            logger.warning("Could not clear the presence of chat room %s", room, exc_info=True)
+
+
+presence = None
+
+
+def get_presence():
+    """The backend configured by settings.CHAT_PRESENCE, created on first use."""
+    global presence
+    if presence is None:
+        options = {key.lower(): value for key, value in settings.CHAT_PRESENCE.items()}
+        presence = import_string(options.pop('backend'))(**options)
+    return presence
+
+
+# room -> this process's task waiting to broadcast the room's presence.
+pending_broadcasts = {}
+
+
+def schedule_broadcast(channel_layer, group_name, room):
+    """Broadcasts the room's presence change at the end of the current interval, unless one is already due.
+
+    However many connections join or leave in an interval, the room gets at most one event: the online count and
+    the usernames that joined or left since the last one.
+    """
+    task = pending_broadcasts.get(room)
+    if task is None or task.done():
+        pending_broadcasts[room] = asyncio.get_running_loop().create_task(broadcast(channel_layer, group_name, room))
+
+
+async def broadcast(channel_layer, group_name, room):
+    interval = settings.CHAT_PRESENCE_INTERVAL_MS / 1000
+    backend = get_presence()
+    try:
+        # Another worker may have broadcast this interval, possibly before our change; try again in the next one.
+        while True:
+            await asyncio.sleep(interval)
+            if await backend.claim_broadcast(room, interval):
+                break
+        # Changes from here on are not in what we read next, so they schedule a broadcast of their own.
+        if pending_broadcasts.get(room) is asyncio.current_task():
+            del pending_broadcasts[room]
+        online = usernames(await backend.members(room))
+        previous = set(await backend.swap_snapshot(room, online))
+    except Exception:
+        logger.warning("Could not broadcast the presence of chat room %s", room, exc_info=True)
+        return
+
+    joined = [username for username in online if username not in previous]
+    left = sorted(previous.difference(online))
+    if joined or left:
+        update = {'count': len(online), 'joined': joined, 'left': left}
+        await channel_layer.group_send(group_name, {
+            'type': 'presence',
+            **encode_event({'presence': update}),
+        })
@@ -0,0 +1,47 @@
+import json
+
+import msgpack
+
+# WebSocket subprotocols a client may ask for; JSON text frames are used when it asks for neither.
+MSGPACK = 'msgpack'
+JSON = 'json'
+PROTOCOLS = [MSGPACK, JSON]
+
+
+def negotiate(requested):
+    """The subprotocol to accept from those the client offered, or None to speak JSON without naming it."""
+    for protocol in PROTOCOLS:
+        if protocol in requested:
+            return protocol
+    return None
+
+
+def encode(data, protocol):
+    return msgpack.packb(data) if protocol == MSGPACK else json.dumps(data)
+
+
+# What decode() raises for frames that are not valid JSON or msgpack, including msgpack maps with non-string keys.
+DECODE_ERRORS = (ValueError, msgpack.UnpackException)
+
+
+def decode(text_data=None, bytes_data=None):
+    """Binary frames are msgpack and text frames JSON, whichever subprotocol was negotiated."""
+    if bytes_data is not None:
+        return msgpack.unpackb(bytes_data)
+    return json.loads(text_data)
+
+
+def encode_event(data):
+    """Group event fields holding `data` encoded once per protocol, which every member then sends as it is."""
+    return {'payload': json.dumps(data), 'packed': msgpack.packb(data)}
+
+
+def event_payload(event, protocol):
+    return event['packed'] if protocol == MSGPACK else event['payload']
+
+
+def join_payloads(payloads, protocol):
+    """One array frame built from already-encoded payloads, without decoding them."""
+    if protocol == MSGPACK:
+        return msgpack.Packer().pack_array_header(len(payloads)) + b''.join(payloads)
+    return '[' + ','.join(payloads) + ']'
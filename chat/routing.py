@@ -1,7 +1,9 @@
 from django.urls import re_path
 from . import consumers
 # NOTE USE OF ws/ to separate out our ws URIs, like rest use of api/
+# Room names end up in ChatMessage.room (100 characters) and in the group name 'chat_<room>', which channels
+# limits to ASCII and fewer than 100 characters; longer or non-ASCII names have no route.
 websocket_urlpatterns = [
-    re_path(r'ws/(?P<room_name>\w+)/$',
+    re_path(r'ws/(?P<room_name>[A-Za-z0-9_]{1,94})/$',
     consumers.ChatConsumer.as_asgi()),
 ]
@@ -0,0 +1,501 @@
+import asyncio
+import json
+import os
+import tempfile
+from contextlib import nullcontext
+from io import StringIO
+from unittest.mock import patch
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DataError
+from django.test import TransactionTestCase, override_settings
+from . import buffer, history, presence
+from learningapp.models import Course, CourseStudents, UserProfile
+from .buffer import MessageBuffer
+from .history import MemoryHistory
+from .loadtest import CommunicatorClient, in_memory_backends, run_load
+from .membership import course_id_of
+from .models import ChatMessage
+from .presence import MemoryPresence, member_of, usernames
+from .routing import websocket_urlpatterns
+
+
+application = URLRouter(websocket_urlpatterns)
+
+
+async def join(path, user=None, subprotocols=None):
+    """Connects to a room without history and reads the presence frame every connection starts with."""
+    communicator = WebsocketCommunicator(application, path, subprotocols=subprotocols)
+    if user is not None:
+        communicator.scope['user'] = user
+    connected, _ = await communicator.connect()
+    assert connected
+    frame = await communicator.receive_from()
+    assert 'presence' in (msgpack.unpackb(frame) if isinstance(frame, bytes) else json.loads(frame))
+    return communicator
+
+
+class MessageBufferTests(TransactionTestCase):
+
+    def test_burst_is_written_in_size_batches(self):
+        """A burst is saved with one bulk_create per `size` messages rather than one query per message"""
+        message_buffer = MessageBuffer(size=100, interval=10)
+        bulk_create = ChatMessage.objects.bulk_create
+
+        async def burst():
+            for number in range(250):
+                message_buffer.add(ChatMessage(room='1', message=f"message {number}"))
+            await asyncio.sleep(0)
+            # The last 50 only go out when the interval elapses or the buffer is flushed.
+            await message_buffer.flush()
+
+        with patch.object(ChatMessage.objects, 'bulk_create', wraps=bulk_create) as writes:
+            async_to_sync(burst)()
+
+        self.assertEqual([len(call.args[0]) for call in writes.call_args_list], [100, 100, 50])
+        self.assertEqual(ChatMessage.objects.filter(room='1').count(), 250)
+
+    def test_partial_batch_is_written_after_interval(self):
+        message_buffer = MessageBuffer(size=100, interval=0.01)
+
+        async def send():
+            message_buffer.add(ChatMessage(room='2', message='hello'))
+            await message_buffer.flusher
+
+        async_to_sync(send)()
+        self.assertEqual(list(ChatMessage.objects.values_list('room', 'message')), [('2', 'hello')])
+
+    def test_failed_write_is_retried_and_pending_messages_are_bounded(self):
+        message_buffer = MessageBuffer(size=10, interval=10, max_pending=15)
+
+        async def send():
+            for number in range(20):
+                message_buffer.add(ChatMessage(room='3', message=str(number)))
+            with patch.object(buffer, 'save_messages', side_effect=RuntimeError), self.assertLogs('chat.buffer', 'ERROR'):
+                await message_buffer.flush()
+            self.assertEqual(len(message_buffer.pending), 15)
+            await message_buffer.flush()
+
+        with self.assertLogs('chat.buffer', 'WARNING'):
+            async_to_sync(send)()
+        # The five oldest messages were dropped once more than 15 were waiting.
+        self.assertEqual(
+            list(ChatMessage.objects.order_by('id').values_list('message', flat=True)),
+            [str(number) for number in range(5, 20)],
+        )
+
+    def test_rejected_messages_are_dropped_without_holding_back_the_rest(self):
+        message_buffer = MessageBuffer(size=10, interval=10)
+        save_messages = buffer.save_messages
+
+        async def save_valid(messages):
+            if any(message.message == 'bad' for message in messages):
+                raise DataError('value too long')
+            await save_messages(messages)
+
+        async def send():
+            for number in range(12):
+                message_buffer.add(ChatMessage(room='4', message='bad' if number == 3 else str(number)))
+            with patch.object(buffer, 'save_messages', side_effect=save_valid), self.assertLogs('chat.buffer', 'ERROR') as logs:
+                await message_buffer.flush()
+            self.assertEqual(len(logs.records), 1)
+            self.assertEqual(message_buffer.pending, [])
+
+        async_to_sync(send)()
+        self.assertEqual(
+            list(ChatMessage.objects.order_by('id').values_list('message', flat=True)),
+            [str(number) for number in range(12) if number != 3],
+        )
+
+
+class ChatConsumerPersistenceTests(TransactionTestCase):
+
+    @override_settings(CHAT_FLUSH_SIZE=2, CHAT_FLUSH_INTERVAL_MS=10)
+    def test_received_messages_are_saved_with_their_sender(self):
+        user = User.objects.create_user(username='chatter', password='testpassword')
+
+        async def chat():
+            communicator = await join('/ws/general/', user)
+            for text in ['first', 'second', 'third']:
+                await communicator.send_json_to({'message': text})
+                self.assertEqual(await communicator.receive_json_from(), {'message': text})
+            await communicator.disconnect()
+            await buffer.get_message_buffer().flusher
+
+        with patch.object(buffer, 'message_buffer', None):
+            async_to_sync(chat)()
+
+        self.assertEqual(
+            list(ChatMessage.objects.order_by('id').values_list('room', 'user__username', 'message')),
+            [('general', 'chatter', 'first'), ('general', 'chatter', 'second'), ('general', 'chatter', 'third')],
+        )
+
+    def test_room_names_that_cannot_be_stored_or_grouped_have_no_route(self):
+        async def connect(room):
+            communicator = WebsocketCommunicator(application, f"/ws/{room}/")
+            try:
+                return (await communicator.connect())[0]
+            finally:
+                await communicator.disconnect()
+
+        self.assertTrue(async_to_sync(connect)('r' * 94))
+        for room in ['r' * 95, 'r' * 101, 'caf\u00e9']:
+            with self.subTest(room=room), self.assertRaises(ValueError):
+                async_to_sync(connect)(room)
+
+
+class ChatHistoryTests(TransactionTestCase):
+
+    def test_memory_history_keeps_the_last_messages_of_each_room(self):
+        history = MemoryHistory(size=3)
+
+        async def fill():
+            for number in range(5):
+                await history.append('1', {'message': str(number)})
+            await history.append('2', {'message': 'other room'})
+            return await history.recent('1'), await history.recent('empty')
+
+        recent, empty = async_to_sync(fill)()
+        self.assertEqual(recent, [{'message': '2'}, {'message': '3'}, {'message': '4'}])
+        self.assertEqual(empty, [])
+
+    def test_new_connection_receives_backlog_in_one_frame_without_queries(self):
+        async def send():
+            sender = await join('/ws/backlog/')
+            for text in ['first', 'second']:
+                await sender.send_json_to({'message': text})
+                await sender.receive_json_from()
+            await sender.disconnect()
+            await buffer.get_message_buffer().flush()
+
+        async def reconnect():
+            newcomer = WebsocketCommunicator(application, '/ws/backlog/')
+            await newcomer.connect()
+            backlog = await newcomer.receive_json_from()
+            self.assertEqual(await newcomer.receive_json_from(), {'presence': {'count': 0, 'online': []}})
+            self.assertTrue(await newcomer.receive_nothing())
+            await newcomer.disconnect()
+            return backlog
+
+        with patch.object(history, 'history', MemoryHistory(size=50)), patch.object(buffer, 'message_buffer', None):
+            async_to_sync(send)()
+            with self.assertNumQueries(0):
+                backlog = async_to_sync(reconnect)()
+        self.assertEqual(backlog, {'history': [{'message': 'first'}, {'message': 'second'}]})
+
+
+class ChatBatchingTests(TransactionTestCase):
+
+    @override_settings(CHAT_BATCH_WINDOW_MS=50, CHAT_BATCH_MAX_MESSAGES=100)
+    def test_messages_within_window_are_sent_as_one_array_frame(self):
+        async def chat():
+            sender, listener = await join('/ws/batched/'), await join('/ws/batched/')
+            for text in ['one', 'two', 'three']:
+                await sender.send_json_to({'message': text})
+            frame = await listener.receive_json_from()
+            self.assertTrue(await listener.receive_nothing())
+            await sender.disconnect()
+            await listener.disconnect()
+            await buffer.get_message_buffer().flush()
+            return frame
+
+        with patch.object(history, 'history', MemoryHistory(size=50)), patch.object(buffer, 'message_buffer', None):
+            frame = async_to_sync(chat)()
+        self.assertEqual(frame, [{'message': 'one'}, {'message': 'two'}, {'message': 'three'}])
+
+    @override_settings(CHAT_BATCH_WINDOW_MS=10000, CHAT_BATCH_MAX_MESSAGES=2)
+    def test_full_window_is_sent_early(self):
+        async def chat():
+            sender, listener = await join('/ws/early/'), await join('/ws/early/')
+            for text in ['one', 'two', 'three']:
+                await sender.send_json_to({'message': text})
+            frame = await listener.receive_json_from()
+            # 'three' waits for the rest of its window.
+            self.assertTrue(await listener.receive_nothing())
+            await sender.disconnect()
+            await listener.disconnect()
+            await buffer.get_message_buffer().flush()
+            return frame
+
+        with patch.object(history, 'history', MemoryHistory(size=50)), patch.object(buffer, 'message_buffer', None):
+            frame = async_to_sync(chat)()
+        self.assertEqual(frame, [{'message': 'one'}, {'message': 'two'}])
+
+    def test_payload_is_encoded_once_per_message(self):
+        async def chat():
+            sender = await join('/ws/shared/')
+            listeners = [await join('/ws/shared/') for _ in range(3)]
+            with patch('chat.protocol.json.dumps', wraps=json.dumps) as dumps:
+                await sender.send_to(text_data='{"message": "hi"}')
+                for listener in listeners:
+                    self.assertEqual(await listener.receive_json_from(), {'message': 'hi'})
+                await sender.receive_json_from()
+            for communicator in [sender, *listeners]:
+                await communicator.disconnect()
+            await buffer.get_message_buffer().flush()
+            return dumps.call_count
+
+        with patch.object(history, 'history', MemoryHistory(size=50)), patch.object(buffer, 'message_buffer', None):
+            self.assertEqual(async_to_sync(chat)(), 1)
+
+
+class ChatMembershipTests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create(username='teacher')
+        self.student = User.objects.create(username='student')
+        self.outsider = User.objects.create(username='outsider')
+        self.course = Course.objects.create(name='Chemistry', teacher=self.teacher)
+        CourseStudents.objects.create(course=self.course, student=UserProfile.objects.create(user=self.student))
+        UserProfile.objects.create(user=self.outsider)
+
+    def connects(self, user, room=None):
+        async def connect():
+            communicator = WebsocketCommunicator(application, f'/ws/{room or self.course.id}/')
+            communicator.scope['user'] = user
+            connected, _ = await communicator.connect()
+            if connected:
+                await communicator.disconnect()
+            return connected
+
+        return async_to_sync(connect)()
+
+    def test_only_teacher_and_enrolled_students_join_course_room(self):
+        self.assertTrue(self.connects(self.teacher))
+        self.assertTrue(self.connects(self.student))
+        self.assertFalse(self.connects(self.outsider))
+        self.assertFalse(self.connects(AnonymousUser()))
+        self.assertFalse(self.connects(self.teacher, room=self.course.id + 1))
+
+    def test_rooms_not_named_after_a_course_stay_open(self):
+        self.assertTrue(self.connects(AnonymousUser(), room='learningweb'))
+
+    def test_only_ascii_decimal_room_names_are_course_rooms(self):
+        self.assertEqual(course_id_of('42'), 42)
+        for room in ['\u00b2', '4\u00b2', '\u0664\u0662', 'learningweb', '']:
+            with self.subTest(room=room):
+                self.assertIsNone(course_id_of(room))
+
+    def test_membership_is_checked_once_per_user_and_room(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(self.connects(self.student))
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                self.assertTrue(self.connects(self.student))
+
+
+class ChatPresenceTests(TransactionTestCase):
+
+    def test_memory_presence_expires_silent_connections_and_counts_users_once(self):
+        backend = MemoryPresence(timeout=60)
+
+        async def track():
+            await backend.heartbeat('1', member_of('ann', 'tab-1'))
+            await backend.heartbeat('1', member_of('ann', 'tab-2'))
+            await backend.heartbeat('1', member_of('bob', 'tab-3'))
+            backend.rooms['1'][member_of('bob', 'tab-3')] -= 61
+            await backend.leave('1', member_of('ann', 'tab-1'))
+            return usernames(await backend.members('1'))
+
+        self.assertEqual(async_to_sync(track)(), ['ann'])
+
+    @override_settings(CHAT_PRESENCE_INTERVAL_MS=50)
+    def test_joins_and_leaves_are_broadcast_once_per_interval_as_a_diff(self):
+        users = [User.objects.create(username=username) for username in ['ann', 'bob', 'cat']]
+
+        async def chat():
+            watcher = await join('/ws/lobby/')
+            ann, bob, cat = [await join('/ws/lobby/', user) for user in users]
+            joined = await watcher.receive_json_from()
+            self.assertTrue(await watcher.receive_nothing())
+            await ann.disconnect()
+            await bob.disconnect()
+            left = await watcher.receive_json_from()
+            self.assertTrue(await watcher.receive_nothing())
+            await cat.disconnect()
+            await watcher.disconnect()
+            return joined, left
+
+        with patch.object(presence, 'presence', MemoryPresence(timeout=60)), patch.object(presence, 'pending_broadcasts', {}):
+            joined, left = async_to_sync(chat)()
+        self.assertEqual(joined, {'presence': {'count': 3, 'joined': ['ann', 'bob', 'cat'], 'left': []}})
+        self.assertEqual(left, {'presence': {'count': 1, 'joined': [], 'left': ['ann', 'bob']}})
+
+
+    @override_settings(CHAT_PRESENCE_INTERVAL_MS=50)
+    def test_a_join_during_a_broadcast_gets_a_broadcast_of_its_own(self):
+        ann, bob = [User.objects.create(username=username) for username in ['ann', 'bob']]
+
+        class PausedPresence(MemoryPresence):
+            """Holds the first broadcast between reading the members and sending the event."""
+
+            def __init__(self, **options):
+                super().__init__(**options)
+                self.swapping, self.resume = asyncio.Event(), asyncio.Event()
+
+            async def swap_snapshot(self, room, online):
+                self.swapping.set()
+                await self.resume.wait()
+                return await super().swap_snapshot(room, online)
+
+        backend = PausedPresence(timeout=60)
+
+        async def chat():
+            watcher = await join('/ws/quiet/')
+            connections = [await join('/ws/quiet/', ann)]
+            await asyncio.wait_for(backend.swapping.wait(), 5)
+            connections.append(await join('/ws/quiet/', bob))
+            backend.resume.set()
+            updates = [await watcher.receive_json_from(timeout=5) for _ in range(2)]
+            for communicator in [*connections, watcher]:
+                await communicator.disconnect()
+            return updates
+
+        with patch.object(presence, 'presence', backend), patch.object(presence, 'pending_broadcasts', {}):
+            updates = async_to_sync(chat)()
+        self.assertEqual(updates, [
+            {'presence': {'count': 1, 'joined': ['ann'], 'left': []}},
+            {'presence': {'count': 2, 'joined': ['bob'], 'left': []}},
+        ])
+
+
+class ChatMsgpackTests(TransactionTestCase):
+
+    def test_msgpack_subprotocol_uses_binary_frames_and_json_stays_default(self):
+        async def chat():
+            communicator = WebsocketCommunicator(application, '/ws/packed/', subprotocols=['msgpack', 'json'])
+            connected, subprotocol = await communicator.connect()
+            self.assertEqual((connected, subprotocol), (True, 'msgpack'))
+            self.assertEqual(msgpack.unpackb(await communicator.receive_from()), {'presence': {'count': 0, 'online': []}})
+            packed = communicator
+            text = await join('/ws/packed/')
+
+            frames = [], []
+            await packed.send_to(bytes_data=msgpack.packb({'message': 'binary'}))
+            frames[0].append(await packed.receive_from())
+            frames[1].append(await text.receive_from())
+            await text.send_json_to({'message': 'text'})
+            frames[0].append(await packed.receive_from())
+            frames[1].append(await text.receive_from())
+            for communicator in [packed, text]:
+                await communicator.disconnect()
+            await buffer.get_message_buffer().flush()
+            return frames
+
+        with patch.object(history, 'history', MemoryHistory(size=50)), patch.object(buffer, 'message_buffer', None):
+            packed_frames, text_frames = async_to_sync(chat)()
+        self.assertEqual([msgpack.unpackb(frame) for frame in packed_frames], [{'message': 'binary'}, {'message': 'text'}])
+        self.assertEqual([json.loads(frame) for frame in text_frames], [{'message': 'binary'}, {'message': 'text'}])
+
+    def test_messages_that_are_not_text_are_ignored(self):
+        async def chat():
+            communicator = await join('/ws/untyped/', subprotocols=['msgpack'])
+            for data in [{'message': b'bytes'}, {'message': 5}, {'message': {'nested': 'map'}}, {'text': 'no message'}, ['list']]:
+                await communicator.send_to(bytes_data=msgpack.packb(data))
+            await communicator.send_to(bytes_data=msgpack.packb({'message': 'text'}))
+            frame = await communicator.receive_from()
+            await communicator.disconnect()
+            await buffer.get_message_buffer().flush()
+            return frame
+
+        with patch.object(history, 'history', MemoryHistory(size=50)), patch.object(buffer, 'message_buffer', None):
+            frame = async_to_sync(chat)()
+        self.assertEqual(msgpack.unpackb(frame), {'message': 'text'})
+        self.assertEqual(list(ChatMessage.objects.values_list('message', flat=True)), ['text'])
+
+    def test_frames_that_do_not_decode_are_ignored(self):
+        async def chat(subprotocols):
+            communicator = await join('/ws/garbled/', subprotocols=subprotocols)
+            for frame in [b'\xc1', b'\x92', msgpack.packb({1: 'int key', 'message': 'lost'}), msgpack.packb('a') + b'extra']:
+                await communicator.send_to(bytes_data=frame)
+            await communicator.send_to(text_data='{"message": ')
+            await communicator.send_to(text_data=json.dumps({'message': 'text'}))
+            frame = await communicator.receive_from()
+            await communicator.disconnect()
+            await buffer.get_message_buffer().flush()
+            return frame
+
+        for subprotocols in [['msgpack'], None]:
+            with self.subTest(subprotocols=subprotocols), patch.object(history, 'history', MemoryHistory(size=50)), \
+                    patch.object(buffer, 'message_buffer', None):
+                frame = async_to_sync(chat)(subprotocols)
+                self.assertEqual(msgpack.unpackb(frame) if subprotocols else json.loads(frame), {'message': 'text'})
+        self.assertEqual(list(ChatMessage.objects.values_list('message', flat=True)), ['text', 'text'])
+
+    @override_settings(CHAT_BATCH_WINDOW_MS=50, CHAT_BATCH_MAX_MESSAGES=100)
+    def test_batched_msgpack_frame_is_one_array(self):
+        async def chat():
+            listener = await join('/ws/packedbatch/', subprotocols=['msgpack'])
+            sender = await join('/ws/packedbatch/')
+            for text in ['one', 'two']:
+                await sender.send_json_to({'message': text})
+            frame = await listener.receive_from()
+            for communicator in [listener, sender]:
+                await communicator.disconnect()
+            await buffer.get_message_buffer().flush()
+            return frame
+
+        with patch.object(history, 'history', MemoryHistory(size=50)), patch.object(buffer, 'message_buffer', None):
+            frame = async_to_sync(chat)()
+        self.assertEqual(msgpack.unpackb(frame), [{'message': 'one'}, {'message': 'two'}])
+
+    def test_group_events_carry_each_message_once_per_encoding(self):
+        async def chat():
+            layer = get_channel_layer()
+            probe = await layer.new_channel()
+            await layer.group_add('chat_events', probe)
+            sender = await join('/ws/events/')
+            await sender.send_json_to({'message': 'hello'})
+            event = await layer.receive(probe)
+            await sender.disconnect()
+            await buffer.get_message_buffer().flush()
+            return event
+
+        with patch.object(history, 'history', MemoryHistory(size=50)), patch.object(buffer, 'message_buffer', None):
+            event = async_to_sync(chat)()
+        self.assertEqual(set(event), {'type', 'payload', 'packed'})
+        self.assertEqual(msgpack.unpackb(event['packed']), json.loads(event['payload']))
+
+
+class ChatLoadTestTests(TransactionTestCase):
+
+    def test_run_load_times_every_delivery(self):
+        with in_memory_backends():
+            result = async_to_sync(run_load)(
+                lambda: CommunicatorClient(application, '/ws/load/', 'msgpack'), clients=5, senders=2, messages=3, timeout=5,
+            )
+        self.assertEqual((result['deliveries'], result['expected_deliveries'], result['count']), (30, 30, 30))
+        self.assertEqual(result['messages_sent'], 6)
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_benchmark_labels_in_process_memory_as_clients_and_server(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            out = StringIO()
+            # The test database is already a throwaway one.
+            with patch('chat.management.commands.benchmark_chat.isolated_database', nullcontext):
+                call_command('benchmark_chat', clients=3, senders=1, messages=2, timeout=5, output=output, stdout=out)
+            with open(output) as file:
+                results = json.load(file)['results']
+        self.assertIn('bytes/connection (clients and server)', out.getvalue())
+        self.assertEqual([(result['mode'], result['memory_measures']) for result in results], [('inprocess', 'clients and server')])
+
+    def test_memory_backends_clear_a_room(self):
+        room_history, room_presence = MemoryHistory(size=5), MemoryPresence(timeout=60)
+
+        async def clear():
+            await room_history.append('done', {'message': 'hello'})
+            await room_presence.heartbeat('done', member_of('alice', 'channel'))
+            await room_presence.swap_snapshot('done', ['alice'])
+            await room_history.clear('done')
+            await room_presence.clear('done')
+            return await room_history.recent('done'), await room_presence.members('done'), await room_presence.swap_snapshot('done', [])
+
+        self.assertEqual(async_to_sync(clear)(), ([], [], []))
@@ -6,11 +6,17 @@ from django.shortcuts import get_object_or_404, redirect
 
 from .models import Course, CourseStudents, UserProfile, CourseWeek, CourseWeekContent, Feedback
 from .serializers import CourseSerializer, CourseStudentsSerializer, UserProfileSerializer, CourseWeekSerializer, CourseWeekContentSerializer, FeedbackSerializer,CourseCreateSerializer, CourseEditSerializer, EnrolledStudentSerializer
+from .conditional import conditional_get, user_courses_version, course_details_version, courses_not_enrolled_version, teacher_courses_version
+from .services.catalogue import get_courses_not_enrolled_page
+from .services.course_details import get_cached_course_details
+from .services.feedback import get_feedback_page, InvalidCursor
+from .services.roster import get_roster_page, ROSTER_PAGE_SIZE
 from rest_framework.permissions import IsAuthenticated
 from django.urls import reverse
 from rest_framework import status
 
 @api_view(['GET'])
+@conditional_get(user_courses_version)
 def user_courses_api(request, username=None):
     """Fetches the courses a user is enrolled in based on their username or the logged-in user."""
     if username:
@@ -31,43 +37,61 @@ def get_enrolled_students_api(request, course_id):
         return Response({"detail": "You do not have permission to view enrolled students."}, status=403)
 
     course = get_object_or_404(Course, id=course_id)
-    enrolled_students = UserProfile.objects.filter(courses_enrolled__id=course.id)
-    student_serializer = EnrolledStudentSerializer(enrolled_students, many=True)
+    roster = get_roster_page(
+        course.id,
+        page=request.query_params.get('page', 1),
+        page_size=request.query_params.get('page_size', ROSTER_PAGE_SIZE),
+    )
 
-    return Response({"students": student_serializer.data})
+    return Response(roster)
 
 @api_view(['GET'])
+@conditional_get(course_details_version)
 def user_course_details_api(request, course_id):
     """Fetches the details of a course, including its weeks and feedback."""
-    course = get_object_or_404(Course, id=course_id)
+    return Response(get_cached_course_details(course_id))
 
-    course_weeks = CourseWeek.objects.filter(course=course).prefetch_related('content')
-    feedback = Feedback.objects.filter(course=course)
-
-    course_serializer = CourseSerializer(course)
-    course_week_serializer = CourseWeekSerializer(course_weeks, many=True)
-    feedback_serializer = FeedbackSerializer(feedback, many=True)
+@api_view(['GET'])
+@conditional_get(course_details_version)
+def course_feedback_api(request, course_id):
+    """Fetches a page of a course's feedback, continuing from the cursor returned by the previous page."""
+    course = get_object_or_404(Course, id=course_id)
 
-    response_data = course_serializer.data
-    response_data['weeks'] = course_week_serializer.data
-    response_data['feedback'] = feedback_serializer.data
+    try:
+        feedback_page = get_feedback_page(
+            course.id,
+            cursor=request.query_params.get('cursor'),
+            page_size=request.query_params.get('page_size'),
+        )
+    except InvalidCursor:
+        return Response({"detail": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
 
-    return Response(response_data)
+    return Response(feedback_page)
 
 @api_view(['GET'])
+@conditional_get(courses_not_enrolled_version)
 def courses_not_enrolled_api(request, username=None):
-    """Fetches the courses that a user is not enrolled in, based on their username or the logged-in user."""
+    """Fetches a page of the courses that a user is not enrolled in, based on their username or the logged-in user."""
     if username:
         user = get_object_or_404(UserProfile, user__username=username)
     else:
         user = request.user.userprofile
-    
-    enrolled_courses = user.courses_enrolled.all()
-    all_courses = Course.objects.exclude(id__in=[course.id for course in enrolled_courses])
 
-    serializer = CourseSerializer(all_courses, many=True)
-    
-    return Response(serializer.data)
+    try:
+        after = int(request.query_params.get('after', 0))
+    except ValueError:
+        return Response({"detail": "Invalid 'after' course id."}, status=status.HTTP_400_BAD_REQUEST)
+
+    courses, next_after = get_courses_not_enrolled_page(user, after=after, page_size=request.query_params.get('page_size'))
+    serializer = CourseSerializer(courses, many=True)
+    response = Response(serializer.data)
+
+    if next_after is not None:
+        next_params = request.query_params.copy()
+        next_params['after'] = next_after
+        response['Link'] = f'<{request.build_absolute_uri(request.path)}?{next_params.urlencode()}>; rel="next"'
+
+    return response
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -128,6 +152,7 @@ def create_course(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_get(teacher_courses_version)
 def teacher_courses_api(request):
     """Fetches the list of courses taught by the authenticated teacher."""
     try:
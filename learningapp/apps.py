@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class LearningappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'learningapp'
+
+    def ready(self):
+        from . import signals  # noqa: F401
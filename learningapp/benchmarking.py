@@ -0,0 +1,110 @@
+import math
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import override_settings
+from django.test.testcases import LiveServerThread, _StaticFilesHandler
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def isolated_cache():
+    """Runs the block against an empty in-process cache, so no cached course data crosses into or out of it."""
+    location = f'benchmark-{uuid.uuid4().hex}'
+    with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': location}}):
+        yield
+
+
+@contextmanager
+def isolated_database(verbosity=0):
+    """Runs the block against a freshly created test database and an empty cache, so benchmarks never touch real data.
+
+    Bulk-inserted rows send no signals, so a shared cache could otherwise serve entries built for an earlier dataset
+    that reused the same ids.
+    """
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    # In-memory SQLite test databases survive destroy_test_db, so make sure each block starts empty.
+    call_command('flush', verbosity=0, interactive=False)
+    try:
+        with isolated_cache():
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
+
+
+@contextmanager
+def live_server(host='127.0.0.1'):
+    """Serves the project from a threaded WSGI server on a free port, yielding its base URL."""
+    # In-memory SQLite test databases are only visible to the server thread if it shares this connection.
+    connections_override = {conn.alias: conn for conn in connections.all() if conn.vendor == 'sqlite' and conn.is_in_memory_db()}
+    for conn in connections_override.values():
+        conn.inc_thread_sharing()
+
+    server_thread = LiveServerThread(host, _StaticFilesHandler, connections_override=connections_override, port=0)
+    server_thread.daemon = True
+    server_thread.start()
+    server_thread.is_ready.wait()
+    try:
+        if server_thread.error:
+            raise server_thread.error
+        yield f'http://{host}:{server_thread.port}'
+    finally:
+        server_thread.terminate()
+        for conn in connections_override.values():
+            conn.dec_thread_sharing()
+
+
+def percentile(samples, fraction):
+    """Returns the nearest-rank percentile of a list of samples."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples):
+    """Summarizes latency samples (in seconds) as milliseconds at p50/p95/p99."""
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+    }
+
+
+def time_calls(func, repeat, warmup=1):
+    """Calls func `warmup` times untimed, then `repeat` times, returning the per-call durations in seconds."""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """Lists results whose p95 latency or response size grew by more than `threshold`, or whose query count grew.
+
+    Results are matched to the baseline on their 'key' field.
+    """
+    previous = {entry['key']: entry for entry in baseline}
+    regressions = []
+    for entry in results:
+        before = previous.get(entry['key'])
+        if before is None:
+            continue
+        if entry['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f"{entry['key']}: p95 {before['p95_ms']}ms -> {entry['p95_ms']}ms")
+        if entry.get('queries') is not None and before.get('queries') is not None and entry['queries'] > before['queries']:
+            regressions.append(f"{entry['key']}: queries {before['queries']} -> {entry['queries']}")
+        if entry['bytes'] > before['bytes'] * (1 + threshold):
+            regressions.append(f"{entry['key']}: response {before['bytes']} bytes -> {entry['bytes']} bytes")
+    return regressions
@@ -0,0 +1,26 @@
+from contextlib import contextmanager
+from itertools import islice
+
+
+def batched(iterable, size):
+    """Yields lists of at most `size` items from any iterable without materialising it."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Lets bulk inserts keep the timestamps set on each object instead of auto_now/auto_now_add overwriting them."""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
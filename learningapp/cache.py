@@ -0,0 +1,81 @@
+import time
+
+from django.core.cache import cache
+from django.utils import timezone
+
+COURSE_CACHE_TIMEOUT = 60 * 60
+BUILD_LOCK_TIMEOUT = 30
+BUILD_WAIT_TIMEOUT = 5
+BUILD_POLL_INTERVAL = 0.05
+
+CATALOGUE_CHANGED_KEY = 'catalogue:changed_at'
+
+
+def _generation_key(course_id):
+    return f"course:{course_id}:generation"
+
+
+def course_generation(course_id):
+    """Returns the current cache generation of a course, starting a new one if none is stored."""
+    key = _generation_key(course_id)
+    generation = cache.get(key)
+    if generation is None:
+        # Seed from the clock so a generation lost to eviction never reuses an old number.
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_course_generation(course_id):
+    """Moves a course to a new cache generation so every entry built from older data is ignored."""
+    key = _generation_key(course_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def catalogue_changed_at():
+    """Returns when a course was last created, changed or deleted, starting from now if nothing is stored."""
+    changed_at = cache.get(CATALOGUE_CHANGED_KEY)
+    if changed_at is None:
+        cache.add(CATALOGUE_CHANGED_KEY, timezone.now(), None)
+        changed_at = cache.get(CATALOGUE_CHANGED_KEY)
+    return changed_at
+
+
+def touch_catalogue():
+    """Records that the course catalogue changed."""
+    cache.set(CATALOGUE_CHANGED_KEY, timezone.now(), None)
+
+
+def course_cache_key(course_id, name, *parts):
+    """Builds a cache key for a course entry that is scoped to the course's current generation."""
+    suffix = ':'.join(str(part) for part in parts)
+    return f"course:{course_id}:{course_generation(course_id)}:{name}:{suffix}"
+
+
+def get_or_build(key, builder, timeout=COURSE_CACHE_TIMEOUT):
+    """Returns the cached value for key, letting only one caller rebuild it when the key is cold."""
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, 1, BUILD_LOCK_TIMEOUT):
+        try:
+            value = builder()
+            cache.set(key, value, timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    # Another worker is rebuilding this key; wait for its result rather than stampeding the database.
+    deadline = time.monotonic() + BUILD_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(BUILD_POLL_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+    return builder()
@@ -0,0 +1,108 @@
+import hashlib
+from collections import namedtuple
+
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
+
+from .cache import catalogue_changed_at
+from .models import Course, UserProfile
+
+Version = namedtuple('Version', ['etag', 'last_modified'])
+
+
+def make_version(request, *parts):
+    """Builds a Version from the parts that identify a resource state, scoped to the request's query string."""
+    timestamps = [part for part in parts if hasattr(part, 'timestamp')]
+    digest = hashlib.md5(
+        '|'.join(str(part) for part in (*parts, request.GET.urlencode())).encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+    return Version(etag=digest, last_modified=max(timestamps) if timestamps else None)
+
+
+def conditional_get(version_func):
+    """Answers If-None-Match/If-Modified-Since with 304 before the view runs, using version_func(request, ...).
+
+    Apply it below @api_view and @permission_classes, so version_func sees the user DRF authenticated (Basic auth
+    included, not only the session) and a 304 is only given to requests the view's permissions allow.
+    """
+    def get_version(request, *args, **kwargs):
+        if not hasattr(request, '_resource_version'):
+            request._resource_version = version_func(request, *args, **kwargs)
+        return request._resource_version
+
+    def etag_func(request, *args, **kwargs):
+        version = get_version(request, *args, **kwargs)
+        return version.etag if version else None
+
+    def last_modified_func(request, *args, **kwargs):
+        version = get_version(request, *args, **kwargs)
+        return version.last_modified if version else None
+
+    return condition(etag_func=etag_func, last_modified_func=last_modified_func)
+
+
+def _profile_filter(request, username):
+    if username:
+        return {'user__username': username}
+    if request.user.is_authenticated:
+        return {'user': request.user}
+    return None
+
+
+def _enrollment_stamp(request, username):
+    """Returns the profile's change stamp together with a count and latest change of its enrolled courses."""
+    profile_filter = _profile_filter(request, username)
+    if profile_filter is None:
+        return None
+    return (
+        UserProfile.objects
+        .filter(**profile_filter)
+        .annotate(enrolled=Count('course_students'), courses_updated_at=Max('course_students__course__updated_at'))
+        .values_list('id', 'updated_at', 'enrolled', 'courses_updated_at')
+        .first()
+    )
+
+
+def user_courses_version(request, username=None):
+    """Version of a user's enrolled course list."""
+    stamp = _enrollment_stamp(request, username)
+    if stamp is None:
+        return None
+    return make_version(request, 'user-courses', *[part for part in stamp if part is not None])
+
+
+def courses_not_enrolled_version(request, username=None):
+    """Version of the catalogue of courses a user is not enrolled in.
+
+    Enrollment changes touch the profile's updated_at, so this needs neither a count nor a scan of the catalogue.
+    """
+    profile_filter = _profile_filter(request, username)
+    if profile_filter is None:
+        return None
+    profile = UserProfile.objects.filter(**profile_filter).values_list('id', 'updated_at').first()
+    if profile is None:
+        return None
+    return make_version(request, 'courses-not-enrolled', *profile, catalogue_changed_at())
+
+
+def course_details_version(request, course_id):
+    """Version of a course detail aggregate; child changes touch Course.updated_at through signals."""
+    updated_at = Course.objects.filter(id=course_id).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    return make_version(request, 'course-details', course_id, updated_at)
+
+
+def teacher_courses_version(request):
+    """Version of the list of courses taught by the logged-in user.
+
+    Deleting a course lowers the count but can leave the latest updated_at as it was, so the catalogue change time,
+    which course signals also touch on deletes, keeps Last-Modified moving forward.
+    """
+    if not request.user.is_authenticated:
+        return None
+    profile_updated_at = UserProfile.objects.filter(user=request.user).values_list('updated_at', flat=True).first()
+    courses = Course.objects.filter(teacher=request.user).aggregate(total=Count('id'), updated_at=Max('updated_at'))
+    parts = [request.user.id, profile_updated_at, courses['total'], courses['updated_at'], catalogue_changed_at()]
+    return make_version(request, 'teacher-courses', *[part for part in parts if part is not None])
@@ -0,0 +1,101 @@
+import datetime
+
+import factory
+from django.contrib.auth.models import User
+
+from .models import UserProfile, Course, CourseStudents, Status, CourseWeek, CourseWeekContent, Feedback
+
+DATASET_START = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+DATASET_END = datetime.datetime(2025, 12, 31, tzinfo=datetime.timezone.utc)
+
+
+def dataset_datetime():
+    """Faker declaration for a timestamp inside the generated dataset's two-year window."""
+    return factory.Faker('date_time_between', start_date=DATASET_START, end_date=DATASET_END, tzinfo=datetime.timezone.utc)
+
+
+class UserFactory(factory.django.DjangoModelFactory):
+    """Builds a User with a unique username; `password` should be a pre-computed hash when bulk inserting."""
+    class Meta:
+        model = User
+
+    username = factory.Sequence(lambda n: f'user{n}')
+    email = factory.LazyAttribute(lambda user: f'{user.username}@example.com')
+    first_name = factory.Faker('first_name')
+    last_name = factory.Faker('last_name')
+    date_joined = dataset_datetime()
+    password = '!'
+
+
+class UserProfileFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = UserProfile
+
+    user = factory.SubFactory(UserFactory)
+    role = UserProfile.STUDENT
+    updated_at = factory.SelfAttribute('user.date_joined')
+
+
+class CourseFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = Course
+
+    name = factory.Sequence(lambda n: f'Course {n}')
+    description = factory.Faker('paragraph', nb_sentences=3)
+    teacher = factory.SubFactory(UserFactory)
+    date_created = dataset_datetime()
+    deadline = factory.LazyAttribute(lambda course: (course.date_created + datetime.timedelta(weeks=12)).date())
+    updated_at = factory.SelfAttribute('date_created')
+
+
+class CourseWeekFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = CourseWeek
+
+    course = factory.SubFactory(CourseFactory)
+    week_number = factory.Sequence(lambda n: n + 1)
+    start_date = factory.LazyAttribute(lambda week: week.course.date_created.date() + datetime.timedelta(weeks=week.week_number - 1))
+    end_date = factory.LazyAttribute(lambda week: week.start_date + datetime.timedelta(weeks=1))
+
+
+class CourseWeekContentFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = CourseWeekContent
+
+    course_week = factory.SubFactory(CourseWeekFactory)
+    title = factory.LazyAttribute(lambda content: f'Week {content.course_week.week_number} Content')
+    pdf = factory.LazyAttribute(lambda content: f'course_pdfs/generated/Week_{content.course_week.week_number}.pdf')
+
+
+class FeedbackFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = Feedback
+
+    course = factory.SubFactory(CourseFactory)
+    student = factory.SubFactory(UserProfileFactory)
+    feedback_text = factory.Faker('sentence', nb_words=12)
+    date_submitted = dataset_datetime()
+
+
+class CourseStudentsFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = CourseStudents
+
+    course = factory.SubFactory(CourseFactory)
+    student = factory.SubFactory(UserProfileFactory)
+
+
+class StatusFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = Status
+
+    user = factory.SubFactory(UserFactory)
+    text = factory.Faker('sentence', nb_words=15)
+    created_at = dataset_datetime()
+
+
+def reset_sequences():
+    """Restarts every factory sequence so a seeded run produces the same usernames and course names."""
+    for factory_class in (UserFactory, CourseFactory, CourseWeekFactory):
+        factory_class.reset_sequence()
+
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import logging
+from functools import reduce
+from operator import or_
+
+from django.contrib.auth.models import User
+from django.db.models import Q
+
+from ..bulk import batched
+from ..models import Status, Course, CourseWeek, CourseWeekContent, Feedback, CourseStudents, ImportFingerprint
+from .stages import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+DELETE_BATCH_SIZE = 500
+
+# stage name -> (model, function building a filter for the rows with the given natural key values).
+MATCHES = {
+    'users': (User, lambda username: Q(username=username)),
+    'courses': (Course, lambda name, teacher: Q(name=name, teacher__username=teacher)),
+    'weeks': (CourseWeek, lambda name, week: Q(course__name=name, week_number=int(week))),
+    'content': (CourseWeekContent, lambda name, week: Q(
+        course_week__course__name=name, course_week__week_number=int(week), title=f"Week {week} Content",
+    )),
+    'enrollments': (CourseStudents, lambda student, name: Q(student__user__username=student, course__name=name)),
+    'feedback': (Feedback, lambda student, name, text, date: Q(
+        student__user__username=student, course__name=name, feedback_text=text, date_submitted=parse_datetime(date),
+    )),
+    'statuses': (Status, lambda username, text, created_at: Q(user__username=username, text=text, created_at=parse_datetime(created_at))),
+}
+
+
+def key_values(stage, row):
+    return [row[column].strip() for column in stage.key]
+
+
+def digest(value):
+    return hashlib.sha1(value.encode()).hexdigest()
+
+
+def key_digest(values):
+    return digest('\x1f'.join(values))
+
+
+def row_fingerprint(row):
+    """A digest of the row's content, leaving out password columns.
+
+    Fingerprints are stored unsalted next to the rest of the row's data, so a fingerprint covering a plaintext
+    password could be brute-forced far faster than the user's password hash. load_users never applies passwords
+    to existing users anyway.
+    """
+    return digest(json.dumps(sorted((column, value) for column, value in row.items() if 'password' not in column)))
+
+
+def changed_rows(stage, rows):
+    """Returns {key digest: (row, fingerprint)} for the rows whose fingerprint differs from the stored one.
+
+    When a chunk repeats a key the last row wins, as it would in a full import.
+    """
+    keyed = {key_digest(key_values(stage, row)): (row, row_fingerprint(row)) for row in rows}
+    stored = dict(
+        ImportFingerprint.objects.filter(stage=stage.name, key_digest__in=keyed).values_list('key_digest', 'fingerprint')
+    )
+    return {key: value for key, value in keyed.items() if stored.get(key) != value[1]}
+
+
+def record_fingerprints(stage, changed, skipped_rows):
+    """Stores the fingerprints of the changed rows that were imported, leaving skipped rows to be retried next time."""
+    skipped = {id(row) for row in skipped_rows}
+    ImportFingerprint.objects.bulk_create(
+        [
+            ImportFingerprint(stage=stage.name, key_digest=key, key=key_values(stage, row), fingerprint=fingerprint)
+            for key, (row, fingerprint) in changed.items() if id(row) not in skipped
+        ],
+        update_conflicts=True, unique_fields=['stage', 'key_digest'], update_fields=['fingerprint'],
+    )
+
+
+def import_delta_chunk(stage, rows, batch_size):
+    """Loads only the rows of a chunk that changed since they were last imported and records their new fingerprints."""
+    changed = changed_rows(stage, rows)
+    counts = stage.load([row for row, _ in changed.values()], batch_size)
+    record_fingerprints(stage, changed, counts.get('skipped_rows', []))
+    counts['rows'] = len(rows)
+    counts['unchanged'] = len(rows) - len(changed)
+    return counts
+
+
+def delete_missing(stage, seen):
+    """Deletes the rows previously imported for a stage whose key is not in `seen`, the key digests of the new file."""
+    model, match = MATCHES[stage.name]
+    stale = [
+        (fingerprint_id, key)
+        for fingerprint_id, stored_digest, key in ImportFingerprint.objects.filter(stage=stage.name)
+        .values_list('id', 'key_digest', 'key').iterator(chunk_size=DELETE_BATCH_SIZE)
+        if stored_digest not in seen
+    ]
+    for batch in batched(stale, DELETE_BATCH_SIZE):
+        model.objects.filter(reduce(or_, (match(*key) for _, key in batch))).delete()
+        ImportFingerprint.objects.filter(id__in=[fingerprint_id for fingerprint_id, _ in batch]).delete()
+    deleted = len(stale)
+    if deleted:
+        logger.info("Deleted %s %s rows missing from the import file", deleted, stage.name)
+    return deleted
+
+
+def forget_dependents(stage, stages):
+    """Drops the fingerprints of every stage depending on `stage`, whose rows its deletes may have cascaded to.
+
+    Those stages are then fully re-imported by the next delta run.
+    """
+    dependents = {stage.name}
+    for candidate in stages:
+        if dependents & set(candidate.after):
+            dependents.add(candidate.name)
+    dependents.discard(stage.name)
+    ImportFingerprint.objects.filter(stage__in=dependents).delete()
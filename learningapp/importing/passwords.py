@@ -0,0 +1,58 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, identify_hasher, make_password
+
+# Plaintext passwords handed to each hashing process at a time; a hash takes long enough that larger chunks gain nothing.
+HASH_CHUNK_SIZE = 8
+
+
+@contextmanager
+def hashing_pool(workers=None):
+    """Yields a process pool for hashing passwords on `workers` cores (all of them by default), or None for one core.
+
+    The workers only run make_password and never touch the database, so they can be forked mid-transaction.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        yield None
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield executor
+
+
+def is_password_hash(value):
+    """Whether a value can be stored as a password as it is: a hash Django recognises, or an unusable password."""
+    if value.startswith(UNUSABLE_PASSWORD_PREFIX):
+        return True
+    try:
+        identify_hasher(value)
+    except ValueError:
+        return False
+    return True
+
+
+def prepare_passwords(rows, executor=None):
+    """Returns the stored password of each users.csv row, or None when its pre-hashed password is not usable.
+
+    A non-empty `password_hash` column is stored as it is; plaintext `password` values are hashed, on the executor's
+    processes when there is one.
+    """
+    passwords = [None] * len(rows)
+    plaintext = []
+    for index, row in enumerate(rows):
+        password_hash = (row.get('password_hash') or '').strip()
+        if password_hash:
+            passwords[index] = password_hash if is_password_hash(password_hash) else None
+        else:
+            plaintext.append(index)
+
+    values = [rows[index].get('password') for index in plaintext]
+    if executor is None or len(values) < 2:
+        hashes = map(make_password, values)
+    else:
+        hashes = executor.map(make_password, values, chunksize=HASH_CHUNK_SIZE)
+    for index, password_hash in zip(plaintext, hashes):
+        passwords[index] = password_hash
+    return passwords
@@ -0,0 +1,272 @@
+"""PostgreSQL fast path for import_csv: COPY each file into an unlogged staging table, then upsert with set-based SQL.
+
+The statements mirror the loaders in stages.py: the same natural keys, the same name and username lookups (the
+oldest course wins when a name is used twice) and, when a file repeats a key, the last row wins. Rows whose
+username or course cannot be resolved are left out by the joins rather than counted as skipped.
+"""
+import csv
+import io
+import logging
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.db import connection
+
+from ..models import UserProfile, Status, Course, CourseWeek, CourseWeekContent, Feedback, CourseStudents
+from ..signals import touch_courses, touch_profiles
+from .passwords import prepare_passwords
+from .reader import read_header
+from .stages import new_counts
+
+logger = logging.getLogger(__name__)
+
+TABLES = {
+    'user': User._meta.db_table,
+    'profile': UserProfile._meta.db_table,
+    'course': Course._meta.db_table,
+    'week': CourseWeek._meta.db_table,
+    'content': CourseWeekContent._meta.db_table,
+    'enrollment': CourseStudents._meta.db_table,
+    'feedback': Feedback._meta.db_table,
+    'status': Status._meta.db_table,
+}
+
+# Characters stripped by btrim(), matching what str.strip() removes from the CSV values in stages.py.
+WHITESPACE = r"E' \t\r\n'"
+
+# Maps course names in the staging table to the id of the oldest course with that name.
+COURSE_IDS = """
+    course_ids AS (
+        SELECT DISTINCT ON (name) name, id FROM {course}
+        WHERE name IN (SELECT {course_name} FROM {staging})
+        ORDER BY name, id
+    )
+"""
+
+
+def staging_table(stage):
+    return f'import_staging_{stage.name}'
+
+
+def copy_into_staging(cursor, stage, path):
+    """Creates an unlogged staging table with a text column per CSV column and streams the file into it with COPY."""
+    table = staging_table(stage)
+    columns = [connection.ops.quote_name(column) for column in read_header(path)]
+    cursor.execute(f'DROP TABLE IF EXISTS {table}')
+    # `line` keeps the file order so that the last of several rows with the same key can win, as in the row-by-row import.
+    cursor.execute(f'CREATE UNLOGGED TABLE {table} (line bigserial, {", ".join(f"{column} text" for column in columns)})')
+    with open(path, newline='', encoding='utf-8') as file:
+        cursor.copy_expert(f'COPY {table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv, HEADER true)', file)
+    return cursor.rowcount
+
+
+def sql(statement, stage, **extra):
+    return statement.format(staging=staging_table(stage), course_ids=COURSE_IDS.format(
+        staging=staging_table(stage), course_name=extra.pop('course_name', 'course_name'), **TABLES,
+    ), whitespace=WHITESPACE, **TABLES, **extra)
+
+
+def staging_columns(cursor, stage):
+    cursor.execute(f'SELECT * FROM {staging_table(stage)} LIMIT 0')
+    return [column.name for column in cursor.description]
+
+
+def upsert_users(cursor, stage, counts, password_executor=None):
+    columns = staging_columns(cursor, stage)
+    password = 's.password' if 'password' in columns else 'NULL'
+    password_hash = 's.password_hash' if 'password_hash' in columns else 'NULL'
+    cursor.execute(sql("""
+        SELECT DISTINCT ON (btrim(s.username, {whitespace})) btrim(s.username, {whitespace}), {password}, {password_hash}
+        FROM {staging} s
+        WHERE NOT EXISTS (SELECT 1 FROM {user} u WHERE u.username = btrim(s.username, {whitespace}))
+        ORDER BY btrim(s.username, {whitespace}), s.line DESC
+    """, stage, password=password, password_hash=password_hash))
+    new_users = cursor.fetchall()
+    passwords = prepare_passwords([{'password': password, 'password_hash': given} for _, password, given in new_users], password_executor)
+
+    # Passwords have to be hashed by Django, so the hashes of new users go through a second staging table.
+    hashes = io.StringIO()
+    writer = csv.writer(hashes)
+    for (username, _, _), password in zip(new_users, passwords):
+        if password is None:
+            counts['skipped'] += 1
+            logger.warning("Skipping users row %s: password_hash is not a recognised password hash", username)
+            continue
+        writer.writerow([username, password])
+    hashes.seek(0)
+    cursor.execute(sql('CREATE UNLOGGED TABLE {staging}_passwords (username text PRIMARY KEY, password text)', stage))
+    cursor.copy_expert(sql('COPY {staging}_passwords (username, password) FROM STDIN WITH (FORMAT csv)', stage), hashes)
+
+    cursor.execute(sql("""
+        INSERT INTO {user} (username, email, password, first_name, last_name, is_superuser, is_staff, is_active, date_joined)
+        SELECT DISTINCT ON (h.username) h.username, btrim(s.email, {whitespace}), h.password, '', '', false, false, true, now()
+        FROM {staging} s JOIN {staging}_passwords h ON h.username = btrim(s.username, {whitespace})
+        ORDER BY h.username, s.line DESC
+        ON CONFLICT (username) DO NOTHING
+    """, stage))
+    counts['created'] += cursor.rowcount
+    cursor.execute(sql('DROP TABLE {staging}_passwords', stage))
+
+    cursor.execute(sql("""
+        INSERT INTO {profile} (user_id, role, updated_at)
+        SELECT DISTINCT ON (u.id) u.id, COALESCE(NULLIF(s.role, ''), %s), now()
+        FROM {staging} s JOIN {user} u ON u.username = btrim(s.username, {whitespace})
+        ORDER BY u.id, s.line DESC
+        ON CONFLICT (user_id) DO UPDATE SET role = EXCLUDED.role, updated_at = EXCLUDED.updated_at
+        WHERE {profile}.role <> EXCLUDED.role
+        RETURNING (xmax = 0)
+    """, stage), [UserProfile.STUDENT])
+    counts['updated'] += sum(1 for (inserted,) in cursor.fetchall() if not inserted)
+
+
+def upsert_courses(cursor, stage, counts):
+    resolved = """
+        WITH resolved AS (
+            SELECT DISTINCT ON (s.course_name, u.id) s.course_name AS name, u.id AS teacher_id,
+                   s.date_created::timestamp AT TIME ZONE %(tz)s AS date_created, s.deadline::timestamp::date AS deadline
+            FROM {staging} s JOIN {user} u ON u.username = btrim(s.teacher_username, {whitespace})
+            ORDER BY s.course_name, u.id, s.line DESC
+        )
+    """
+    params = {'tz': settings.TIME_ZONE}
+    # Courses have no unique key to conflict on, so existing ones are updated and the rest inserted.
+    cursor.execute(sql(resolved + """
+        UPDATE {course} c SET date_created = r.date_created, deadline = r.deadline, updated_at = now()
+        FROM resolved r WHERE c.name = r.name AND c.teacher_id = r.teacher_id
+        RETURNING c.id
+    """, stage), params)
+    course_ids = [course_id for (course_id,) in cursor.fetchall()]
+    counts['updated'] += len(course_ids)
+    touch_courses(course_ids)
+    cursor.execute(sql(resolved + """
+        INSERT INTO {course} (name, teacher_id, date_created, deadline, updated_at)
+        SELECT r.name, r.teacher_id, r.date_created, r.deadline, now() FROM resolved r
+        WHERE NOT EXISTS (SELECT 1 FROM {course} c WHERE c.name = r.name AND c.teacher_id = r.teacher_id)
+        RETURNING id
+    """, stage), params)
+    created = [course_id for (course_id,) in cursor.fetchall()]
+    counts['created'] += len(created)
+    touch_courses(created)
+
+
+def upsert_weeks(cursor, stage, counts):
+    cursor.execute(sql("""
+        WITH {course_ids}
+        INSERT INTO {week} (course_id, week_number, start_date, end_date)
+        SELECT DISTINCT ON (c.id, s.week_number::integer) c.id, s.week_number::integer, s.start_date::date, s.end_date::date
+        FROM {staging} s JOIN course_ids c ON c.name = s.course_name
+        ORDER BY c.id, s.week_number::integer, s.line DESC
+        ON CONFLICT (course_id, week_number) DO UPDATE SET start_date = EXCLUDED.start_date, end_date = EXCLUDED.end_date
+        RETURNING course_id, (xmax = 0)
+    """, stage))
+    rows = cursor.fetchall()
+    counts['created'] += sum(1 for _, inserted in rows if inserted)
+    counts['updated'] += sum(1 for _, inserted in rows if not inserted)
+    touch_courses(course_id for course_id, _ in rows)
+
+
+def upsert_content(cursor, stage, counts):
+    resolved = """
+        WITH {course_ids}, resolved AS (
+            SELECT DISTINCT ON (w.id) w.id AS course_week_id, 'Week ' || w.week_number || ' Content' AS title, btrim(s.pdf, {whitespace}) AS pdf, w.course_id
+            FROM {staging} s
+            JOIN course_ids c ON c.name = btrim(s.course_name, {whitespace})
+            JOIN {week} w ON w.course_id = c.id AND w.week_number = s.week_number::integer
+            ORDER BY w.id, s.line DESC
+        )
+    """
+    cursor.execute(sql(resolved + """
+        UPDATE {content} t SET pdf = r.pdf FROM resolved r
+        WHERE t.course_week_id = r.course_week_id AND t.title = r.title AND t.pdf <> r.pdf
+        RETURNING r.course_id
+    """, stage, course_name=f'btrim(course_name, {WHITESPACE})'))
+    course_ids = [course_id for (course_id,) in cursor.fetchall()]
+    counts['updated'] += len(course_ids)
+    cursor.execute(sql(resolved + """
+        INSERT INTO {content} (course_week_id, title, pdf)
+        SELECT r.course_week_id, r.title, r.pdf FROM resolved r
+        WHERE NOT EXISTS (SELECT 1 FROM {content} t WHERE t.course_week_id = r.course_week_id AND t.title = r.title)
+        RETURNING (SELECT w.course_id FROM {week} w WHERE w.id = course_week_id)
+    """, stage, course_name=f'btrim(course_name, {WHITESPACE})'))
+    created = [course_id for (course_id,) in cursor.fetchall()]
+    counts['created'] += len(created)
+    touch_courses(course_ids + created)
+
+
+def upsert_enrollments(cursor, stage, counts):
+    cursor.execute(sql("""
+        WITH {course_ids}
+        INSERT INTO {enrollment} (course_id, student_id)
+        SELECT c.id, p.id FROM {staging} s
+        JOIN course_ids c ON c.name = s.course_name
+        JOIN {user} u ON u.username = s.student_username
+        JOIN {profile} p ON p.user_id = u.id
+        ON CONFLICT (course_id, student_id) DO NOTHING
+        RETURNING student_id
+    """, stage))
+    student_ids = [student_id for (student_id,) in cursor.fetchall()]
+    counts['created'] += len(student_ids)
+    touch_profiles(student_ids)
+
+
+def upsert_feedback(cursor, stage, counts):
+    cursor.execute(sql("""
+        WITH {course_ids}, resolved AS (
+            SELECT DISTINCT c.id AS course_id, p.id AS student_id, s.feedback_text,
+                   s.date_given::timestamp AT TIME ZONE %(tz)s AS date_submitted
+            FROM {staging} s
+            JOIN course_ids c ON c.name = s.course_name
+            JOIN {user} u ON u.username = s.student_username
+            JOIN {profile} p ON p.user_id = u.id
+        )
+        INSERT INTO {feedback} (course_id, student_id, feedback_text, date_submitted)
+        SELECT r.course_id, r.student_id, r.feedback_text, r.date_submitted FROM resolved r
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {feedback} f WHERE f.course_id = r.course_id AND f.student_id = r.student_id
+            AND f.date_submitted = r.date_submitted AND f.feedback_text = r.feedback_text
+        )
+        RETURNING course_id
+    """, stage), {'tz': settings.TIME_ZONE})
+    course_ids = [course_id for (course_id,) in cursor.fetchall()]
+    counts['created'] += len(course_ids)
+    touch_courses(course_ids)
+
+
+def upsert_statuses(cursor, stage, counts):
+    cursor.execute(sql("""
+        WITH resolved AS (
+            SELECT DISTINCT u.id AS user_id, btrim(s.text, {whitespace}) AS text, btrim(s.created_at, {whitespace})::timestamp AT TIME ZONE %(tz)s AS created_at
+            FROM {staging} s JOIN {user} u ON u.username = btrim(s.username, {whitespace})
+        )
+        INSERT INTO {status} (user_id, text, created_at)
+        SELECT r.user_id, r.text, r.created_at FROM resolved r
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {status} t WHERE t.user_id = r.user_id AND t.created_at = r.created_at AND t.text = r.text
+        )
+    """, stage), {'tz': settings.TIME_ZONE})
+    counts['created'] += cursor.rowcount
+
+
+UPSERTS = {
+    'users': upsert_users,
+    'courses': upsert_courses,
+    'weeks': upsert_weeks,
+    'content': upsert_content,
+    'enrollments': upsert_enrollments,
+    'feedback': upsert_feedback,
+    'statuses': upsert_statuses,
+}
+
+
+def copy_stage(stage, path, password_executor=None):
+    """Imports one CSV file through a staging table; must run inside a transaction."""
+    upsert = UPSERTS[stage.name]
+    if upsert is upsert_users:
+        upsert = partial(upsert_users, password_executor=password_executor)
+    counts = new_counts()
+    with connection.cursor() as cursor:
+        counts['rows'] = copy_into_staging(cursor, stage, path)
+        upsert(cursor, stage, counts)
+        cursor.execute(f'DROP TABLE {staging_table(stage)}')
+    return counts
@@ -0,0 +1,116 @@
+import csv
+import multiprocessing
+import os
+import tempfile
+import time
+import zlib
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import ExitStack
+
+from django.db import connections, transaction
+
+from .reader import read_chunks, read_header
+from .stages import STAGES, add_counts, new_counts
+
+STAGES_BY_NAME = {stage.name: stage for stage in STAGES}
+
+
+class SerialExecutor(Executor):
+    """Runs each submitted call straight away in the calling process, for a single-worker import."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as exc:
+            future.set_exception(exc)
+        return future
+
+
+def partition_of(row, key, partitions):
+    """Assigns a row to a partition by its natural key, the same way in every process."""
+    natural_key = '\x1f'.join(row[column].strip() for column in key)
+    return zlib.crc32(natural_key.encode()) % partitions
+
+
+def split_partitions(stage, path, batch_size, partitions, directory):
+    """Reads a CSV file once and writes each row to the partition file of its natural key, returning their paths.
+
+    Rows keep their file order within a partition, and rows sharing a natural key always land in the same one, so
+    concurrent partitions never race to create the same row. Each worker then parses only its own share of the file.
+    """
+    fieldnames = read_header(path)
+    paths = [os.path.join(directory, f"{stage.name}.{partition}.csv") for partition in range(partitions)]
+    with ExitStack() as stack:
+        writers = []
+        for partition_path in paths:
+            writer = csv.DictWriter(
+                stack.enter_context(open(partition_path, 'w', newline='', encoding='utf-8')), fieldnames, extrasaction='ignore',
+            )
+            writer.writeheader()
+            writers.append(writer)
+        for chunk, _, _ in read_chunks(path, batch_size):
+            for row in chunk:
+                writers[partition_of(row, stage.key, partitions)].writerow(row)
+    return paths
+
+
+def import_partition(stage_name, path, batch_size):
+    """Imports the rows of one partition file, committing every batch separately."""
+    stage = STAGES_BY_NAME[stage_name]
+    totals = new_counts()
+    for chunk, _, _ in read_chunks(path, batch_size):
+        with transaction.atomic():
+            add_counts(totals, stage.load(chunk, batch_size))
+    return totals
+
+
+def make_executor(workers):
+    if workers <= 1:
+        return SerialExecutor()
+    # Forked workers must not share the parent's sockets; each opens its own connection on first use.
+    connections.close_all()
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+def run_pipeline(data_dir, batch_size, workers, report, skip, stages=STAGES):
+    """Imports every stage once the stages it depends on are done, each split into `workers` concurrent partitions.
+
+    `report(stage, counts, elapsed)` is called as each stage finishes and `skip(stage, path)` for missing files.
+    """
+    partitions = max(1, workers)
+    waiting = list(stages)
+    done = set()
+    running = {}
+    progress = {}
+
+    with tempfile.TemporaryDirectory() as directory, make_executor(workers) as executor:
+        while waiting or running:
+            ready = [stage for stage in waiting if set(stage.after) <= done]
+            for stage in ready:
+                waiting.remove(stage)
+                path = os.path.join(data_dir, stage.filename)
+                if not os.path.exists(path):
+                    skip(stage, path)
+                    done.add(stage.name)
+                    continue
+                progress[stage.name] = [partitions, new_counts(), time.perf_counter()]
+                paths = [path] if partitions == 1 else split_partitions(stage, path, batch_size, partitions, directory)
+                for partition_path in paths:
+                    running[executor.submit(import_partition, stage.name, partition_path, batch_size)] = stage
+
+            if not running:
+                if waiting and not ready:
+                    raise ValueError(f"Stages {[stage.name for stage in waiting]} depend on stages that never run.")
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                stage_progress = progress[stage.name]
+                add_counts(stage_progress[1], future.result())
+                stage_progress[0] -= 1
+                if stage_progress[0] == 0:
+                    done.add(stage.name)
+                    report(stage, stage_progress[1], time.perf_counter() - stage_progress[2])
@@ -0,0 +1,53 @@
+import csv
+
+
+class TrackedLines:
+    """Iterates over the decoded lines of a binary file while keeping the byte offset of the next unread line."""
+
+    def __init__(self, file, encoding='utf-8'):
+        self.file = file
+        self.encoding = encoding
+        self.offset = file.tell()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.file.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode(self.encoding)
+
+
+def read_header(path, encoding='utf-8'):
+    with open(path, 'rb') as file:
+        return next(csv.reader(TrackedLines(file, encoding)), [])
+
+
+def read_chunks(path, chunk_size, byte_offset=0, row_number=0, encoding='utf-8'):
+    """Yields (rows, byte_offset, row_number) for each chunk of at most `chunk_size` dict rows of a CSV file.
+
+    The offset and row number are those just past the chunk, so passing them back in resumes after it.
+    Only one chunk is held in memory at a time.
+    """
+    fieldnames = read_header(path, encoding)
+    with open(path, 'rb') as file:
+        lines = TrackedLines(file, encoding)
+        if byte_offset:
+            file.seek(byte_offset)
+            lines.offset = byte_offset
+        else:
+            next(csv.reader(lines))
+        # csv.reader pulls lines one record at a time, so after each row lines.offset is at a record boundary,
+        # even when a quoted field spans several lines.
+        reader = csv.DictReader(lines, fieldnames=fieldnames)
+        chunk = []
+        for row in reader:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                row_number += len(chunk)
+                yield chunk, lines.offset, row_number
+                chunk = []
+        if chunk:
+            yield chunk, lines.offset, row_number + len(chunk)
@@ -0,0 +1,321 @@
+import logging
+from collections import namedtuple
+from functools import partial
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from ..bulk import batched, explicit_timestamps
+from ..models import UserProfile, Status, Course, CourseWeek, CourseWeekContent, Feedback, CourseStudents
+from ..signals import touch_courses, touch_profiles
+from .passwords import prepare_passwords
+
+logger = logging.getLogger(__name__)
+
+# `key` names the CSV columns forming a row's natural key; `after` names the stages whose rows this stage looks up.
+Stage = namedtuple('Stage', ['name', 'filename', 'load', 'key', 'after'])
+
+
+def new_counts():
+    return {'rows': 0, 'created': 0, 'updated': 0, 'skipped': 0}
+
+
+def add_counts(totals, counts):
+    for key in totals:
+        totals[key] += counts.get(key, 0)
+    return totals
+
+
+def parse_datetime(value):
+    """Parses the 'YYYY-MM-DD HH:MM:SS' timestamps used by the CSV files into aware datetimes."""
+    return timezone.make_aware(datetime.strptime(value.strip(), "%Y-%m-%d %H:%M:%S"))
+
+
+def parse_date(value):
+    return datetime.strptime(value.strip(), "%Y-%m-%d").date()
+
+
+def user_ids_by_username(usernames):
+    return dict(User.objects.filter(username__in=set(usernames)).values_list('username', 'id'))
+
+
+def profile_ids_by_username(usernames):
+    return dict(UserProfile.objects.filter(user__username__in=set(usernames)).values_list('user__username', 'id'))
+
+
+def course_ids_by_name(names):
+    """Maps course names to ids, keeping the oldest course when a name is used twice."""
+    course_ids = {}
+    for name, course_id in Course.objects.filter(name__in=set(names)).order_by('-id').values_list('name', 'id'):
+        course_ids[name] = course_id
+    return course_ids
+
+
+def skip(counts, stage, row, reason):
+    """Counts and logs a row that cannot be imported, keeping it in counts['skipped_rows'] for the delta import."""
+    counts['skipped'] += 1
+    counts.setdefault('skipped_rows', []).append(row)
+    logger.warning("Skipping %s row %s: %s", stage, {column: value for column, value in row.items() if 'password' not in column}, reason)
+
+
+def load_users(rows, batch_size, password_executor=None):
+    """Creates missing users, then creates or updates their profiles' roles.
+
+    Passwords come from a pre-hashed `password_hash` column when it is filled in, otherwise the plaintext `password`
+    column is hashed, spread over `password_executor`'s processes when one is given.
+    """
+    counts = new_counts()
+    for chunk in batched(rows, batch_size):
+        counts['rows'] += len(chunk)
+        rows_by_username = {row['username'].strip(): row for row in chunk}
+        existing = user_ids_by_username(rows_by_username)
+
+        new_rows = {username: row for username, row in rows_by_username.items() if username not in existing}
+        passwords = prepare_passwords(list(new_rows.values()), password_executor)
+        new_users = []
+        for (username, row), password in zip(new_rows.items(), passwords):
+            if password is None:
+                skip(counts, 'users', row, 'password_hash is not a recognised password hash')
+                del rows_by_username[username]
+                continue
+            new_users.append(User(username=username, email=row['email'].strip(), password=password))
+        User.objects.bulk_create(new_users, batch_size=batch_size, ignore_conflicts=True)
+        counts['created'] += len(new_users)
+
+        user_ids = user_ids_by_username(rows_by_username)
+        profiles = {profile.user_id: profile for profile in UserProfile.objects.filter(user_id__in=user_ids.values())}
+        new_profiles, changed_profiles = [], []
+        for username, row in rows_by_username.items():
+            role = row.get('role') or UserProfile.STUDENT
+            profile = profiles.get(user_ids[username])
+            if profile is None:
+                new_profiles.append(UserProfile(user_id=user_ids[username], role=role))
+            elif profile.role != role:
+                profile.role = role
+                profile.updated_at = timezone.now()
+                changed_profiles.append(profile)
+
+        UserProfile.objects.bulk_create(new_profiles, batch_size=batch_size, ignore_conflicts=True)
+        UserProfile.objects.bulk_update(changed_profiles, ['role', 'updated_at'], batch_size=batch_size)
+        counts['updated'] += len(changed_profiles)
+    return counts
+
+
+def load_courses(rows, batch_size):
+    """Creates or updates courses keyed by (name, teacher), keeping the CSV creation dates."""
+    counts = new_counts()
+    for chunk in batched(rows, batch_size):
+        counts['rows'] += len(chunk)
+        teachers = user_ids_by_username(row['teacher_username'].strip() for row in chunk)
+        existing = {
+            (course.name, course.teacher_id): course
+            for course in Course.objects.filter(name__in={row['course_name'] for row in chunk})
+        }
+
+        new_courses, changed_courses = {}, []
+        now = timezone.now()
+        for row in chunk:
+            teacher_id = teachers.get(row['teacher_username'].strip())
+            if teacher_id is None:
+                skip(counts, 'courses', row, f"teacher '{row['teacher_username']}' not found")
+                continue
+            key = (row['course_name'], teacher_id)
+            course = existing.get(key) or new_courses.get(key)
+            if course is None:
+                course = new_courses[key] = Course(name=row['course_name'], teacher_id=teacher_id)
+            else:
+                changed_courses.append(course)
+            course.date_created = parse_datetime(row['date_created'])
+            course.deadline = parse_datetime(row['deadline']).date()
+            course.updated_at = now
+
+        with explicit_timestamps(Course):
+            Course.objects.bulk_create(new_courses.values(), batch_size=batch_size)
+            Course.objects.bulk_update(changed_courses, ['date_created', 'deadline', 'updated_at'], batch_size=batch_size)
+        counts['created'] += len(new_courses)
+        counts['updated'] += len(changed_courses)
+        # New courses change the catalogue too, even if no later stage touches them.
+        touch_courses(course.id for course in [*new_courses.values(), *changed_courses] if course.id is not None)
+    return counts
+
+
+def load_weeks(rows, batch_size):
+    """Creates or updates course weeks keyed by (course, week_number)."""
+    counts = new_counts()
+    for chunk in batched(rows, batch_size):
+        counts['rows'] += len(chunk)
+        courses = course_ids_by_name(row['course_name'] for row in chunk)
+        existing = {
+            (week.course_id, week.week_number): week
+            for week in CourseWeek.objects.filter(course_id__in=courses.values())
+        }
+
+        new_weeks, changed_weeks = {}, []
+        for row in chunk:
+            course_id = courses.get(row['course_name'])
+            if course_id is None:
+                skip(counts, 'weeks', row, f"course '{row['course_name']}' not found")
+                continue
+            key = (course_id, int(row['week_number']))
+            week = existing.get(key) or new_weeks.get(key)
+            if week is None:
+                week = new_weeks[key] = CourseWeek(course_id=course_id, week_number=key[1])
+            else:
+                changed_weeks.append(week)
+            week.start_date = parse_date(row['start_date'])
+            week.end_date = parse_date(row['end_date'])
+
+        CourseWeek.objects.bulk_create(new_weeks.values(), batch_size=batch_size, ignore_conflicts=True)
+        CourseWeek.objects.bulk_update(changed_weeks, ['start_date', 'end_date'], batch_size=batch_size)
+        counts['created'] += len(new_weeks)
+        counts['updated'] += len(changed_weeks)
+        touch_courses(courses.values())
+    return counts
+
+
+def load_content(rows, batch_size):
+    """Creates or updates the 'Week N Content' item of each course week, pointing it at an existing PDF path."""
+    counts = new_counts()
+    for chunk in batched(rows, batch_size):
+        counts['rows'] += len(chunk)
+        courses = course_ids_by_name(row['course_name'].strip() for row in chunk)
+        weeks = {
+            (course_id, week_number): week_id
+            for week_id, course_id, week_number in CourseWeek.objects.filter(course_id__in=courses.values()).values_list('id', 'course_id', 'week_number')
+        }
+        existing = {
+            (content.course_week_id, content.title): content
+            for content in CourseWeekContent.objects.filter(course_week_id__in=weeks.values())
+        }
+
+        new_content, changed_content = {}, []
+        for row in chunk:
+            course_name, week_number = row['course_name'].strip(), int(row['week_number'])
+            week_id = weeks.get((courses.get(course_name), week_number))
+            if week_id is None:
+                skip(counts, 'content', row, f"week {week_number} of '{course_name}' not found")
+                continue
+            key = (week_id, f"Week {week_number} Content")
+            pdf_path = row['pdf'].strip()
+            content = existing.get(key) or new_content.get(key)
+            if content is None:
+                new_content[key] = CourseWeekContent(course_week_id=week_id, title=key[1], pdf=pdf_path)
+            elif content.pdf.name != pdf_path:
+                # Only the path is stored; the PDF is expected to be in MEDIA_ROOT already.
+                content.pdf.name = pdf_path
+                changed_content.append(content)
+
+        CourseWeekContent.objects.bulk_create(new_content.values(), batch_size=batch_size)
+        CourseWeekContent.objects.bulk_update(changed_content, ['pdf'], batch_size=batch_size)
+        counts['created'] += len(new_content)
+        counts['updated'] += len(changed_content)
+        touch_courses(courses.values())
+    return counts
+
+
+def load_enrollments(rows, batch_size):
+    """Enrolls students in courses, ignoring enrollments that already exist."""
+    counts = new_counts()
+    for chunk in batched(rows, batch_size):
+        counts['rows'] += len(chunk)
+        students = profile_ids_by_username(row['student_username'] for row in chunk)
+        courses = course_ids_by_name(row['course_name'] for row in chunk)
+
+        enrollments = {}
+        for row in chunk:
+            student_id, course_id = students.get(row['student_username']), courses.get(row['course_name'])
+            if student_id is None or course_id is None:
+                skip(counts, 'enrollments', row, 'student or course not found')
+                continue
+            enrollments[(course_id, student_id)] = CourseStudents(course_id=course_id, student_id=student_id)
+
+        existing = set(
+            CourseStudents.objects
+            .filter(course_id__in=courses.values(), student_id__in=students.values())
+            .values_list('course_id', 'student_id')
+        )
+        missing = [enrollment for key, enrollment in enrollments.items() if key not in existing]
+        CourseStudents.objects.bulk_create(missing, batch_size=batch_size, ignore_conflicts=True)
+        counts['created'] += len(missing)
+        touch_profiles(student_id for _, student_id in enrollments)
+    return counts
+
+
+def load_feedback(rows, batch_size):
+    """Adds feedback that is not already stored, keyed by (course, student, text, date given)."""
+    counts = new_counts()
+    for chunk in batched(rows, batch_size):
+        counts['rows'] += len(chunk)
+        students = profile_ids_by_username(row['student_username'] for row in chunk)
+        courses = course_ids_by_name(row['course_name'] for row in chunk)
+
+        new_feedback = {}
+        for row in chunk:
+            student_id, course_id = students.get(row['student_username']), courses.get(row['course_name'])
+            if student_id is None or course_id is None:
+                skip(counts, 'feedback', row, 'student or course not found')
+                continue
+            date_submitted = parse_datetime(row['date_given'])
+            new_feedback[(course_id, student_id, row['feedback_text'], date_submitted)] = Feedback(
+                course_id=course_id, student_id=student_id, feedback_text=row['feedback_text'], date_submitted=date_submitted,
+            )
+
+        existing = set(
+            Feedback.objects
+            .filter(course_id__in=courses.values(), student_id__in=students.values(), date_submitted__in={key[3] for key in new_feedback})
+            .values_list('course_id', 'student_id', 'feedback_text', 'date_submitted')
+        )
+        missing = [feedback for key, feedback in new_feedback.items() if key not in existing]
+        with explicit_timestamps(Feedback):
+            Feedback.objects.bulk_create(missing, batch_size=batch_size)
+        counts['created'] += len(missing)
+        touch_courses(feedback.course_id for feedback in missing)
+    return counts
+
+
+def load_statuses(rows, batch_size):
+    """Adds status updates that are not already stored, keyed by (user, text, created_at)."""
+    counts = new_counts()
+    for chunk in batched(rows, batch_size):
+        counts['rows'] += len(chunk)
+        users = user_ids_by_username(row['username'].strip() for row in chunk)
+
+        new_statuses = {}
+        for row in chunk:
+            user_id = users.get(row['username'].strip())
+            if user_id is None:
+                skip(counts, 'statuses', row, f"user '{row['username']}' not found")
+                continue
+            created_at = parse_datetime(row['created_at'])
+            new_statuses[(user_id, row['text'].strip(), created_at)] = Status(user_id=user_id, text=row['text'].strip(), created_at=created_at)
+
+        existing = set(
+            Status.objects
+            .filter(user_id__in=users.values(), created_at__in={key[2] for key in new_statuses})
+            .values_list('user_id', 'text', 'created_at')
+        )
+        missing = [status for key, status in new_statuses.items() if key not in existing]
+        with explicit_timestamps(Status):
+            Status.objects.bulk_create(missing, batch_size=batch_size)
+        counts['created'] += len(missing)
+    return counts
+
+
+def with_password_executor(stages, executor):
+    """Returns the stages with the users stage hashing passwords on `executor`."""
+    return [
+        stage._replace(load=partial(stage.load, password_executor=executor)) if stage.name == 'users' else stage
+        for stage in stages
+    ]
+
+
+STAGES = [
+    Stage('users', 'users.csv', load_users, ('username',), ()),
+    Stage('courses', 'courses.csv', load_courses, ('course_name', 'teacher_username'), ('users',)),
+    Stage('weeks', 'course_weeks.csv', load_weeks, ('course_name', 'week_number'), ('courses',)),
+    Stage('content', 'course_week_content.csv', load_content, ('course_name', 'week_number'), ('weeks',)),
+    Stage('enrollments', 'course_enrollment.csv', load_enrollments, ('student_username', 'course_name'), ('users', 'courses')),
+    Stage('feedback', 'feedback.csv', load_feedback, ('student_username', 'course_name', 'feedback_text', 'date_given'), ('users', 'courses')),
+    Stage('statuses', 'status.csv', load_statuses, ('username', 'text', 'created_at'), ('users',)),
+]
@@ -0,0 +1,234 @@
+import csv
+import hashlib
+import os
+from collections import defaultdict, namedtuple
+from functools import reduce
+from operator import or_
+
+from django.contrib.auth.models import User
+from django.db.models import Q
+
+from ..bulk import batched
+from ..models import UserProfile, Course, CourseWeek
+from .passwords import is_password_hash
+from .stages import STAGES, parse_date, parse_datetime
+
+LOOKUP_BATCH_SIZE = 500
+# Lines reported per missing reference; the rest are only counted.
+MAX_LOCATIONS = 5
+
+REQUIRED_COLUMNS = {
+    'users': ['username', 'email'],
+    'courses': ['course_name', 'date_created', 'deadline', 'teacher_username'],
+    'weeks': ['course_name', 'week_number', 'start_date', 'end_date'],
+    'content': ['course_name', 'week_number', 'pdf'],
+    'enrollments': ['student_username', 'course_name'],
+    'feedback': ['student_username', 'course_name', 'feedback_text', 'date_given'],
+    'statuses': ['username', 'text', 'created_at'],
+}
+
+
+class ValidationError(namedtuple('ValidationError', ['filename', 'line', 'message'])):
+    def __str__(self):
+        return f"{self.filename}:{self.line}: {self.message}"
+
+
+def key_hash(values):
+    """An 8-byte hash of a key, so the key sets of files with millions of rows stay small."""
+    return hashlib.blake2b('\x1f'.join(values).encode(), digest_size=8).digest()
+
+
+class Reference:
+    """A key referenced but not defined by the files: its values for the database lookup, and where it was used."""
+
+    __slots__ = ('values', 'count', 'locations')
+
+    def __init__(self, values):
+        self.values = values
+        self.count = 0
+        self.locations = []
+
+
+class Validator:
+    """Collects the keys each file defines and the problems found in its rows; the database is only read at the end."""
+
+    def __init__(self):
+        self.errors = []
+        self.keys = defaultdict(set)
+        # kind -> key hash -> Reference, for references not defined by an earlier file.
+        self.unresolved = defaultdict(dict)
+
+    def error(self, filename, line, message):
+        self.errors.append(ValidationError(filename, line, message))
+
+    def define(self, kind, *values):
+        self.keys[kind].add(key_hash(values))
+
+    def unique(self, kind, filename, line, label, *values):
+        digest = key_hash(values)
+        if digest in self.keys[kind]:
+            self.error(filename, line, f"duplicate {label} {' / '.join(values)}")
+        self.keys[kind].add(digest)
+
+    def require(self, kind, filename, line, *values):
+        digest = key_hash(values)
+        if digest in self.keys[kind]:
+            return
+        reference = self.unresolved[kind].get(digest)
+        if reference is None:
+            reference = self.unresolved[kind][digest] = Reference(values)
+        reference.count += 1
+        if len(reference.locations) < MAX_LOCATIONS:
+            reference.locations.append((filename, line))
+
+    def check(self, parse, filename, line, column, value):
+        try:
+            parse(value)
+        except ValueError:
+            self.error(filename, line, f"{column} '{value.strip()}' is not a {FORMATS[parse]}")
+
+    def resolve_from_database(self):
+        """Accepts references to rows that are missing from the files but already in the database."""
+        for kind, references in self.unresolved.items():
+            found = set()
+            for batch in batched(references.values(), LOOKUP_BATCH_SIZE):
+                found.update(key_hash(values) for values in DATABASE_LOOKUPS[kind]([reference.values for reference in batch]))
+            for digest, reference in references.items():
+                if digest in found:
+                    continue
+                message = f"{REFERENCE_LABELS[kind]} {' / '.join(reference.values)} not found"
+                for filename, line in reference.locations:
+                    self.error(filename, line, message)
+                unlisted = reference.count - len(reference.locations)
+                if unlisted:
+                    self.error(filename, line, f"{message} in {unlisted} more row(s)")
+
+
+def positive_int(value):
+    if int(value) < 1:
+        raise ValueError(value)
+
+
+FORMATS = {
+    parse_datetime: 'date and time (YYYY-MM-DD HH:MM:SS)',
+    parse_date: 'date (YYYY-MM-DD)',
+    positive_int: 'positive whole number',
+}
+
+
+# Keys are stripped (or not) exactly as the loaders in stages.py strip them, so validation agrees with the import.
+
+def week_number(value):
+    """A week number as the loaders' int() reads it, so '01' and '1' are the same week."""
+    try:
+        return str(int(value))
+    except ValueError:
+        return value.strip()
+
+
+def validate_user(validator, filename, line, row):
+    username = row['username'].strip()
+    if not username:
+        validator.error(filename, line, 'username is empty')
+    validator.unique('user', filename, line, 'username', username)
+    validator.define('profile', username)
+    if row.get('role') and row['role'] not in dict(UserProfile.ROLE_CHOICES):
+        validator.error(filename, line, f"role '{row['role']}' is not one of {', '.join(dict(UserProfile.ROLE_CHOICES))}")
+    if (row.get('password_hash') or '').strip() and not is_password_hash(row['password_hash'].strip()):
+        validator.error(filename, line, 'password_hash is not a recognised password hash')
+
+
+def validate_course(validator, filename, line, row):
+    validator.check(parse_datetime, filename, line, 'date_created', row['date_created'])
+    validator.check(parse_datetime, filename, line, 'deadline', row['deadline'])
+    validator.require('user', filename, line, row['teacher_username'].strip())
+    validator.define('course', row['course_name'])
+    validator.define('course', row['course_name'].strip())
+
+
+def validate_week(validator, filename, line, row):
+    validator.check(positive_int, filename, line, 'week_number', row['week_number'])
+    validator.check(parse_date, filename, line, 'start_date', row['start_date'])
+    validator.check(parse_date, filename, line, 'end_date', row['end_date'])
+    validator.require('course', filename, line, row['course_name'])
+    validator.unique('week', filename, line, 'week', row['course_name'], week_number(row['week_number']))
+    validator.define('week', row['course_name'].strip(), week_number(row['week_number']))
+
+
+def validate_content(validator, filename, line, row):
+    if not row['pdf'].strip():
+        validator.error(filename, line, 'pdf is empty')
+    validator.check(positive_int, filename, line, 'week_number', row['week_number'])
+    validator.unique('content', filename, line, 'content for week', row['course_name'].strip(), week_number(row['week_number']))
+    validator.require('week', filename, line, row['course_name'].strip(), week_number(row['week_number']))
+
+
+def validate_enrollment(validator, filename, line, row):
+    validator.require('profile', filename, line, row['student_username'])
+    validator.require('course', filename, line, row['course_name'])
+    validator.unique('enrollment', filename, line, 'enrollment', row['student_username'], row['course_name'])
+
+
+def validate_feedback(validator, filename, line, row):
+    validator.check(parse_datetime, filename, line, 'date_given', row['date_given'])
+    validator.require('profile', filename, line, row['student_username'])
+    validator.require('course', filename, line, row['course_name'])
+
+
+def validate_status(validator, filename, line, row):
+    validator.check(parse_datetime, filename, line, 'created_at', row['created_at'])
+    validator.require('user', filename, line, row['username'].strip())
+
+
+VALIDATORS = {
+    'users': validate_user,
+    'courses': validate_course,
+    'weeks': validate_week,
+    'content': validate_content,
+    'enrollments': validate_enrollment,
+    'feedback': validate_feedback,
+    'statuses': validate_status,
+}
+
+REFERENCE_LABELS = {'user': 'user', 'profile': 'student', 'course': 'course', 'week': 'week'}
+
+DATABASE_LOOKUPS = {
+    'user': lambda keys: User.objects.filter(username__in=[key[0] for key in keys]).values_list('username'),
+    'profile': lambda keys: UserProfile.objects.filter(user__username__in=[key[0] for key in keys]).values_list('user__username'),
+    'course': lambda keys: Course.objects.filter(name__in=[key[0] for key in keys]).values_list('name'),
+    'week': lambda keys: (
+        (name, str(number)) for name, number in CourseWeek.objects.filter(reduce(or_, (
+            Q(course__name=name, week_number=int(number)) for name, number in keys if number.isascii() and number.isdecimal()
+        ), Q(pk__in=[]))).values_list('course__name', 'week_number')
+    ),
+}
+
+
+def validate_files(data_dir, stages=STAGES):
+    """Streams every CSV file once and returns every problem found, in file and line order.
+
+    Only reads happen: references missing from the files are looked up in the database at the end.
+    """
+    validator = Validator()
+    for stage in stages:
+        path = os.path.join(data_dir, stage.filename)
+        if not os.path.exists(path):
+            continue
+        with open(path, newline='', encoding='utf-8') as file:
+            reader = csv.DictReader(file)
+            missing = [column for column in REQUIRED_COLUMNS[stage.name] if column not in (reader.fieldnames or [])]
+            if missing:
+                validator.error(stage.filename, 1, f"missing column(s) {', '.join(missing)}")
+                continue
+            line = 2
+            for row in reader:
+                if None in row or None in row.values():
+                    validator.error(stage.filename, line, f"expected {len(reader.fieldnames)} columns")
+                else:
+                    VALIDATORS[stage.name](validator, stage.filename, line, row)
+                # A quoted value may span several lines, so the next row starts after the last line read.
+                line = reader.line_num + 1
+
+    validator.resolve_from_database()
+    order = {stage.filename: index for index, stage in enumerate(stages)}
+    return sorted(validator.errors, key=lambda error: (order[error.filename], error.line))
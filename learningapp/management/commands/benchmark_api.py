@@ -0,0 +1,153 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+
+import requests
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from learningapp.benchmarking import compare_to_baseline, isolated_database, live_server, summarize, time_calls
+from learningapp.models import Course, Feedback, UserProfile
+
+
+def parse_list(value):
+    return [item for item in value.split(',') if item]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the REST API against generated datasets through the test client and a live local server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=lambda value: [int(size) for size in parse_list(value)], default=[10_000, 100_000],
+                            help='Comma separated dataset sizes passed to generate_dataset --rows')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per endpoint and mode')
+        parser.add_argument('--modes', type=parse_list, default=['client', 'live'], help='client, live or both')
+        parser.add_argument('--concurrency', type=int, default=1, help='Concurrent clients in live mode')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--baseline', help='JSON results from an earlier run to compare against')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative growth of p95 latency and response size')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        results = []
+        for size in options['sizes']:
+            with isolated_database():
+                call_command('generate_dataset', rows=size, seed=options['seed'], stdout=StringIO())
+                endpoints = self.endpoints()
+                if 'client' in options['modes']:
+                    results += self.run_client(size, endpoints, options)
+                if 'live' in options['modes']:
+                    with live_server() as base_url:
+                        results += self.run_live(size, base_url, endpoints, options)
+
+        report = {
+            'meta': {'sizes': options['sizes'], 'seed': options['seed'], 'requests': options['requests'],
+                     'concurrency': options['concurrency'], 'database': connection.vendor, 'created': time.time()},
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                regressions = compare_to_baseline(results, json.load(file)['results'], options['threshold'])
+            for regression in regressions:
+                self.stdout.write(self.style.WARNING(f'Regression: {regression}'))
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'{len(regressions)} regression(s) against {options["baseline"]}')
+
+    def endpoints(self):
+        """Picks the busiest student, course and teacher of the generated dataset and returns (name, url, user) triples."""
+        student = (
+            UserProfile.objects.filter(role=UserProfile.STUDENT).select_related('user')
+            .annotate(enrolled=Count('course_students')).order_by('-enrolled', 'id').first()
+        )
+        course_id = Feedback.objects.values_list('course').annotate(total=Count('id')).order_by('-total', 'course').first()[0]
+        teacher = Course.objects.values_list('teacher').annotate(total=Count('id')).order_by('-total', 'teacher').first()[0]
+        teacher = UserProfile.objects.select_related('user').get(user_id=teacher).user
+        username = student.user.username
+
+        return [
+            ('user_courses_api', reverse('user_courses_api', kwargs={'username': username}), None),
+            ('user_course_details_api', reverse('user_course_details_api', kwargs={'course_id': course_id}), None),
+            ('course_feedback_api', reverse('course_feedback_api', kwargs={'course_id': course_id}), None),
+            ('courses_not_enrolled_api', reverse('courses_not_enrolled_api', kwargs={'username': username}), None),
+            ('teacher_courses_api', reverse('teacher_courses_api'), teacher),
+            ('get_enrolled_students_api', reverse('get_enrolled_students_api', kwargs={'course_id': course_id}), teacher),
+        ]
+
+    def record(self, size, mode, name, samples, wall_time, queries, response_bytes):
+        entry = {
+            'key': f'{size}/{mode}/{name}', 'size': size, 'mode': mode, 'endpoint': name,
+            **summarize(samples),
+            'throughput_rps': round(len(samples) / wall_time, 1),
+            'queries': queries,
+            'bytes': response_bytes,
+        }
+        self.stdout.write(
+            f"{entry['key']:<45} p50 {entry['p50_ms']:>8}ms  p95 {entry['p95_ms']:>8}ms  p99 {entry['p99_ms']:>8}ms  "
+            f"{entry['throughput_rps']:>7} req/s  {queries if queries is not None else '-':>3} queries  {response_bytes:>8} bytes"
+        )
+        return entry
+
+    def run_client(self, size, endpoints, options):
+        results = []
+        for name, url, user in endpoints:
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+
+            def request():
+                response = client.get(url)
+                if response.status_code >= 400:
+                    raise CommandError(f'{url} returned {response.status_code}')
+                return response
+
+            with CaptureQueriesContext(connection) as queries:
+                response = request()
+            query_count = len(queries)
+            started = time.perf_counter()
+            samples = time_calls(request, options['requests'])
+            results.append(self.record(size, 'client', name, samples, time.perf_counter() - started, query_count, len(response.content)))
+        return results
+
+    def run_live(self, size, base_url, endpoints, options):
+        results = []
+        for name, url, user in endpoints:
+            cookies = {}
+            if user is not None:
+                client = Client()
+                client.force_login(user)
+                cookies[settings.SESSION_COOKIE_NAME] = client.cookies[settings.SESSION_COOKIE_NAME].value
+            sessions = threading.local()
+
+            def request():
+                if not hasattr(sessions, 'session'):
+                    sessions.session = requests.Session()
+                    sessions.session.cookies.update(cookies)
+                response = sessions.session.get(base_url + url)
+                if response.status_code >= 400:
+                    raise CommandError(f'{url} returned {response.status_code}')
+                return response
+
+            def timed_request(_):
+                started = time.perf_counter()
+                request()
+                return time.perf_counter() - started
+
+            response = request()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                samples = list(pool.map(timed_request, range(options['requests'])))
+            results.append(self.record(size, 'live', name, samples, time.perf_counter() - started, None, len(response.content)))
+        return results
@@ -0,0 +1,72 @@
+import json
+import random
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from learningapp.benchmarking import isolated_database, summarize, time_calls
+from learningapp.models import Course, CourseStudents, UserProfile
+
+
+def parse_sizes(value):
+    return [int(size) for size in value.split(',') if size]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark courses_not_enrolled_api as the catalogue and a student\'s enrollments grow (runs in a throwaway test database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--catalogue-sizes', type=parse_sizes, default=[1000, 10000, 100000])
+        parser.add_argument('--enrollments', type=parse_sizes, default=[10, 1000, 5000])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            results = self.run_benchmark(options)
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2)
+
+    def run_benchmark(self, options):
+        rng = random.Random(options['seed'])
+        teacher = User.objects.create_user(username='bench_teacher')
+        student = User.objects.create_user(username='bench_student')
+        profile = UserProfile.objects.create(user=student)
+
+        client = Client()
+        url = reverse('courses_not_enrolled_api', kwargs={'username': student.username})
+        results = []
+
+        self.stdout.write(f"{'courses':>9} {'enrolled':>9} {'page':>6} {'p50 ms':>9} {'p95 ms':>9}")
+        for size in sorted(options['catalogue_sizes']):
+            missing = size - Course.objects.count()
+            for start in range(0, missing, options['batch_size']):
+                Course.objects.bulk_create(
+                    [Course(name=f'Course {start + offset}', teacher=teacher) for offset in range(min(options['batch_size'], missing - start))],
+                    batch_size=options['batch_size'],
+                )
+            course_ids = list(Course.objects.values_list('id', flat=True))
+
+            for enrolled in sorted(options['enrollments']):
+                if enrolled > size:
+                    continue
+                CourseStudents.objects.filter(student=profile).delete()
+                CourseStudents.objects.bulk_create(
+                    [CourseStudents(course_id=course_id, student=profile) for course_id in rng.sample(course_ids, enrolled)],
+                    batch_size=options['batch_size'],
+                )
+
+                deep_after = course_ids[-(enrolled + 100)] if size > enrolled + 100 else 0
+                for page, params in (('first', {}), ('deep', {'after': deep_after})):
+                    samples = time_calls(lambda: client.get(url, params), options['repeat'])
+                    summary = summarize(samples)
+                    results.append({'courses': size, 'enrolled': enrolled, 'page': page, **summary})
+                    self.stdout.write(f"{size:>9} {enrolled:>9} {page:>6} {summary['p50_ms']:>9} {summary['p95_ms']:>9}")
+
+        return results
@@ -0,0 +1,118 @@
+import csv
+import gzip
+import json
+import os
+import time
+from collections import namedtuple
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from learningapp.models import Status, Course, CourseWeek, CourseWeekContent, Feedback, CourseStudents
+
+# One export file: the CSV columns import_csv reads, and the values_list fields (and formatters) producing them.
+Export = namedtuple('Export', ['filename', 'columns', 'queryset', 'fields'])
+
+
+def text(value):
+    return '' if value is None else str(value)
+
+
+def timestamp(value):
+    """Formats a datetime the way the import files write them: naive, in the current time zone, to the second."""
+    return '' if value is None else timezone.localtime(value).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def deadline(value):
+    return '' if value is None else value.strftime("%Y-%m-%d 00:00:00")
+
+
+EXPORTS = [
+    Export('users', ['username', 'email', 'password', 'password_hash', 'first_name', 'last_name', 'role'], User.objects, [
+        ('username', text), ('email', text), (None, text), ('password', text),
+        ('first_name', text), ('last_name', text), ('userprofile__role', text),
+    ]),
+    Export('courses', ['course_name', 'date_created', 'deadline', 'teacher_username'], Course.objects, [
+        ('name', text), ('date_created', timestamp), ('deadline', deadline), ('teacher__username', text),
+    ]),
+    Export('course_weeks', ['course_name', 'week_number', 'start_date', 'end_date'], CourseWeek.objects, [
+        ('course__name', text), ('week_number', text), ('start_date', text), ('end_date', text),
+    ]),
+    Export('course_week_content', ['course_name', 'week_number', 'pdf'], CourseWeekContent.objects, [
+        ('course_week__course__name', text), ('course_week__week_number', text), ('pdf', text),
+    ]),
+    Export('course_enrollment', ['student_username', 'course_name'], CourseStudents.objects, [
+        ('student__user__username', text), ('course__name', text),
+    ]),
+    Export('feedback', ['student_username', 'course_name', 'feedback_text', 'date_given'], Feedback.objects, [
+        ('student__user__username', text), ('course__name', text), ('feedback_text', text), ('date_submitted', timestamp),
+    ]),
+    Export('status', ['username', 'text', 'created_at'], Status.objects, [
+        ('user__username', text), ('text', text), ('created_at', timestamp),
+    ]),
+]
+
+
+def export_rows(export, chunk_size):
+    """Streams the export's rows as lists of strings straight from values_list, without building model instances."""
+    fields = [field for field, _ in export.fields if field is not None]
+    for values in export.queryset.order_by('id').values_list(*fields).iterator(chunk_size=chunk_size):
+        values = iter(values)
+        # Columns without a field (the plaintext password) are always left empty.
+        yield [formatter(None if field is None else next(values)) for field, formatter in export.fields]
+
+
+class Command(BaseCommand):
+    help = 'Export every model to the CSV files import_csv reads (or to JSON lines), streaming the rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', default='export', help='Directory the files are written to')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Compress every file with gzip')
+        parser.add_argument('--snapshot', action='store_true',
+                            help='Read every file from one consistent snapshot (a repeatable-read transaction on PostgreSQL)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the database at a time')
+
+    def handle(self, *args, **options):
+        os.makedirs(options['output_dir'], exist_ok=True)
+        if not options['snapshot']:
+            self.export_all(options)
+            return
+
+        # Called from inside a transaction (as in tests), the export shares it and keeps its isolation level.
+        nested = connection.in_atomic_block
+        with transaction.atomic():
+            if connection.vendor == 'postgresql' and not nested:
+                # Must be the transaction's first statement; every later query then sees the same snapshot.
+                with connection.cursor() as cursor:
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+            # Elsewhere a single transaction is the snapshot: SQLite holds its read lock until the transaction ends.
+            self.export_all(options)
+
+    def export_all(self, options):
+        for export in EXPORTS:
+            filename = f"{export.filename}.{options['format']}" + ('.gz' if options['gzip'] else '')
+            path = os.path.join(options['output_dir'], filename)
+            started = time.perf_counter()
+            opener = gzip.open if options['gzip'] else open
+            with opener(path, 'wt', newline='', encoding='utf-8') as file:
+                count = self.write(file, export, options)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"Exported {count} rows to {path} in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} rows/s)")
+
+    def write(self, file, export, options):
+        count = 0
+        rows = export_rows(export, options['chunk_size'])
+        if options['format'] == 'csv':
+            writer = csv.writer(file)
+            writer.writerow(export.columns)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        else:
+            for row in rows:
+                file.write(json.dumps(dict(zip(export.columns, row))) + '\n')
+                count += 1
+        return count
@@ -0,0 +1,139 @@
+import random
+import time
+
+import factory.random
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from learningapp.bulk import batched, explicit_timestamps
+from learningapp.cache import touch_catalogue
+from learningapp.factories import (
+    UserFactory, UserProfileFactory, CourseFactory, CourseWeekFactory, CourseWeekContentFactory,
+    FeedbackFactory, CourseStudentsFactory, StatusFactory, reset_sequences,
+)
+from learningapp.models import UserProfile, Course, CourseStudents, Status, CourseWeek, CourseWeekContent, Feedback
+
+# Share of the requested row count given to each table. Weeks and content follow from WEEKS_PER_COURSE.
+USER_SHARE = 0.08
+COURSE_SHARE = 0.004
+ENROLLMENT_SHARE = 0.40
+FEEDBACK_SHARE = 0.15
+STATUS_SHARE = 0.19
+TEACHER_SHARE = 0.05
+WEEKS_PER_COURSE = 12
+
+
+class Command(BaseCommand):
+    help = 'Generate a deterministic synthetic dataset of roughly --rows rows using bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000, help='Approximate total number of rows to create (10k to 10M)')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for every random choice, so a run can be reproduced')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', default='password', help='Password given to every generated user (hashed once)')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        if rows < 1000:
+            raise CommandError('--rows must be at least 1000.')
+        if User.objects.filter(username=UserFactory.username.function(0)).exists():
+            raise CommandError('A generated dataset already exists in this database; flush it before generating another.')
+
+        self.batch_size = options['batch_size']
+        self.rng = random.Random(options['seed'])
+        factory.random.reseed_random(options['seed'])
+        reset_sequences()
+
+        n_users = max(2, int(rows * USER_SHARE))
+        n_teachers = max(1, int(n_users * TEACHER_SHARE))
+        n_courses = max(1, int(rows * COURSE_SHARE))
+
+        with explicit_timestamps(User, UserProfile, Course, Feedback, Status):
+            teacher_ids, student_user_ids, student_profile_ids = self.create_users(n_users, n_teachers, options['password'])
+            course_ids = self.create_courses(n_courses, teacher_ids)
+            self.create_enrollments(int(rows * ENROLLMENT_SHARE), course_ids, student_profile_ids)
+            self.create_feedback(int(rows * FEEDBACK_SHARE), course_ids, student_profile_ids)
+            self.create_statuses(int(rows * STATUS_SHARE), teacher_ids + student_user_ids)
+
+        touch_catalogue()
+
+    def report(self, label, count, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'Created {count} {label} in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} rows/s)')
+
+    def create_users(self, n_users, n_teachers, password):
+        started = time.perf_counter()
+        password_hash = make_password(password, salt='generateddataset')
+        teacher_ids, student_user_ids, student_profile_ids = [], [], []
+
+        for batch in batched(range(n_users), self.batch_size):
+            with transaction.atomic():
+                users = User.objects.bulk_create(UserFactory.build_batch(len(batch), password=password_hash))
+                profiles = UserProfile.objects.bulk_create([
+                    UserProfileFactory.build(user=user, role=UserProfile.TEACHER if index < n_teachers else UserProfile.STUDENT)
+                    for index, user in zip(batch, users)
+                ])
+            for profile in profiles:
+                if profile.role == UserProfile.TEACHER:
+                    teacher_ids.append(profile.user_id)
+                else:
+                    student_user_ids.append(profile.user_id)
+                    student_profile_ids.append(profile.id)
+
+        self.report('user and profile rows', n_users * 2, started)
+        return teacher_ids, student_user_ids, student_profile_ids
+
+    def create_courses(self, n_courses, teacher_ids):
+        started = time.perf_counter()
+        course_ids = []
+
+        for batch in batched(range(n_courses), self.batch_size // WEEKS_PER_COURSE or 1):
+            with transaction.atomic():
+                courses = Course.objects.bulk_create([
+                    CourseFactory.build(teacher=User(id=self.rng.choice(teacher_ids))) for _ in batch
+                ])
+                weeks = CourseWeek.objects.bulk_create([
+                    CourseWeekFactory.build(course=course, week_number=number)
+                    for course in courses for number in range(1, WEEKS_PER_COURSE + 1)
+                ])
+                CourseWeekContent.objects.bulk_create([CourseWeekContentFactory.build(course_week=week) for week in weeks])
+            course_ids.extend(course.id for course in courses)
+
+        self.report('course, week and content rows', n_courses * (1 + 2 * WEEKS_PER_COURSE), started)
+        return course_ids
+
+    def create_enrollments(self, n_enrollments, course_ids, student_profile_ids):
+        started = time.perf_counter()
+        for batch in batched(range(n_enrollments), self.batch_size):
+            # Duplicate (course, student) pairs are drawn deterministically and skipped by the unique constraint.
+            CourseStudents.objects.bulk_create(
+                [
+                    CourseStudentsFactory.build(
+                        course=Course(id=self.rng.choice(course_ids)),
+                        student=UserProfile(id=self.rng.choice(student_profile_ids)),
+                    )
+                    for _ in batch
+                ],
+                ignore_conflicts=True,
+            )
+        self.report('enrollments (duplicates skipped)', n_enrollments, started)
+
+    def create_feedback(self, n_feedback, course_ids, student_profile_ids):
+        started = time.perf_counter()
+        for batch in batched(range(n_feedback), self.batch_size):
+            Feedback.objects.bulk_create([
+                FeedbackFactory.build(
+                    course=Course(id=self.rng.choice(course_ids)),
+                    student=UserProfile(id=self.rng.choice(student_profile_ids)),
+                )
+                for _ in batch
+            ])
+        self.report('feedback entries', n_feedback, started)
+
+    def create_statuses(self, n_statuses, user_ids):
+        started = time.perf_counter()
+        for batch in batched(range(n_statuses), self.batch_size):
+            Status.objects.bulk_create([StatusFactory.build(user=User(id=self.rng.choice(user_ids))) for _ in batch])
+        self.report('statuses', n_statuses, started)
@@ -1,23 +1,94 @@
 import csv
 import os
-from django.core.management.base import BaseCommand
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 from django.contrib.auth.models import User
 from django.core.files import File
 from django.conf import settings
-from learningapp.models import UserProfile, Status, Course, CourseWeek, CourseWeekContent, Feedback, CourseStudents
+from learningapp.models import UserProfile, Status, Course, CourseWeek, CourseWeekContent, Feedback, CourseStudents, ImportCheckpoint
 from datetime import datetime
 from django.utils import timezone
+from learningapp.importing.delta import delete_missing, forget_dependents, import_delta_chunk, key_digest, key_values
+from learningapp.importing.passwords import hashing_pool
+from learningapp.importing.pgcopy import copy_stage
+from learningapp.importing.pipeline import run_pipeline
+from learningapp.importing.reader import read_chunks
+from learningapp.importing.stages import STAGES, add_counts, new_counts, with_password_executor
+from learningapp.importing.validation import validate_files
 
 MEDIA_ROOT = settings.MEDIA_ROOT  # Ensure MEDIA_ROOT is properly set
 
 class Command(BaseCommand):
     help = 'Import data from CSV files into the database'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--data-dir', default='data', help='Directory holding the CSV files')
+        parser.add_argument('--bulk', action='store_true',
+                            help='Preload lookups and write in batches, with one transaction per file, instead of row by row')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per batch in --bulk and --resumable mode')
+        parser.add_argument('--resumable', action='store_true',
+                            help='Bulk import in separately committed chunks of --batch-size rows, checkpointing each one '
+                                 'so that an interrupted run resumes where it stopped')
+        parser.add_argument('--restart', action='store_true', help='Discard checkpoints left by an interrupted --resumable run')
+        parser.add_argument('--validate-only', action='store_true', help='Check every file and report problems without importing')
+        parser.add_argument('--no-validate', action='store_true', help='Skip the check of every file that runs before importing')
+        parser.add_argument('--delta', action='store_true',
+                            help='Bulk import only the rows whose content changed since the last --delta run, '
+                                 'comparing a fingerprint stored per natural key')
+        parser.add_argument('--delete', action='store_true',
+                            help='With --delta, also delete previously imported rows that are missing from the files')
+        parser.add_argument('--copy', action='store_true',
+                            help='PostgreSQL only: COPY each file into an unlogged staging table and upsert from there in set-based SQL')
+        parser.add_argument('--hash-workers', type=int,
+                            help='Processes hashing plaintext passwords in --bulk, --resumable and --copy mode '
+                                 '(default: one per core); with --workers each worker hashes its own users')
+        parser.add_argument('--workers', type=int,
+                            help='Bulk import with this many worker processes, running independent files and '
+                                 'partitions of each file concurrently once the files they depend on are imported')
+
     def handle(self, *args, **kwargs):
+        data_dir = kwargs.get('data_dir', 'data')
+        if kwargs.get('delete') and not kwargs.get('delta'):
+            raise CommandError('--delete only works together with --delta.')
+        if kwargs.get('delta'):
+            for option in ['copy', 'workers', 'resumable']:
+                if kwargs.get(option):
+                    raise CommandError(f"--delta cannot be combined with --{option}.")
+        if kwargs.get('copy') and connection.vendor != 'postgresql':
+            raise CommandError('--copy needs a PostgreSQL database.')
+        if kwargs.get('workers'):
+            if kwargs.get('resumable'):
+                raise CommandError('--workers cannot be combined with --resumable.')
+            if kwargs['workers'] > 1 and connection.vendor == 'sqlite' and connection.settings_dict['OPTIONS'].get('transaction_mode') != 'IMMEDIATE':
+                raise CommandError("SQLite needs OPTIONS['transaction_mode'] = 'IMMEDIATE' for concurrent --workers to wait for each other's writes.")
+        if not kwargs.get('no_validate'):
+            self.validate(data_dir)
+            if kwargs.get('validate_only'):
+                return
+        if kwargs.get('copy'):
+            with hashing_pool(kwargs.get('hash_workers')) as executor:
+                self.import_copy(data_dir, executor)
+            return
+        if kwargs.get('workers'):
+            run_pipeline(data_dir, kwargs['batch_size'], kwargs['workers'], self.report, self.skip)
+            return
+        if kwargs.get('delta'):
+            with hashing_pool(kwargs.get('hash_workers')) as executor:
+                self.import_delta(data_dir, kwargs['batch_size'], kwargs['delete'], with_password_executor(STAGES, executor))
+            return
+        if kwargs.get('resumable'):
+            with hashing_pool(kwargs.get('hash_workers')) as executor:
+                self.import_resumable(data_dir, kwargs['batch_size'], kwargs['restart'], with_password_executor(STAGES, executor))
+            return
+        if kwargs.get('bulk'):
+            with hashing_pool(kwargs.get('hash_workers')) as executor:
+                self.import_bulk(data_dir, kwargs['batch_size'], with_password_executor(STAGES, executor))
+            return
 
         try:
             # Import Users
-            with open('data/users.csv', 'r') as file:
+            with open(os.path.join(data_dir, 'users.csv'), 'r') as file:
                 reader = csv.DictReader(file)
                 for row in reader:
                     user, created = User.objects.get_or_create(username=row['username'], email=row['email'])
@@ -33,7 +104,7 @@ class Command(BaseCommand):
 
         try:
             # Import Courses
-            with open('data/courses.csv', 'r') as file:
+            with open(os.path.join(data_dir, 'courses.csv'), 'r') as file:
                 reader = csv.DictReader(file)
                 for row in reader:
                     teacher = User.objects.get(username=row['teacher_username'])
@@ -51,7 +122,7 @@ class Command(BaseCommand):
 
         try:
             # Import Course Weeks
-            with open('data/course_weeks.csv', 'r') as file:
+            with open(os.path.join(data_dir, 'course_weeks.csv'), 'r') as file:
                 reader = csv.DictReader(file)
                 for row in reader:
                     # Try to get the course by name
@@ -77,7 +148,7 @@ class Command(BaseCommand):
 
         # Import Course Week Content
         try:
-            with open('data/course_week_content.csv', newline='', encoding='utf-8') as csvfile:
+            with open(os.path.join(data_dir, 'course_week_content.csv'), newline='', encoding='utf-8') as csvfile:
                 reader = csv.DictReader(csvfile)
                 for row in reader:
                     course_name = row['course_name'].strip()
@@ -110,7 +181,7 @@ class Command(BaseCommand):
 
         try:
             # Import Course Enrollment
-            with open('data/course_enrollment.csv', 'r') as file:
+            with open(os.path.join(data_dir, 'course_enrollment.csv'), 'r') as file:
                 reader = csv.DictReader(file)
                 for row in reader:
                     student_profile = UserProfile.objects.get(user__username=row['student_username'])
@@ -122,7 +193,7 @@ class Command(BaseCommand):
 
         try:
             # Import Feedback
-            with open('data/feedback.csv', 'r') as file:
+            with open(os.path.join(data_dir, 'feedback.csv'), 'r') as file:
                 reader = csv.DictReader(file)
                 for row in reader:
                     student_profile = UserProfile.objects.get(user__username=row['student_username'])
@@ -146,7 +217,7 @@ class Command(BaseCommand):
 
         # Import Status
         try:
-            with open('data/status.csv', newline='', encoding='utf-8') as csvfile:
+            with open(os.path.join(data_dir, 'status.csv'), newline='', encoding='utf-8') as csvfile:
                 reader = csv.DictReader(csvfile)
                 for row in reader:
                     username = row['username'].strip()
@@ -172,5 +243,114 @@ class Command(BaseCommand):
         except Exception as e:
             print(f"Error importing status updates: {e}")
 
-        
+    def import_bulk(self, data_dir, batch_size, stages):
+        for stage in stages:
+            path = os.path.join(data_dir, stage.filename)
+            if not os.path.exists(path):
+                self.skip(stage, path)
+                continue
+
+            started = time.perf_counter()
+            with open(path, newline='', encoding='utf-8') as file, transaction.atomic():
+                counts = stage.load(csv.DictReader(file), batch_size)
+            self.report(stage, counts, time.perf_counter() - started)
+
+    def import_copy(self, data_dir, password_executor):
+        for stage in STAGES:
+            path = os.path.join(data_dir, stage.filename)
+            if not os.path.exists(path):
+                self.skip(stage, path)
+                continue
+
+            started = time.perf_counter()
+            with transaction.atomic():
+                counts = copy_stage(stage, path, password_executor)
+            self.report(stage, counts, time.perf_counter() - started)
+
+    def import_delta(self, data_dir, batch_size, delete, stages):
+        seen = {}
+        for stage in stages:
+            path = os.path.join(data_dir, stage.filename)
+            if not os.path.exists(path):
+                self.skip(stage, path)
+                continue
+
+            started = time.perf_counter()
+            totals = {**new_counts(), 'unchanged': 0}
+            keys = set()
+            for rows, _, _ in read_chunks(path, batch_size):
+                if delete:
+                    keys.update(key_digest(key_values(stage, row)) for row in rows)
+                with transaction.atomic():
+                    add_counts(totals, import_delta_chunk(stage, rows, batch_size))
+            self.report(stage, totals, time.perf_counter() - started)
+            self.stdout.write(f"Skipped {totals['unchanged']} unchanged {stage.name} rows")
+            if delete:
+                seen[stage.name] = keys
+
+        # Dependent rows go first, so deletes of users or courses do not cascade into rows not yet compared.
+        for stage in reversed(stages):
+            if stage.name in seen:
+                with transaction.atomic():
+                    deleted = delete_missing(stage, seen[stage.name])
+                    if deleted:
+                        forget_dependents(stage, stages)
+                self.stdout.write(f"Deleted {deleted} {stage.name} rows missing from {stage.filename}")
+
+    def import_resumable(self, data_dir, batch_size, restart, stages):
+        if restart:
+            ImportCheckpoint.objects.all().delete()
+
+        for stage in stages:
+            path = os.path.join(data_dir, stage.filename)
+            if not os.path.exists(path):
+                self.skip(stage, path)
+                continue
+
+            checkpoint = ImportCheckpoint.objects.filter(stage=stage.name).first()
+            if checkpoint is not None and not checkpoint.matches(path):
+                self.stdout.write(f"{path} changed since it was checkpointed. Importing {stage.name} from the start...")
+                checkpoint.delete()
+                checkpoint = None
+            if checkpoint is None:
+                stat = os.stat(path)
+                checkpoint = ImportCheckpoint(stage=stage.name, path=os.path.abspath(path), file_size=stat.st_size, file_mtime=stat.st_mtime)
+            elif checkpoint.completed:
+                self.stdout.write(f"{stage.name} was already imported. Skipping...")
+                continue
+            else:
+                self.stdout.write(f"Resuming {stage.name} after row {checkpoint.row_number}...")
+
+            started = time.perf_counter()
+            totals = new_counts()
+            for rows, byte_offset, row_number in read_chunks(path, batch_size, checkpoint.byte_offset, checkpoint.row_number):
+                # The checkpoint is saved in the chunk's transaction, so it never runs ahead of or behind the data.
+                with transaction.atomic():
+                    counts = stage.load(rows, batch_size)
+                    checkpoint.byte_offset, checkpoint.row_number = byte_offset, row_number
+                    checkpoint.save()
+                add_counts(totals, counts)
+            checkpoint.completed = True
+            checkpoint.save()
+            self.report(stage, totals, time.perf_counter() - started)
+
+        ImportCheckpoint.objects.all().delete()
+
+    def validate(self, data_dir):
+        """Checks every file in one streaming pass, so that no bad row is found halfway through an import."""
+        started = time.perf_counter()
+        errors = validate_files(data_dir)
+        for error in errors:
+            self.stderr.write(str(error))
+        if errors:
+            raise CommandError(f"Found {len(errors)} problem(s) in the files in {data_dir}; nothing was imported.")
+        self.stdout.write(f"Validated the files in {data_dir} in {time.perf_counter() - started:.2f}s")
+
+    def skip(self, stage, path):
+        self.stdout.write(f"{path} not found. Skipping {stage.name}...")
 
+    def report(self, stage, counts, elapsed):
+        self.stdout.write(
+            f"Imported {stage.name}: {counts['rows']} rows ({counts['created']} created, {counts['updated']} updated, "
+            f"{counts['skipped']} skipped) in {elapsed:.2f}s ({counts['rows'] / max(elapsed, 1e-9):.0f} rows/s)"
+        )
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learningapp', '0009_course_updated_at_userprofile_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['course', 'date_submitted', 'id'], name='feedback_course_date_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learningapp', '0010_feedback_course_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='coursestudents',
+            index=models.Index(fields=['student', 'course'], name='coursestudents_student_idx'),
+        ),
+    ]
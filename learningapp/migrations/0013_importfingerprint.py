@@ -0,0 +1,26 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learningapp', '0012_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(max_length=50)),
+                ('key_digest', models.CharField(max_length=40)),
+                ('key', models.JSONField()),
+                ('fingerprint', models.CharField(max_length=40)),
+            ],
+            options={
+                'unique_together': {('stage', 'key_digest')},
+            },
+        ),
+    ]
@@ -1,3 +1,4 @@
+import os
 from django.db import models
 from django.contrib.auth.models import User
 
@@ -14,6 +15,7 @@ class Course(models.Model):
     deadline = models.DateField(null=True, blank=True)
     teacher = models.ForeignKey(User, on_delete=models.CASCADE, related_name="courses_taught")
     image = models.ImageField(upload_to=course_image_upload_path, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -30,6 +32,7 @@ class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default=STUDENT)
     courses_enrolled = models.ManyToManyField("Course", through='CourseStudents', related_name="user_profiles", blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.user.username} - {self.role}"
@@ -77,6 +80,11 @@ class Feedback(models.Model):
     feedback_text = models.TextField()
     date_submitted = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['course', 'date_submitted', 'id'], name='feedback_course_date_idx'),
+        ]
+
     def __str__(self):
         return f"Feedback for {self.course.name} by {self.student.user.username}"
 
@@ -87,6 +95,41 @@ class CourseStudents(models.Model):
 
     class Meta:
         unique_together = ('course', 'student')
+        indexes = [
+            models.Index(fields=['student', 'course'], name='coursestudents_student_idx'),
+        ]
 
     def __str__(self):
         return f"{self.student.user.username} enrolled in {self.course.name}"
+
+class ImportCheckpoint(models.Model):
+    """Records how far a resumable import_csv run got through one CSV file."""
+    stage = models.CharField(max_length=50, unique=True)
+    path = models.CharField(max_length=500)
+    file_size = models.BigIntegerField()
+    file_mtime = models.FloatField()
+    byte_offset = models.BigIntegerField(default=0)
+    row_number = models.PositiveBigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def matches(self, path):
+        """Whether the checkpoint was taken on this exact file, unchanged since."""
+        stat = os.stat(path)
+        return self.path == os.path.abspath(path) and self.file_size == stat.st_size and self.file_mtime == stat.st_mtime
+
+    def __str__(self):
+        return f"{self.stage}: row {self.row_number} of {self.path}"
+
+class ImportFingerprint(models.Model):
+    """The hash of the last imported version of a CSV row, stored under its natural key for delta imports."""
+    stage = models.CharField(max_length=50)
+    key_digest = models.CharField(max_length=40)
+    key = models.JSONField()
+    fingerprint = models.CharField(max_length=40)
+
+    class Meta:
+        unique_together = ('stage', 'key_digest')
+
+    def __str__(self):
+        return f"{self.stage}: {self.key}"
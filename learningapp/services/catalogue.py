@@ -0,0 +1,31 @@
+from django.db.models import Exists, OuterRef
+
+from ..models import Course, CourseStudents
+
+CATALOGUE_PAGE_SIZE = 50
+CATALOGUE_MAX_PAGE_SIZE = 200
+
+
+def courses_not_enrolled_queryset(user_profile):
+    """Returns the courses a profile is not enrolled in as a single NOT EXISTS anti-join."""
+    enrollment = CourseStudents.objects.filter(course=OuterRef('pk'), student=user_profile)
+    return Course.objects.filter(~Exists(enrollment)).order_by('id')
+
+
+def get_courses_not_enrolled_page(user_profile, after=None, page_size=None):
+    """Returns one page of courses a profile is not enrolled in, seeking past the course id `after`.
+
+    The second element is the id to continue from, or None on the last page.
+    """
+    try:
+        page_size = max(1, min(int(page_size or CATALOGUE_PAGE_SIZE), CATALOGUE_MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        page_size = CATALOGUE_PAGE_SIZE
+
+    courses = courses_not_enrolled_queryset(user_profile)
+    if after:
+        courses = courses.filter(id__gt=after)
+
+    rows = list(courses[:page_size + 1])
+    next_after = rows[page_size - 1].id if len(rows) > page_size else None
+    return rows[:page_size], next_after
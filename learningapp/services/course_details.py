@@ -0,0 +1,36 @@
+from django.db.models import Prefetch
+from django.shortcuts import get_object_or_404
+
+from ..cache import course_cache_key, get_or_build
+from ..models import Course, CourseWeek
+from ..serializers import CourseSerializer, CourseWeekSerializer
+from .feedback import get_feedback_page
+
+
+def course_details_queryset():
+    """Returns the Course queryset with weeks and week content prefetched in one plan."""
+    return Course.objects.prefetch_related(
+        Prefetch('weeks', queryset=CourseWeek.objects.order_by('week_number').prefetch_related('content')),
+    )
+
+
+def get_course_details(course_id):
+    """Builds the course detail structure (course, weeks with content, first feedback page) shared by the API and HTML views.
+
+    Serialized without a request, so image and PDF URLs stay relative to the site as the API has always returned them.
+    """
+    course = get_object_or_404(course_details_queryset(), id=course_id)
+
+    response_data = CourseSerializer(course).data
+    response_data['weeks'] = CourseWeekSerializer(course.weeks.all(), many=True).data
+    feedback_page = get_feedback_page(course.id)
+    response_data['feedback'] = feedback_page['results']
+    response_data['feedback_next_cursor'] = feedback_page['next_cursor']
+
+    return response_data
+
+
+def get_cached_course_details(course_id):
+    """Returns the course detail structure from the per-course cache, rebuilding it after any change to the course."""
+    key = course_cache_key(course_id, 'details')
+    return get_or_build(key, lambda: get_course_details(course_id))
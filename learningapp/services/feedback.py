@@ -0,0 +1,62 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+from ..models import Feedback
+from ..serializers import FeedbackSerializer
+
+FEEDBACK_PAGE_SIZE = 20
+FEEDBACK_MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    """Raised when a feedback cursor cannot be decoded."""
+
+
+def encode_cursor(feedback):
+    """Encodes the position after a feedback row as an opaque, URL-safe cursor."""
+    position = json.dumps([feedback.date_submitted.isoformat(), feedback.id])
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decodes a cursor produced by encode_cursor into (date_submitted, id)."""
+    try:
+        date_submitted, feedback_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(date_submitted), int(feedback_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+
+
+def get_feedback_page(course_id, cursor=None, page_size=None):
+    """Returns one page of a course's feedback ordered by (date_submitted, id) and the cursor for the next page.
+
+    Pages are read with a keyset seek on the (course, date_submitted, id) index, so later pages cost the
+    same as the first one no matter how deep the cursor is.
+    """
+    try:
+        page_size = max(1, min(int(page_size or FEEDBACK_PAGE_SIZE), FEEDBACK_MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        page_size = FEEDBACK_PAGE_SIZE
+
+    feedback = (
+        Feedback.objects
+        .filter(course_id=course_id)
+        .select_related('student__user')
+        .order_by('date_submitted', 'id')
+    )
+    if cursor:
+        date_submitted, feedback_id = decode_cursor(cursor)
+        feedback = feedback.filter(date_submitted__gte=date_submitted).filter(
+            Q(date_submitted__gt=date_submitted) | Q(id__gt=feedback_id)
+        )
+
+    rows = list(feedback[:page_size + 1])
+    next_cursor = encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+
+    return {
+        'results': FeedbackSerializer(rows[:page_size], many=True).data,
+        'next_cursor': next_cursor,
+    }
@@ -0,0 +1,41 @@
+from django.db.models import Prefetch
+
+from ..models import Course, CourseWeek, Status, UserProfile
+from .catalogue import courses_not_enrolled_queryset
+
+PROFILE_STATUS_LIMIT = 20
+PROFILE_COURSE_LIMIT = 50
+
+
+def build_profile_context(user_profile):
+    """Builds the statuses and course lists shown on a profile page in a fixed number of queries.
+
+    Every list is sliced and evaluated here, and related teachers and weeks are joined or prefetched,
+    so the template never triggers a query per course, week or status.
+    """
+    user = user_profile.user
+    context = {
+        'statuses': list(Status.objects.filter(user=user).order_by('-created_at')[:PROFILE_STATUS_LIMIT]),
+        'courses': [],
+        'not_enrolled_courses': [],
+        'teacher_courses': None,
+    }
+
+    if user_profile.role == UserProfile.STUDENT:
+        context['courses'] = list(
+            user_profile.courses_enrolled.select_related('teacher').order_by('id')[:PROFILE_COURSE_LIMIT]
+        )
+        context['not_enrolled_courses'] = list(
+            courses_not_enrolled_queryset(user_profile).select_related('teacher')[:PROFILE_COURSE_LIMIT]
+        )
+
+    if user_profile.role == UserProfile.TEACHER:
+        context['teacher_courses'] = list(
+            Course.objects
+            .filter(teacher=user)
+            .order_by('id')
+            .prefetch_related(Prefetch('weeks', queryset=CourseWeek.objects.order_by('week_number'), to_attr='week_list'))
+            [:PROFILE_COURSE_LIMIT]
+        )
+
+    return context
@@ -0,0 +1,48 @@
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+
+from ..models import CourseStudents, UserProfile
+from ..serializers import EnrolledStudentSerializer
+
+ROSTER_PAGE_SIZE = 100
+ROSTER_MAX_PAGE_SIZE = 500
+
+
+def enrolled_students_queryset(course_id):
+    """Returns the enrolled UserProfiles of a course joined with their User in a single query."""
+    return (
+        UserProfile.objects
+        .filter(course_students__course_id=course_id)
+        .select_related('user')
+        .only('id', 'user__id', 'user__username', 'user__email')
+        .order_by('user__username', 'id')
+    )
+
+
+class RosterPaginator(Paginator):
+    """Paginator that counts enrollment rows directly instead of counting the joined roster query."""
+
+    def __init__(self, course_id, per_page):
+        super().__init__(enrolled_students_queryset(course_id), per_page)
+        self.course_id = course_id
+
+    @cached_property
+    def count(self):
+        return CourseStudents.objects.filter(course_id=self.course_id).count()
+
+
+def get_roster_page(course_id, page=1, page_size=ROSTER_PAGE_SIZE):
+    """Returns one serialized page of a course's enrolled students along with paging metadata."""
+    try:
+        page_size = max(1, min(int(page_size), ROSTER_MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        page_size = ROSTER_PAGE_SIZE
+    paginator = RosterPaginator(course_id, page_size)
+    roster_page = paginator.get_page(page)
+
+    return {
+        'students': EnrolledStudentSerializer(roster_page.object_list, many=True).data,
+        'count': paginator.count,
+        'page': roster_page.number,
+        'num_pages': paginator.num_pages,
+    }
@@ -0,0 +1,83 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import bump_course_generation, touch_catalogue
+from .models import Course, CourseWeek, CourseWeekContent, Feedback, CourseStudents, UserProfile
+
+
+def invalidate_course(course_id):
+    """Bumps a course's cache generation now and again once the surrounding transaction commits."""
+    if course_id is None:
+        return
+    bump_course_generation(course_id)
+    # A reader may cache the old rows between the first bump and the commit, so bump again afterwards.
+    transaction.on_commit(lambda: bump_course_generation(course_id))
+
+
+def touch_course(course_id):
+    """Marks a course as modified when one of its weeks, content items or feedback changes."""
+    if course_id is not None:
+        Course.objects.filter(id=course_id).update(updated_at=timezone.now())
+    invalidate_course(course_id)
+
+
+def lock_in_order(queryset):
+    """Row-locks a queryset in id order, so concurrent bulk imports touching overlapping rows cannot deadlock.
+
+    The locks are FOR NO KEY UPDATE, which foreign key checks of rows being inserted elsewhere do not wait on.
+    """
+    if transaction.get_connection().in_atomic_block:
+        list(queryset.select_for_update(no_key=True).order_by('id').values_list('id', flat=True))
+
+
+def touch_courses(course_ids):
+    """Does for many courses at once what the signals below do per row, for bulk writes that send no signals."""
+    course_ids = set(course_ids)
+    if not course_ids:
+        return
+    courses = Course.objects.filter(id__in=course_ids)
+    lock_in_order(courses)
+    courses.update(updated_at=timezone.now())
+    for course_id in course_ids:
+        invalidate_course(course_id)
+    touch_catalogue()
+    transaction.on_commit(touch_catalogue)
+
+
+def touch_profiles(profile_ids):
+    """Marks profiles as modified after their enrollments were changed by a bulk write."""
+    profile_ids = set(profile_ids)
+    if profile_ids:
+        profiles = UserProfile.objects.filter(id__in=profile_ids)
+        lock_in_order(profiles)
+        profiles.update(updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=Course)
+def course_changed(sender, instance, **kwargs):
+    invalidate_course(instance.id)
+    touch_catalogue()
+    transaction.on_commit(touch_catalogue)
+
+
+@receiver([post_save, post_delete], sender=CourseWeek)
+def course_week_changed(sender, instance, **kwargs):
+    touch_course(instance.course_id)
+
+
+@receiver([post_save, post_delete], sender=CourseWeekContent)
+def course_week_content_changed(sender, instance, **kwargs):
+    course_id = CourseWeek.objects.filter(id=instance.course_week_id).values_list('course_id', flat=True).first()
+    touch_course(course_id)
+
+
+@receiver([post_save, post_delete], sender=Feedback)
+def feedback_changed(sender, instance, **kwargs):
+    touch_course(instance.course_id)
+
+
+@receiver([post_save, post_delete], sender=CourseStudents)
+def enrollment_changed(sender, instance, **kwargs):
+    UserProfile.objects.filter(id=instance.student_id).update(updated_at=timezone.now())
@@ -0,0 +1,125 @@
+from types import SimpleNamespace
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from rest_framework.test import APITestCase
+
+from . import urls
+from .models import UserProfile, Course, CourseStudents, Status, CourseWeek, CourseWeekContent, Feedback
+
+SCALES = (1, 10, 1000)
+
+
+def build_fixture(scale):
+    """Creates a teacher, a student and a course where every child collection has `scale` rows."""
+    prefix = f'scale{scale}'
+    teacher = User.objects.create_user(username=f'{prefix}_teacher', email=f'{prefix}_teacher@example.com')
+    student = User.objects.create_user(username=f'{prefix}_student', email=f'{prefix}_student@example.com')
+    teacher_profile = UserProfile.objects.create(user=teacher, role=UserProfile.TEACHER)
+    student_profile = UserProfile.objects.create(user=student, role=UserProfile.STUDENT)
+
+    roster_users = User.objects.bulk_create([
+        User(username=f'{prefix}_member{number}', email=f'{prefix}_member{number}@example.com', password=make_password(None))
+        for number in range(scale)
+    ])
+    roster = UserProfile.objects.bulk_create([UserProfile(user=user) for user in roster_users])
+
+    courses = Course.objects.bulk_create([Course(name=f'{prefix} course {number}', teacher=teacher) for number in range(scale)])
+    course = courses[0]
+    open_course = Course.objects.create(name=f'{prefix} open course', teacher=teacher)
+
+    weeks = CourseWeek.objects.bulk_create([CourseWeek(course=course, week_number=number + 1) for number in range(scale)])
+    CourseWeekContent.objects.bulk_create([
+        CourseWeekContent(course_week=week, title=f'Week {week.week_number} Content', pdf=f'course_pdfs/{prefix}/Week_{week.week_number}.pdf')
+        for week in weeks
+    ])
+    Feedback.objects.bulk_create([Feedback(course=course, student=member, feedback_text=f'Feedback {number}') for number, member in enumerate(roster)])
+    CourseStudents.objects.bulk_create(
+        [CourseStudents(course=course, student=member) for member in roster]
+        + [CourseStudents(course=enrolled, student=student_profile) for enrolled in courses]
+    )
+    Status.objects.bulk_create(
+        [Status(user=student, text=f'Status {number}') for number in range(scale)]
+        + [Status(user=teacher, text=f'Status {number}') for number in range(scale)]
+    )
+
+    return SimpleNamespace(
+        teacher=teacher, student=student, teacher_profile=teacher_profile, student_profile=student_profile,
+        course=course, open_course=open_course, week=weeks[0], roster=roster,
+    )
+
+
+# route name -> function building (method, url, data, user to log in as) from a fixture.
+ROUTE_REQUESTS = {
+    'index': lambda fx: ('get', reverse('index'), None, None),
+    'register': lambda fx: ('get', reverse('register'), None, None),
+    'account_created': lambda fx: ('get', reverse('account_created'), None, None),
+    'login': lambda fx: ('get', reverse('login'), None, None),
+    'logout': lambda fx: ('get', reverse('logout'), None, fx.student),
+    'profile': lambda fx: ('get', reverse('profile', kwargs={'username': fx.student.username}), None, fx.teacher),
+    'user_list': lambda fx: ('get', reverse('user_list'), None, fx.teacher),
+    'user_courses_api': lambda fx: ('get', reverse('user_courses_api', kwargs={'username': fx.student.username}), None, None),
+    'user_course_details_api': lambda fx: ('get', reverse('user_course_details_api', kwargs={'course_id': fx.course.id}), None, None),
+    'course_feedback_api': lambda fx: ('get', reverse('course_feedback_api', kwargs={'course_id': fx.course.id}), None, None),
+    'course_detail': lambda fx: ('get', reverse('course_detail', kwargs={'course_id': fx.course.id}), None, fx.student),
+    'courses_not_enrolled_api': lambda fx: ('get', reverse('courses_not_enrolled_api', kwargs={'username': fx.student.username}), None, None),
+    'enroll-student': lambda fx: ('post', reverse('enroll-student', kwargs={'course_id': fx.open_course.id}), {}, fx.student),
+    'submit_feedback_api': lambda fx: ('post', reverse('submit_feedback_api', kwargs={'course_id': fx.course.id}), {'feedback_text': 'More please'}, fx.student),
+    'teacher_courses_api': lambda fx: ('get', reverse('teacher_courses_api'), None, fx.teacher),
+    'create_course_page': lambda fx: ('post', reverse('create_course_page'), {'name': 'New course'}, fx.teacher),
+    'create_course_api': lambda fx: ('post', reverse('create_course_api'), {'name': 'New course', 'teacher': fx.teacher.id}, fx.teacher),
+    'edit_course_api': lambda fx: ('put', reverse('edit_course_api', kwargs={'course_id': fx.course.id}), {'description': 'Updated'}, fx.teacher),
+    'edit_course_page': lambda fx: ('get', reverse('edit_course_page', kwargs={'course_id': fx.course.id}), None, fx.teacher),
+    'add_week_api': lambda fx: ('post', reverse('add_week_api', kwargs={'course_id': fx.course.id}), {'week_number': 5000}, fx.teacher),
+    'add_week_page': lambda fx: ('get', reverse('add_week_page', kwargs={'course_id': fx.course.id}), None, fx.teacher),
+    'add_week_content': lambda fx: ('get', reverse('add_week_content', kwargs={'course_id': fx.course.id, 'week_id': fx.week.id}), None, fx.teacher),
+    'get_enrolled_students_api': lambda fx: ('get', reverse('get_enrolled_students_api', kwargs={'course_id': fx.course.id}), None, fx.teacher),
+    'enrolled_students': lambda fx: ('get', reverse('enrolled_students', kwargs={'course_id': fx.course.id}), None, fx.teacher),
+    'remove_student_from_course': lambda fx: (
+        'post', reverse('remove_student_from_course', kwargs={'course_id': fx.course.id, 'student_id': fx.roster[0].id}), {}, fx.teacher
+    ),
+}
+
+
+class EndpointQueryCountTests(APITestCase):
+    """Every route must issue the same number of queries whether its collections hold 1, 10 or 1000 rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixtures = {scale: build_fixture(scale) for scale in SCALES}
+
+    def count_queries(self, method, url, data, user):
+        """Runs one request inside a rolled-back transaction and returns its status code and captured queries."""
+        cache.clear()
+        self.client.logout()
+        if user is not None:
+            self.client.force_login(user)
+
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(self.client, method)(url, data)
+            transaction.set_rollback(True)
+
+        return response.status_code, queries
+
+    def test_every_route_is_covered(self):
+        route_names = {pattern.name for pattern in urls.urlpatterns if isinstance(pattern, URLPattern) and pattern.name}
+        self.assertEqual(route_names - set(ROUTE_REQUESTS), set())
+
+    def test_query_counts_do_not_grow_with_data(self):
+        for name, build_request in ROUTE_REQUESTS.items():
+            with self.subTest(route=name):
+                counts = {}
+                for scale, fixture in self.fixtures.items():
+                    status_code, queries = self.count_queries(*build_request(fixture))
+                    self.assertLess(status_code, 400, f'{name} returned {status_code} at scale {scale}')
+                    counts[scale] = len(queries)
+
+                self.assertEqual(
+                    len(set(counts.values())), 1,
+                    f'{name} query count grows with data {counts}:\n' + '\n'.join(query['sql'] for query in queries.captured_queries),
+                )
@@ -1,15 +1,37 @@
+import base64
+import csv
+import gzip
 import json
+import os
+import shutil
+import tempfile
 from rest_framework import status
 from rest_framework.authtoken.models import Token
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from rest_framework.test import APITestCase
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
-from .models import UserProfile, Course, CourseStudents, Status
-from datetime import datetime
+from .models import UserProfile, Course, CourseStudents, Status, CourseWeek, CourseWeekContent, Feedback, ImportCheckpoint, ImportFingerprint
+from .importing.delta import row_fingerprint
+from .importing.pipeline import STAGES_BY_NAME, SerialExecutor, partition_of, run_pipeline, split_partitions
+from .importing.reader import read_chunks
+from .importing.stages import STAGES, load_courses, load_enrollments
+from .cache import CATALOGUE_CHANGED_KEY, catalogue_changed_at
+from datetime import datetime, timedelta
+from django.utils import timezone
 import pytz
 from django.urls import reverse
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from io import StringIO
+from .benchmarking import compare_to_baseline, isolated_cache
+from django.db import connection
+from django.core.cache import cache
+from unittest import skipUnless
 from unittest.mock import patch
+from urllib.parse import quote
 from django.core.files.uploadedfile import SimpleUploadedFile
 
 class UserCoursesApiTests(APITestCase):
@@ -120,6 +142,32 @@ class ProfileViewTests(TestCase):
         self.assertContains(response, "This is my first status.")
         self.assertContains(response, "This is my second status.")
 
+    def test_profile_query_count_is_fixed(self):
+        """The profile page issues the same number of queries however many courses, weeks or statuses exist"""
+        teacher = User.objects.create_user(username='teacher', password='testpassword')
+        UserProfile.objects.create(user=teacher, role='Teacher')
+
+        def grow(count):
+            for number in range(count):
+                course = Course.objects.create(name=f'Course {number}', teacher=teacher)
+                CourseWeek.objects.create(course=course, week_number=1)
+                CourseWeek.objects.create(course=course, week_number=2)
+                if number % 2:
+                    CourseStudents.objects.create(course=course, student=self.user_profile)
+                Status.objects.create(user=self.user, text=f'Status {number}')
+                Status.objects.create(user=teacher, text=f'Status {number}')
+
+        def count_queries(username):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('profile', kwargs={'username': username}))
+            return len(queries)
+
+        grow(1)
+        student_queries, teacher_queries = count_queries('testuser'), count_queries('teacher')
+        grow(10)
+        self.assertEqual(count_queries('testuser'), student_queries)
+        self.assertEqual(count_queries('teacher'), teacher_queries)
+
 class RegisterViewTests(TestCase):
 
     def test_successful_registration(self):
@@ -208,19 +256,260 @@ class UserCourseDetailsAPITests(APITestCase):
         response = self.client.get(reverse('user_course_details_api', kwargs={'course_id': 9999}))
         
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_user_course_details_api_file_urls_are_relative(self):
+        """Image and PDF URLs are site-relative, as the API returned them before it shared the detail service"""
+        self.course.image = 'course_images/Test_Course/cover.png'
+        self.course.save()
+        week = CourseWeek.objects.create(course=self.course, week_number=1)
+        CourseWeekContent.objects.create(course_week=week, title='Week 1 Content', pdf='course_pdfs/Test_Course/Week_1.pdf')
+
+        response = self.client.get(reverse('user_course_details_api', kwargs={'course_id': self.course.id}))
+
+        self.assertEqual(response.data['image'], '/media/course_images/Test_Course/cover.png')
+        self.assertEqual(response.data['weeks'][0]['content'][0]['pdf'], '/media/course_pdfs/Test_Course/Week_1.pdf')
+class CourseDetailViewTests(TestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='testteacher', password='testpassword')
+        self.student = User.objects.create_user(username='teststudent', password='testpassword')
+        self.student_profile = UserProfile.objects.create(user=self.student)
+        self.course = Course.objects.create(name='Test Course', description='A test course', teacher=self.teacher)
+        CourseWeek.objects.create(course=self.course, week_number=2)
+        CourseWeek.objects.create(course=self.course, week_number=1)
+        Feedback.objects.create(course=self.course, student=self.student_profile, feedback_text='Great course')
+
+    @patch('requests.get')
+    def test_course_detail_view_builds_data_in_process(self, mock_get):
+        """The HTML view should not loop back to its own API over HTTP"""
+        response = self.client.get(reverse('course_detail', kwargs={'course_id': self.course.id}))
+
+        self.assertEqual(response.status_code, 200)
+        mock_get.assert_not_called()
+        self.assertEqual([week['week_number'] for week in response.context['course']['weeks']], [1, 2])
+        self.assertContains(response, 'Great course')
+        self.assertContains(response, 'teststudent')
+
+    def test_course_detail_view_not_found(self):
+        response = self.client.get(reverse('course_detail', kwargs={'course_id': 9999}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_course_details_api_query_count(self):
+        """Version stamp, course, weeks, week content and feedback with usernames are loaded in a fixed number of queries"""
+        url = reverse('user_course_details_api', kwargs={'course_id': self.course.id})
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+
+        self.assertEqual(response.data['feedback'][0]['student_username'], 'teststudent')
+
+class CourseDetailCacheTests(APITestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='testteacher', password='testpassword')
+        self.student_profile = UserProfile.objects.create(user=User.objects.create_user(username='teststudent'))
+        self.course = Course.objects.create(name='Test Course', description='A test course', teacher=self.teacher)
+        self.url = reverse('user_course_details_api', kwargs={'course_id': self.course.id})
+
+    def test_cached_course_details_skip_the_database(self):
+        """Only the version stamp is read from the database once the aggregate is cached"""
+        self.client.get(self.url)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['name'], 'Test Course')
+
+    def test_cache_invalidated_by_model_signals(self):
+        self.client.get(self.url)
+
+        Feedback.objects.create(course=self.course, student=self.student_profile, feedback_text='Nice')
+        self.assertEqual(len(self.client.get(self.url).data['feedback']), 1)
+
+        CourseWeek.objects.create(course=self.course, week_number=1)
+        self.assertEqual(len(self.client.get(self.url).data['weeks']), 1)
+
+        self.course.name = 'Renamed Course'
+        self.course.save()
+        self.assertEqual(self.client.get(self.url).data['name'], 'Renamed Course')
+
+class ConditionalGetTests(APITestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='testteacher', password='testpassword')
+        UserProfile.objects.create(user=self.teacher, role='Teacher')
+        self.student = User.objects.create_user(username='teststudent', password='testpassword')
+        self.student_profile = UserProfile.objects.create(user=self.student)
+        self.course = Course.objects.create(name='Test Course', teacher=self.teacher)
+        self.other_course = Course.objects.create(name='Other Course', teacher=self.teacher)
+        CourseStudents.objects.create(course=self.course, student=self.student_profile)
+
+    def assertRevalidates(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+        with patch('rest_framework.serializers.Serializer.to_representation') as to_representation:
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            to_representation.assert_not_called()
+        self.assertEqual(not_modified.status_code, 304)
+
+        since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(since.status_code, 304)
+        return response['ETag']
+
+    def test_course_details_etag_changes_with_feedback(self):
+        url = reverse('user_course_details_api', kwargs={'course_id': self.course.id})
+        etag = self.assertRevalidates(url)
+
+        Feedback.objects.create(course=self.course, student=self.student_profile, feedback_text='Nice')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_user_courses_etag_changes_on_unenroll(self):
+        url = reverse('user_courses_api', kwargs={'username': 'teststudent'})
+        etag = self.assertRevalidates(url)
+
+        CourseStudents.objects.filter(student=self.student_profile).delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+    def test_courses_not_enrolled_etag_changes_with_catalogue(self):
+        url = reverse('courses_not_enrolled_api', kwargs={'username': 'teststudent'})
+        etag = self.assertRevalidates(url)
+
+        Course.objects.create(name='New Course', teacher=self.teacher)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_teacher_courses_conditional_get(self):
+        self.client.login(username='testteacher', password='testpassword')
+        self.assertRevalidates(reverse('teacher_courses_api'))
+
+    def test_teacher_courses_last_modified_moves_on_when_a_course_is_deleted(self):
+        a_day_ago = timezone.now() - timedelta(days=1)
+        Course.objects.update(updated_at=a_day_ago)
+        UserProfile.objects.update(updated_at=a_day_ago)
+        cache.set(CATALOGUE_CHANGED_KEY, a_day_ago)
+        self.client.login(username='testteacher', password='testpassword')
+        url = reverse('teacher_courses_api')
+        last_modified = self.client.get(url)['Last-Modified']
+
+        self.other_course.delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+
+    def test_teacher_courses_version_sees_basic_auth_users(self):
+        credentials = base64.b64encode(b'testteacher:testpassword').decode()
+        response = self.client.get(reverse('teacher_courses_api'), HTTP_AUTHORIZATION=f"Basic {credentials}")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+        not_modified = self.client.get(
+            reverse('teacher_courses_api'), HTTP_AUTHORIZATION=f"Basic {credentials}", HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+        self.assertEqual(not_modified.status_code, 304)
+
+class CourseFeedbackPaginationTests(APITestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='testteacher', password='testpassword')
+        self.course = Course.objects.create(name='Test Course', teacher=self.teacher)
+        for number in range(5):
+            student = UserProfile.objects.create(user=User.objects.create_user(username=f'student{number}'))
+            Feedback.objects.create(course=self.course, student=student, feedback_text=f'Feedback {number}')
+        self.url = reverse('course_feedback_api', kwargs={'course_id': self.course.id})
+
+    def test_walk_feedback_pages_with_cursor(self):
+        texts = []
+        params = {'page_size': 2}
+        while True:
+            with self.assertNumQueries(3):
+                response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            texts += [item['feedback_text'] for item in response.data['results']]
+            if not response.data['next_cursor']:
+                break
+            params['cursor'] = response.data['next_cursor']
+
+        self.assertEqual(texts, [f'Feedback {number}' for number in range(5)])
+
+    def test_course_details_include_first_feedback_page(self):
+        with patch('learningapp.services.feedback.FEEDBACK_PAGE_SIZE', 3):
+            response = self.client.get(reverse('user_course_details_api', kwargs={'course_id': self.course.id}))
+
+        self.assertEqual(len(response.data['feedback']), 3)
+        self.assertEqual(response.data['feedback'][0]['student_username'], 'student0')
+        self.assertIsNotNone(response.data['feedback_next_cursor'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_course_page_pages_feedback_in_html(self):
+        url = reverse('course_detail', kwargs={'course_id': self.course.id})
+        texts = []
+        with patch('learningapp.services.feedback.FEEDBACK_PAGE_SIZE', 2):
+            response = self.client.get(url)
+            while True:
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+                texts += [item['feedback_text'] for item in response.context['course']['feedback']]
+                cursor = response.context['course']['feedback_next_cursor']
+                if not cursor:
+                    break
+                self.assertContains(response, f"{url}?feedback_cursor={quote(cursor)}")
+                response = self.client.get(url, {'feedback_cursor': cursor})
+
+        self.assertEqual(texts, [f'Feedback {number}' for number in range(5)])
+        self.assertEqual(self.client.get(url, {'feedback_cursor': 'not-a-cursor'}).status_code, 400)
+
+class CoursesNotEnrolledApiTests(APITestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='testteacher')
+        self.student_profile = UserProfile.objects.create(user=User.objects.create_user(username='teststudent'))
+        self.courses = Course.objects.bulk_create([Course(name=f'Course {number}', teacher=self.teacher) for number in range(5)])
+        CourseStudents.objects.create(course=self.courses[1], student=self.student_profile)
+        self.url = reverse('courses_not_enrolled_api', kwargs={'username': 'teststudent'})
+
+    def test_pages_exclude_enrolled_courses(self):
+        first = self.client.get(self.url, {'page_size': 2})
+        self.assertEqual([course['name'] for course in first.json()], ['Course 0', 'Course 2'])
+        self.assertIn('rel="next"', first['Link'])
+
+        second = self.client.get(self.url, {'page_size': 2, 'after': first.json()[-1]['id']})
+        self.assertEqual([course['name'] for course in second.json()], ['Course 3', 'Course 4'])
+        self.assertNotIn('Link', second)
+
+    def test_query_count_independent_of_enrollments(self):
+        with self.assertNumQueries(3):
+            self.client.get(self.url)
+
+        for course in self.courses[2:]:
+            CourseStudents.objects.create(course=course, student=self.student_profile)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual([course['name'] for course in response.json()], ['Course 0'])
+
 class EnrolledStudentsViewTests(TestCase):
     
     def setUp(self):
         self.user = User.objects.create_user(username='testuser', password='testpassword')
+        UserProfile.objects.create(user=self.user, role='Teacher')
         self.course = Course.objects.create(name="Test Course", description="Test course description", teacher=self.user)
         self.url = reverse('enrolled_students', kwargs={'course_id': self.course.id})
+
+    def enroll(self, username):
+        student = User.objects.create_user(username=username, email=f'{username}@example.com')
+        profile = UserProfile.objects.create(user=student, role='Student')
+        CourseStudents.objects.create(course=self.course, student=profile)
+        return profile
         
     @patch('requests.get')
     def test_enrolled_students_view_success(self, mock_get):
-
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.json.return_value = {'students': [{'id': 1, 'username': 'student1'}, {'id': 2, 'username': 'student2'}]}
-        
+        self.enroll('student1')
+        self.enroll('student2')
 
         self.client.login(username='testuser', password='testpassword')
         
@@ -228,6 +517,7 @@ class EnrolledStudentsViewTests(TestCase):
         
 
         self.assertEqual(response.status_code, 200)
+        mock_get.assert_not_called()
         
         self.assertIn('students', response.context)
         self.assertEqual(len(response.context['students']), 2)  # There should be 2 students
@@ -240,12 +530,7 @@ class EnrolledStudentsViewTests(TestCase):
         response = self.client.get(self.url)
         self.assertRedirects(response, f'/accounts/login/?next={self.url}')
 
-    @patch('requests.get')
-    def test_enrolled_students_view_no_students(self, mock_get):
-
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.json.return_value = {'students': []}
-        
+    def test_enrolled_students_view_no_students(self):
 
         self.client.login(username='testuser', password='testpassword')
         
@@ -257,6 +542,20 @@ class EnrolledStudentsViewTests(TestCase):
 
         self.assertIn('students', response.context)
         self.assertEqual(len(response.context['students']), 0)  # No students returned
+
+    def test_enrolled_students_api_pages_and_counts(self):
+        """The roster API pages through students and reports the total without loading every row"""
+        for number in range(5):
+            self.enroll(f'student{number}')
+
+        self.client.login(username='testuser', password='testpassword')
+        url = reverse('get_enrolled_students_api', kwargs={'course_id': self.course.id})
+        response = self.client.get(url, {'page': 2, 'page_size': 2})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 5)
+        self.assertEqual(response.json()['num_pages'], 3)
+        self.assertEqual([student['username'] for student in response.json()['students']], ['student2', 'student3'])
 class RemoveStudentFromCourseTests(TestCase):
     
     def setUp(self):
@@ -338,4 +637,398 @@ class EditCoursePageTests(TestCase):
         self.client.login(username='student', password='password')
         response = self.client.get(self.edit_course_url)
         self.assertEqual(response.status_code, 404)
-    
\ No newline at end of file
+    
+class GenerateDatasetCommandTests(TestCase):
+
+    def generate(self, seed):
+        call_command('generate_dataset', rows=1000, seed=seed, stdout=StringIO())
+        return list(Feedback.objects.order_by('id').values_list('student__user__username', 'course__name', 'feedback_text', 'date_submitted'))
+
+    def test_generates_scaled_deterministic_dataset(self):
+        first = self.generate(seed=1)
+        self.assertEqual(User.objects.count(), 80)
+        self.assertEqual(Course.objects.count(), 4)
+        self.assertEqual(CourseWeek.objects.count(), 48)
+        self.assertEqual(len(first), 150)
+
+        User.objects.all().delete()
+        self.assertEqual(self.generate(seed=1), first)
+
+        User.objects.all().delete()
+        self.assertNotEqual(self.generate(seed=2), first)
+
+class BenchmarkBaselineTests(TestCase):
+
+    def test_compare_to_baseline_flags_regressions(self):
+        baseline = [{'key': '100/client/a', 'p95_ms': 10.0, 'queries': 3, 'bytes': 1000}]
+        steady = [{'key': '100/client/a', 'p95_ms': 11.0, 'queries': 3, 'bytes': 1100}]
+        slower = [{'key': '100/client/a', 'p95_ms': 13.0, 'queries': 4, 'bytes': 1000}]
+
+        self.assertEqual(compare_to_baseline(steady, baseline, threshold=0.2), [])
+        self.assertEqual(len(compare_to_baseline(slower, baseline, threshold=0.2)), 2)
+
+    def test_isolated_cache_starts_empty_and_leaves_no_entries(self):
+        cache.set('catalogue:changed_at', 'before')
+        for _ in range(2):
+            with isolated_cache():
+                self.assertIsNone(cache.get('catalogue:changed_at'))
+                cache.set('catalogue:changed_at', 'during')
+        self.assertEqual(cache.get('catalogue:changed_at'), 'before')
+
+class ImportCsvBulkTests(TestCase):
+
+    def snapshot(self):
+        return {
+            'users': sorted(UserProfile.objects.values_list('user__username', 'user__email', 'role')),
+            'courses': sorted(Course.objects.values_list('name', 'teacher__username', 'date_created', 'deadline')),
+            'weeks': sorted(CourseWeek.objects.values_list('course__name', 'week_number', 'start_date', 'end_date')),
+            'content': sorted(CourseWeekContent.objects.values_list('course_week__course__name', 'title', 'pdf')),
+            'enrollments': sorted(CourseStudents.objects.values_list('course__name', 'student__user__username')),
+            'feedback': sorted(Feedback.objects.values_list('course__name', 'student__user__username', 'feedback_text')),
+            'statuses': sorted(Status.objects.values_list('user__username', 'text')),
+        }
+
+    def test_bulk_import_matches_row_by_row_import_and_is_idempotent(self):
+        call_command('import_csv', stdout=StringIO())
+        expected = self.snapshot()
+        User.objects.all().delete()
+        Course.objects.all().delete()
+
+        out = StringIO()
+        call_command('import_csv', bulk=True, batch_size=5, stdout=out)
+        self.assertEqual(self.snapshot(), expected)
+        # Unlike get_or_create, the bulk path keeps the CSV timestamps instead of auto_now_add replacing them.
+        self.assertEqual(
+            Feedback.objects.get(feedback_text='Too difficult').date_submitted,
+            datetime(2024, 3, 2, 10, 30, tzinfo=pytz.utc),
+        )
+        self.assertIn('rows/s', out.getvalue())
+        self.assertTrue(User.objects.get(username='liamsmith').check_password('sqlpass32'))
+
+        call_command('import_csv', bulk=True, batch_size=5, stdout=StringIO())
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_bulk_created_courses_move_the_catalogue_on(self):
+        User.objects.create(username='catalogue_teacher')
+        cache.set(CATALOGUE_CHANGED_KEY, timezone.now() - timedelta(days=1))
+        before = catalogue_changed_at()
+
+        counts = load_courses([{
+            'course_name': 'Brand New Course', 'date_created': '2024-01-01 09:00:00',
+            'deadline': '2024-06-01 00:00:00', 'teacher_username': 'catalogue_teacher',
+        }], batch_size=10)
+
+        self.assertEqual(counts['created'], 1)
+        self.assertGreater(catalogue_changed_at(), before)
+
+    def test_resumable_import_continues_after_the_last_committed_chunk(self):
+        calls = []
+
+        def failing_load(rows, batch_size):
+            calls.append(rows)
+            if len(calls) == 3:
+                raise RuntimeError('interrupted')
+            return load_enrollments(rows, batch_size)
+
+        stages = [stage._replace(load=failing_load) if stage.name == 'enrollments' else stage for stage in STAGES]
+        with patch('learningapp.management.commands.import_csv.STAGES', stages), self.assertRaises(RuntimeError):
+            call_command('import_csv', resumable=True, batch_size=4, stdout=StringIO())
+        self.assertEqual(CourseStudents.objects.count(), 8)
+        self.assertEqual(ImportCheckpoint.objects.get(stage='enrollments').row_number, 8)
+
+        out = StringIO()
+        call_command('import_csv', resumable=True, batch_size=4, stdout=out)
+        self.assertIn('users was already imported', out.getvalue())
+        self.assertIn('Resuming enrollments after row 8', out.getvalue())
+        self.assertEqual(CourseStudents.objects.count(), 11)
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_read_chunks_resumes_across_multiline_fields(self):
+        path = 'data/course_week_content.csv'
+        chunks = list(read_chunks(path, chunk_size=5))
+        resumed = list(read_chunks(path, chunk_size=5, byte_offset=chunks[1][1], row_number=chunks[1][2]))
+        self.assertEqual(resumed, chunks[2:])
+        self.assertEqual(chunks[-1][2], 12)
+
+    def test_pipeline_runs_partitions_after_the_stages_they_depend_on(self):
+        call_command('import_csv', bulk=True, stdout=StringIO())
+        expected = self.snapshot()
+        User.objects.all().delete()
+        Course.objects.all().delete()
+
+        finished = []
+        with patch('learningapp.importing.pipeline.make_executor', return_value=SerialExecutor()):
+            run_pipeline('data', batch_size=2, workers=3, report=lambda stage, counts, elapsed: finished.append(stage), skip=None)
+
+        self.assertEqual(self.snapshot(), expected)
+        names = [stage.name for stage in finished]
+        self.assertCountEqual(names, [stage.name for stage in STAGES])
+        for stage in finished:
+            for dependency in stage.after:
+                self.assertLess(names.index(dependency), names.index(stage.name))
+
+    def test_split_partitions_reads_the_file_once_and_keeps_keys_together(self):
+        stage = STAGES_BY_NAME['content']
+        path = 'data/course_week_content.csv'
+        rows = [row for chunk, _, _ in read_chunks(path, 100) for row in chunk]
+        with tempfile.TemporaryDirectory() as directory:
+            paths = split_partitions(stage, path, batch_size=5, partitions=3, directory=directory)
+            parts = [[row for chunk, _, _ in read_chunks(part, 100) for row in chunk] for part in paths]
+
+        self.assertCountEqual([row for part in parts for row in part], rows)
+        for number, part in enumerate(parts):
+            self.assertEqual(part, [row for row in rows if partition_of(row, stage.key, 3) == number])
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY imports need PostgreSQL')
+    def test_copy_import_matches_bulk_import(self):
+        def timestamps():
+            return (
+                sorted(Feedback.objects.values_list('feedback_text', 'date_submitted')),
+                sorted(Status.objects.values_list('text', 'created_at')),
+            )
+
+        call_command('import_csv', bulk=True, stdout=StringIO())
+        expected, expected_timestamps = self.snapshot(), timestamps()
+        User.objects.all().delete()
+        Course.objects.all().delete()
+
+        call_command('import_csv', copy=True, stdout=StringIO())
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(timestamps(), expected_timestamps)
+        self.assertTrue(User.objects.get(username='liamsmith').check_password('sqlpass32'))
+
+        call_command('import_csv', copy=True, stdout=StringIO())
+        self.assertEqual(self.snapshot(), expected)
+
+    def write_users_csv(self, directory):
+        prehashed = make_password('prehashed-secret')
+        with open(os.path.join(directory, 'users.csv'), 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['username', 'email', 'password', 'password_hash', 'role'])
+            writer.writerow(['hashed', 'hashed@test.com', '', prehashed, 'Student'])
+            writer.writerow(['plain1', 'plain1@test.com', 'secret1', '', 'Student'])
+            writer.writerow(['plain2', 'plain2@test.com', 'secret2', '', 'Teacher'])
+            writer.writerow(['broken', 'broken@test.com', '', 'not-a-hash', 'Student'])
+        return prehashed
+
+    def test_users_import_stores_prehashed_passwords_and_hashes_plaintext_on_a_pool(self):
+        with tempfile.TemporaryDirectory() as directory:
+            prehashed = self.write_users_csv(directory)
+            out = StringIO()
+            call_command('import_csv', bulk=True, hash_workers=2, no_validate=True, data_dir=directory, stdout=out)
+
+        self.assertIn('4 rows (3 created, 0 updated, 1 skipped)', out.getvalue())
+        self.assertEqual(User.objects.get(username='hashed').password, prehashed)
+        self.assertTrue(User.objects.get(username='plain1').check_password('secret1'))
+        self.assertTrue(User.objects.get(username='plain2').check_password('secret2'))
+        self.assertEqual(UserProfile.objects.get(user__username='plain2').role, UserProfile.TEACHER)
+        self.assertFalse(User.objects.filter(username='broken').exists())
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY imports need PostgreSQL')
+    def test_copy_import_stores_prehashed_passwords(self):
+        with tempfile.TemporaryDirectory() as directory:
+            prehashed = self.write_users_csv(directory)
+            call_command('import_csv', copy=True, hash_workers=2, no_validate=True, data_dir=directory, stdout=StringIO())
+
+        self.assertEqual(User.objects.get(username='hashed').password, prehashed)
+        self.assertTrue(User.objects.get(username='plain2').check_password('secret2'))
+        self.assertFalse(User.objects.filter(username='broken').exists())
+
+
+    def test_export_round_trips_through_the_bulk_import(self):
+        call_command('import_csv', bulk=True, stdout=StringIO())
+        expected = self.snapshot()
+        expected_rows = {
+            'passwords': dict(User.objects.values_list('username', 'password')),
+            'feedback': sorted(Feedback.objects.values_list('feedback_text', 'date_submitted')),
+            'courses': sorted(Course.objects.values_list('name', 'date_created', 'deadline')),
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('export_csv', output_dir=directory, snapshot=True, chunk_size=3, stdout=StringIO())
+            call_command('export_csv', output_dir=directory, format='jsonl', gzip=True, stdout=StringIO())
+            with gzip.open(os.path.join(directory, 'feedback.jsonl.gz'), 'rt') as file:
+                feedback = [json.loads(line) for line in file]
+
+            User.objects.all().delete()
+            Course.objects.all().delete()
+            call_command('import_csv', bulk=True, data_dir=directory, stdout=StringIO())
+
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(dict(User.objects.values_list('username', 'password')), expected_rows['passwords'])
+        self.assertEqual(sorted(Feedback.objects.values_list('feedback_text', 'date_submitted')), expected_rows['feedback'])
+        self.assertEqual(sorted(Course.objects.values_list('name', 'date_created', 'deadline')), expected_rows['courses'])
+        self.assertIn({'student_username': 'liamsmith', 'course_name': 'Data Science', 'feedback_text': 'Too difficult',
+                       'date_given': '2024-03-02 10:30:00'}, feedback)
+
+    def test_delta_fingerprints_do_not_depend_on_passwords(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shutil.copytree('data', directory, dirs_exist_ok=True)
+            call_command('import_csv', delta=True, data_dir=directory, stdout=StringIO())
+            stored = dict(ImportFingerprint.objects.filter(stage='users').values_list('key_digest', 'fingerprint'))
+
+            path = os.path.join(directory, 'users.csv')
+            with open(path, newline='') as file:
+                rows = list(csv.DictReader(file))
+            with open(path, 'w', newline='') as file:
+                writer = csv.DictWriter(file, [*rows[0], 'password_hash'])
+                writer.writeheader()
+                writer.writerows({**row, 'password': 'changed-secret', 'password_hash': ''} for row in rows)
+
+            out = StringIO()
+            call_command('import_csv', delta=True, data_dir=directory, stdout=out)
+
+        self.assertIn(f"Skipped {len(rows)} unchanged users rows", out.getvalue())
+        self.assertEqual(dict(ImportFingerprint.objects.filter(stage='users').values_list('key_digest', 'fingerprint')), stored)
+        self.assertEqual(
+            row_fingerprint({'username': 'a', 'password': 'one', 'password_hash': ''}),
+            row_fingerprint({'username': 'a', 'password': 'two', 'password_hash': 'pbkdf2_sha256$x'}),
+        )
+
+    def test_delta_import_only_writes_changed_rows_and_can_delete_missing_ones(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shutil.copytree('data', directory, dirs_exist_ok=True)
+            call_command('import_csv', delta=True, data_dir=directory, stdout=StringIO())
+            expected = self.snapshot()
+
+            out = StringIO()
+            call_command('import_csv', delta=True, data_dir=directory, stdout=out)
+            self.assertIn('Skipped 12 unchanged weeks rows', out.getvalue())
+            self.assertIn('Imported weeks: 12 rows (0 created, 0 updated, 0 skipped)', out.getvalue())
+            self.assertEqual(self.snapshot(), expected)
+
+            with open(os.path.join(directory, 'course_weeks.csv')) as file:
+                weeks = file.read()
+            with open(os.path.join(directory, 'course_weeks.csv'), 'w') as file:
+                file.write(weeks.replace('Intro to Programming,4,2025-03-23,2025-03-30', 'Intro to Programming,4,2025-03-23,2025-04-06'))
+            with open(os.path.join(directory, 'feedback.csv')) as file:
+                feedback = [line for line in file if 'Too difficult' not in line]
+            with open(os.path.join(directory, 'feedback.csv'), 'w') as file:
+                file.writelines(feedback)
+
+            out = StringIO()
+            call_command('import_csv', delta=True, delete=True, data_dir=directory, stdout=out)
+
+        self.assertIn('Imported weeks: 12 rows (0 created, 1 updated, 0 skipped)', out.getvalue())
+        self.assertIn('Skipped 11 unchanged weeks rows', out.getvalue())
+        self.assertIn('Deleted 1 feedback rows missing from feedback.csv', out.getvalue())
+        self.assertIn('Deleted 0 courses rows missing from courses.csv', out.getvalue())
+        self.assertEqual(CourseWeek.objects.get(course__name='Intro to Programming', week_number=4).end_date.isoformat(), '2025-04-06')
+        self.assertFalse(Feedback.objects.filter(feedback_text='Too difficult').exists())
+        self.assertEqual(Feedback.objects.count(), 2)
+
+    def test_validation_reports_every_problem_before_writing_anything(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shutil.copytree('data', directory, dirs_exist_ok=True)
+            with open(os.path.join(directory, 'courses.csv'), 'a') as file:
+                file.write('Broken Course,2025-13-01 10:30:00,2025-03-30 10:30:00,nobody\n')
+            with open(os.path.join(directory, 'course_enrollment.csv'), 'a') as file:
+                file.write('liamsmith,Intro to Programming\nliamsmith,Unknown Course\n')
+
+            err = StringIO()
+            with self.assertRaisesMessage(CommandError, 'Found 4 problem(s)'):
+                call_command('import_csv', bulk=True, data_dir=directory, stdout=StringIO(), stderr=err)
+
+        self.assertEqual(err.getvalue().splitlines(), [
+            "courses.csv:5: date_created '2025-13-01 10:30:00' is not a date and time (YYYY-MM-DD HH:MM:SS)",
+            'courses.csv:5: user nobody not found',
+            'course_enrollment.csv:13: duplicate enrollment liamsmith / Intro to Programming',
+            'course_enrollment.csv:14: course Unknown Course not found',
+        ])
+        self.assertFalse(User.objects.exists())
+
+    def test_validation_lists_the_first_few_rows_of_each_missing_reference(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'course_enrollment.csv'), 'w') as file:
+                file.write('student_username,course_name\n')
+                file.writelines(f"student{number},Unknown Course\n" for number in range(8))
+            err = StringIO()
+            with self.assertRaises(CommandError):
+                call_command('import_csv', validate_only=True, data_dir=directory, stdout=StringIO(), stderr=err)
+
+        course_errors = [line for line in err.getvalue().splitlines() if 'Unknown Course' in line]
+        self.assertEqual(course_errors, [f"course_enrollment.csv:{line}: course Unknown Course not found" for line in range(2, 7)] + [
+            'course_enrollment.csv:6: course Unknown Course not found in 3 more row(s)',
+        ])
+
+    def test_validation_reports_bad_week_numbers_and_reads_them_as_the_import_does(self):
+        call_command('import_csv', bulk=True, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'course_week_content.csv'), 'w') as file:
+                file.write('course_name,week_number,pdf\nIntro to Programming,01,a.pdf\nSome Course,\u00b2,x.pdf\n')
+            err = StringIO()
+            with self.assertRaisesMessage(CommandError, 'Found 2 problem(s)'):
+                call_command('import_csv', validate_only=True, data_dir=directory, stdout=StringIO(), stderr=err)
+
+        self.assertEqual(err.getvalue().splitlines(), [
+            "course_week_content.csv:3: week_number '\u00b2' is not a positive whole number",
+            'course_week_content.csv:3: week Some Course / \u00b2 not found',
+        ])
+
+    def test_validation_accepts_references_to_rows_already_in_the_database(self):
+        call_command('import_csv', bulk=True, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            shutil.copy('data/course_enrollment.csv', directory)
+            out = StringIO()
+            call_command('import_csv', validate_only=True, data_dir=directory, stdout=out)
+        self.assertIn('Validated the files', out.getvalue())
+
+
+    def test_workers_import_matches_bulk_import(self):
+        call_command('import_csv', bulk=True, stdout=StringIO())
+        expected = self.snapshot()
+        User.objects.all().delete()
+        Course.objects.all().delete()
+
+        out = StringIO()
+        call_command('import_csv', workers=1, batch_size=3, stdout=out)
+        self.assertIn('Validated the files', out.getvalue())
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_validate_only_and_delete_checks_apply_to_every_mode(self):
+        modes = [{'workers': 1}, {'bulk': True}]
+        if connection.vendor == 'postgresql':
+            modes.append({'copy': True})
+        for mode in modes:
+            with self.subTest(**mode):
+                out = StringIO()
+                call_command('import_csv', validate_only=True, stdout=out, **mode)
+                self.assertIn('Validated the files', out.getvalue())
+                self.assertFalse(User.objects.exists())
+                with self.assertRaisesMessage(CommandError, '--delete only works together with --delta.'):
+                    call_command('import_csv', delete=True, stdout=StringIO(), **mode)
+                self.assertFalse(User.objects.exists())
+
+    def test_delta_rejects_modes_that_would_ignore_it(self):
+        for options in [{'workers': 1}, {'copy': True}, {'resumable': True}, {'copy': True, 'delete': True}]:
+            option = next(iter(options))
+            with self.subTest(**options), self.assertRaisesMessage(CommandError, f"--delta cannot be combined with --{option}."):
+                call_command('import_csv', delta=True, stdout=StringIO(), **options)
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(ImportFingerprint.objects.exists())
+
+    def test_invalid_files_stop_a_workers_import(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shutil.copytree('data', directory, dirs_exist_ok=True)
+            with open(os.path.join(directory, 'course_enrollment.csv'), 'a') as file:
+                file.write('liamsmith,Unknown Course\n')
+            with self.assertRaisesMessage(CommandError, 'Found 1 problem(s)'):
+                call_command('import_csv', workers=1, data_dir=directory, stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(User.objects.exists())
+
+@skipUnless(connection.vendor == 'postgresql', 'forked import workers cannot share the SQLite test database')
+class ImportPipelineProcessTests(TransactionTestCase):
+
+    snapshot = ImportCsvBulkTests.snapshot
+
+    def test_pipeline_on_a_process_pool_matches_a_single_worker(self):
+        finished = []
+        run_pipeline('data', batch_size=2, workers=2, report=lambda stage, counts, elapsed: finished.append(stage), skip=None)
+        expected = self.snapshot()
+        self.assertTrue(expected['enrollments'])
+        self.assertCountEqual([stage.name for stage in finished], [stage.name for stage in STAGES])
+
+        User.objects.all().delete()
+        Course.objects.all().delete()
+        run_pipeline('data', batch_size=2, workers=1, report=lambda stage, counts, elapsed: None, skip=None)
+        self.assertEqual(self.snapshot(), expected)
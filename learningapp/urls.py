@@ -1,6 +1,6 @@
 from django.urls import include, path
 from . import views
-from .api import user_courses_api, user_course_details_api, courses_not_enrolled_api, enroll_student_api, submit_feedback_api, create_course, edit_course_api, add_week_api, get_enrolled_students_api
+from .api import user_courses_api, user_course_details_api, courses_not_enrolled_api, enroll_student_api, submit_feedback_api, create_course, edit_course_api, add_week_api, get_enrolled_students_api, teacher_courses_api, course_feedback_api
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -17,10 +17,12 @@ urlpatterns = [
     path('users/', views.user_list, name='user_list'),
     path('api/courses/<str:username>/', user_courses_api, name='user_courses_api'),
     path('api/courses/details/<int:course_id>/', user_course_details_api, name='user_course_details_api'),
+    path('api/courses/details/<int:course_id>/feedback/', course_feedback_api, name='course_feedback_api'),
     path('course/details/<int:course_id>/', views.course_detail_view, name='course_detail'),
     path('api/courses/not-enrolled/<str:username>/', courses_not_enrolled_api, name='courses_not_enrolled_api'),
     path('api/enroll/<int:course_id>/', enroll_student_api, name='enroll-student'),
     path('api/submit-feedback/<int:course_id>/', submit_feedback_api, name='submit_feedback_api'),
+    path('api/teacher/courses/', teacher_courses_api, name='teacher_courses_api'),
     path('create-course/', views.create_course_page, name='create_course_page'),
     path('api/create-course/', create_course, name='create_course_api'),
     path('api/course/<int:course_id>/edit/', edit_course_api, name='edit_course_api'),
@@ -3,13 +3,16 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.http import HttpResponseRedirect
 from django.contrib.auth import authenticate, login, logout
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest
 from django.contrib.auth.decorators import login_required
 from .models import *
 from .forms import *
+from .services.course_details import get_cached_course_details
+from .services.feedback import get_feedback_page, InvalidCursor
+from .services.profile import build_profile_context
+from .services.roster import get_roster_page
 
 import logging
-import requests
 
 logger = logging.getLogger(__name__)
 from django.shortcuts import render
@@ -40,21 +43,14 @@ from rest_framework.response import Response
 def profile(request, username=None):
     """Displays the user's profile, including their statuses, courses, and role-based options."""
     if username:
-        user = get_object_or_404(User, username=username)
-        user_profile = get_object_or_404(UserProfile, user=user)
+        user_profile = get_object_or_404(UserProfile.objects.select_related('user'), user__username=username)
+        user = user_profile.user
         is_own_profile = user == request.user
     else:
         user = request.user
         user_profile = user.userprofile
         is_own_profile = True
 
-    statuses = Status.objects.filter(user=user).order_by('-created_at')
-    courses = user_profile.courses_enrolled.all()
-    not_enrolled_courses = Course.objects.exclude(id__in=courses.values('id'))
-    teacher_courses = None
-    if user_profile.role == "Teacher":
-        teacher_courses = Course.objects.filter(teacher=user)
-
     form = StatusForm(request.POST or None)
     if is_own_profile and request.method == 'POST':
         if form.is_valid():
@@ -65,12 +61,9 @@ def profile(request, username=None):
 
     return render(request, 'learningapp/profile.html', {
         'user_profile': user_profile,
-        'statuses': statuses,
         'form': form,
         'is_own_profile': is_own_profile,
-        'courses': courses,
-        'not_enrolled_courses': not_enrolled_courses,
-        'teacher_courses': teacher_courses,
+        **build_profile_context(user_profile),
     })
 
 @login_required
@@ -128,29 +121,38 @@ def account_created(request):
     return render(request, 'learningapp/accountCreated.html')
 
 def course_detail_view(request, course_id):
-    """Fetches and displays the details of a specific course using an external API."""
-    api_url = f"http://127.0.0.1:8000/api/courses/details/{course_id}/"
-    response = requests.get(api_url)
-    
-    if response.status_code == 200:
-        course_data = response.json()
-    else:
-        course_data = None
+    """Fetches and displays the details of a specific course using the shared course detail service.
+
+    The details hold the first page of feedback; a `feedback_cursor` parameter shows the page after it instead.
+    """
+    course_data = get_cached_course_details(course_id)
+
+    feedback_cursor = request.GET.get('feedback_cursor')
+    if feedback_cursor:
+        try:
+            feedback_page = get_feedback_page(course_id, cursor=feedback_cursor)
+        except InvalidCursor:
+            return HttpResponseBadRequest("Invalid feedback cursor.")
+        course_data = {**course_data, 'feedback': feedback_page['results'], 'feedback_next_cursor': feedback_page['next_cursor']}
 
-    return render(request, 'learningapp/course_detail.html', {'course': course_data})
+    return render(request, 'learningapp/course_detail.html', {'course': course_data, 'feedback_cursor': feedback_cursor})
 
 @login_required
 def enrolled_students_view(request, course_id):
     """Displays the list of students enrolled in a specific course."""
-    api_url = f"http://127.0.0.1:8000/api/courses/{course_id}/students/"
-    response = requests.get(api_url, cookies=request.COOKIES)
-    
-    if response.status_code == 200:
-        students_data = response.json().get('students', [])
-    else:
-        students_data = []
+    course = get_object_or_404(Course, id=course_id)
+    roster = {'students': [], 'page': 1, 'num_pages': 1}
 
-    return render(request, 'learningapp/enrolled_students.html', {'students': students_data, 'course_id': course_id})
+    user_profile = UserProfile.objects.filter(user=request.user).first()
+    if user_profile and user_profile.role == UserProfile.TEACHER:
+        roster = get_roster_page(course.id, page=request.GET.get('page', 1))
+
+    return render(request, 'learningapp/enrolled_students.html', {
+        'students': roster['students'],
+        'page': roster['page'],
+        'num_pages': roster['num_pages'],
+        'course_id': course.id,
+    })
 
 @login_required
 def remove_student_from_course(request, course_id, student_id):
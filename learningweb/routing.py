@@ -1,11 +1,19 @@
+import os
+
 from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'learningweb.settings')
+
+# Sets Django up, so it must run before anything importing models (the chat consumers) is imported.
+django_asgi_application = get_asgi_application()
+
 from channels.routing import ProtocolTypeRouter, URLRouter 
 from channels.auth import AuthMiddlewareStack
 import chat.routing
 
 application = ProtocolTypeRouter({
     # Handle HTTP requests (Django views)
-    "http": get_asgi_application(),
+    "http": django_asgi_application,
 
     # Handle WebSocket connections
     'websocket': AuthMiddlewareStack(
@@ -13,4 +21,4 @@ application = ProtocolTypeRouter({
             chat.routing.websocket_urlpatterns
         )
     ),
-})
\ No newline at end of file
+})
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 
 load_dotenv() 
@@ -32,6 +33,8 @@ SECRET_KEY = os.getenv('SECRET_KEY', 'your-default-secret-key')
 
 DEBUG = False
 
+TESTING = (len(sys.argv) > 1 and sys.argv[1] == 'test') or 'pytest' in sys.modules
+
 ALLOWED_HOSTS = ['127.0.0.1', 'localhost', '16.171.13.176']
 
 
@@ -141,6 +144,22 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
+REDIS_URL = os.getenv('REDIS_URL', 'redis://127.0.0.1:6379')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f'{REDIS_URL}/1',
+    },
+}
+
+if TESTING:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+
 CHANNEL_LAYERS = {
     'default' : {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
@@ -150,6 +169,61 @@ CHANNEL_LAYERS = {
     },
 }
 
+if TESTING:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+
+# The last SIZE messages of each chat room, sent to every new connection without reading the database.
+CHAT_HISTORY = {
+    'BACKEND': 'chat.history.RedisHistory',
+    'LOCATION': f'{REDIS_URL}/2',
+    'SIZE': int(os.getenv('CHAT_HISTORY_SIZE', 50)),
+    # Seconds a room's history outlives its last message.
+    'TIMEOUT': 7 * 24 * 60 * 60,
+}
+
+if TESTING:
+    CHAT_HISTORY = {
+        'BACKEND': 'chat.history.MemoryHistory',
+        'SIZE': 50,
+    }
+
+# Milliseconds each chat connection collects messages for before sending them as one JSON array frame. 0 sends
+# every message in its own frame as it arrives; larger windows trade latency for fewer frames in busy rooms.
+CHAT_BATCH_WINDOW_MS = int(os.getenv('CHAT_BATCH_WINDOW_MS', 0))
+# A window's frame is sent early once it holds this many messages.
+CHAT_BATCH_MAX_MESSAGES = int(os.getenv('CHAT_BATCH_MAX_MESSAGES', 100))
+
+# Who is connected to each chat room, refreshed by every connection's heartbeat.
+CHAT_PRESENCE = {
+    'BACKEND': 'chat.presence.RedisPresence',
+    'LOCATION': f'{REDIS_URL}/2',
+    # Seconds a connection stays online after its last heartbeat.
+    'TIMEOUT': 60,
+}
+
+if TESTING:
+    CHAT_PRESENCE = {
+        'BACKEND': 'chat.presence.MemoryPresence',
+        'TIMEOUT': 60,
+    }
+
+CHAT_PRESENCE_HEARTBEAT_SECONDS = 20
+# Each room gets at most one presence event (online count, joined and left usernames) per interval.
+CHAT_PRESENCE_INTERVAL_MS = int(os.getenv('CHAT_PRESENCE_INTERVAL_MS', 2000))
+
+# Seconds a course chat room remembers whether a user may join it.
+CHAT_MEMBERSHIP_CACHE_TIMEOUT = int(os.getenv('CHAT_MEMBERSHIP_CACHE_TIMEOUT', 60))
+
+# Chat messages are saved in batches: every CHAT_FLUSH_SIZE messages or CHAT_FLUSH_INTERVAL_MS milliseconds.
+CHAT_FLUSH_SIZE = int(os.getenv('CHAT_FLUSH_SIZE', 500))
+CHAT_FLUSH_INTERVAL_MS = int(os.getenv('CHAT_FLUSH_INTERVAL_MS', 250))
+# Unsaved messages kept while the database is unavailable before the oldest are dropped.
+CHAT_MAX_PENDING_MESSAGES = int(os.getenv('CHAT_MAX_PENDING_MESSAGES', 100000))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,